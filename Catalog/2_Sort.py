@@ -9,11 +9,13 @@ Usage:
 
 import os
 import sys
-import shutil
 import json
 import time
 from pathlib import Path
 
+import clip_daemon
+import dest_names
+
 # === DEFAULT CONFIGURATION ===
 DEFAULT_CONTENT_THRESH = 0.25
 DEFAULT_NEGATIVE_THRESH = 0.22
@@ -75,6 +77,16 @@ def get_image_scores(model, processor, image_path):
         print(f"Error scanning {image_path}: {e}")
         return None
 
+def iter_scores(paths, model=None, processor=None, client=None, chunk=64):
+    """Yield (path, scores) pairs, through the daemon in chunks or one by one in-process"""
+    if client:
+        for i in range(0, len(paths), chunk):
+            batch = paths[i:i + chunk]
+            yield from zip(batch, client.score(batch))
+    else:
+        for path in paths:
+            yield path, get_image_scores(model, processor, path)
+
 def scan_thumbnails(source_root, custom_thumb_dir=None):
     """Scan thumbnails folder and map back to originals"""
     source_root = Path(source_root).resolve()
@@ -92,7 +104,9 @@ def scan_thumbnails(source_root, custom_thumb_dir=None):
             print(f"   Or: python thumbnail_generator.py {source_root} --thumb-dir {custom_thumb_dir}")
         return {}, {}
     
-    if not check_setup():
+    # A running clip_daemon.py already has the model loaded
+    client = clip_daemon.connect()
+    if not client and not check_setup():
         return {}, {}
     
     # Build mapping: thumbnail_path -> original_path
@@ -136,12 +150,15 @@ def scan_thumbnails(source_root, custom_thumb_dir=None):
         return score_data, thumb_to_orig
     
     print(f"🎯 Scanning {len(new_thumbs)} new thumbnails with AI...\n")
-    model, processor = load_model()
+    model = processor = None
+    if client:
+        print(f"🔌 Using resident model daemon at {client.address}")
+    else:
+        model, processor = load_model()
     
     count = 0
     try:
-        for thumb_path in new_thumbs:
-            scores = get_image_scores(model, processor, thumb_path)
+        for thumb_path, scores in iter_scores(new_thumbs, model, processor, client):
             if scores:
                 score_data[thumb_path] = scores
                 count += 1
@@ -184,26 +201,28 @@ def apply_thresholds(score_data, thumb_to_orig, content_thresh, neg_thresh):
     
     return keep_list, discard_list
 
-def safe_move(src, dest_folder):
-    """Move file with duplicate handling"""
+def safe_move(src, dest_folder, namer):
+    """Move file with duplicate handling (O(1) naming via a shared namer)"""
     src = Path(src)
     dest_folder = Path(dest_folder)
     
     if src.parent == dest_folder:
         return  # Already there
     
-    dest_path = dest_folder / src.name
-    counter = 1
-    
-    while dest_path.exists():
-        if src.samefile(dest_path):
-            return  # Same file
-        dest_path = dest_folder / f"{src.stem}_{counter}{src.suffix}"
-        counter += 1
+    if namer.is_taken(dest_folder, src.name):
+        try:
+            if src.samefile(dest_folder / src.name):
+                return  # Same file
+        except OSError:
+            pass
     
+    dest_path = None
     try:
-        shutil.move(str(src), str(dest_path))
+        dest_path = namer.claim(dest_folder, src.name)
+        dest_names.move_into(src, dest_path)
     except Exception as e:
+        if dest_path is not None and src.exists():
+            dest_names.discard(dest_path)  # Not moved: drop the empty placeholder
         print(f"⚠️  Move failed: {e}")
 
 def main():
@@ -288,10 +307,11 @@ def main():
                 discard_dir.mkdir(exist_ok=True)
                 
                 print("\n📦 Moving files...")
+                namer = dest_names.DestinationNamer()
                 for f in keep_files:
-                    safe_move(f, keep_dir)
+                    safe_move(f, keep_dir, namer)
                 for f in discard_files:
-                    safe_move(f, discard_dir)
+                    safe_move(f, discard_dir, namer)
                 
                 print("✅ Done! Thumbnails remain unchanged.")
                 print("💡 You can re-run this script to re-sort.")
@@ -4,18 +4,33 @@ Shows what WILL be moved without actually moving anything
 
 Usage:
     python previewer.py /path/to/thumbnails
-    python previewer.py /path/to/thumbnails --export decisions.json
+    python previewer.py /path/to/thumbnails --export decisions.jsonl.gz
+    python previewer.py /path/to/thumbnails --export decisions.json --legacy-json
+    python previewer.py /path/to/thumbnails --sheet-count 96
 """
 
 import os
 import sys
 import json
+import heapq
+import math
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import argparse
 
+import decisions_io
+import score_stats
+
 DEFAULT_CONTENT_THRESH = 0.25
 DEFAULT_NEGATIVE_THRESH = 0.22
 
+# Contact sheets
+SHEETS_DIRNAME = "_contact_sheets"
+SHEET_COLUMNS = 8
+SHEET_TILE = 192
+SHEET_PAGE_SIZE = 48          # tiles per sheet (one worker task each)
+DEFAULT_SHEET_COUNT = 48      # borderline images per side
+
 def load_scores(target_dir):
     """Load image scores database"""
     db_path = Path(target_dir) / "image_scores.json"
@@ -66,24 +81,147 @@ def show_sample(file_list, label, count=5):
     if len(file_list) > count:
         print(f"    ... and {len(file_list) - count:,} more")
 
-def export_decisions(keep_list, discard_list, output_path):
-    """Export keep/discard decisions to JSON"""
-    decisions = {
-        "keep": keep_list,
-        "discard": discard_list,
-        "stats": {
-            "keep_count": len(keep_list),
-            "discard_count": len(discard_list),
-            "total": len(keep_list) + len(discard_list)
+def decision_margin(scores, content_thresh, neg_thresh):
+    """Signed distance to the keep/discard boundary (> 0 means keep)"""
+    content = max(scores['real'], scores['cgi'])
+    return min(content - content_thresh, neg_thresh - scores['neg'])
+
+def find_borderline(score_data, content_thresh, neg_thresh, count):
+    """Return (keep_side, discard_side) lists of (margin, path) closest to the thresholds"""
+    margins = [(decision_margin(s, content_thresh, neg_thresh), p) for p, s in score_data.items()]
+    
+    # Over-fetch so deleted thumbnails can be dropped without a second pass
+    keep_side = heapq.nsmallest(count * 2, (m for m in margins if m[0] > 0))
+    discard_side = heapq.nlargest(count * 2, (m for m in margins if m[0] <= 0))
+    
+    keep_side = [m for m in keep_side if Path(m[1]).exists()][:count]
+    discard_side = [m for m in discard_side if Path(m[1]).exists()][:count]
+    return keep_side, discard_side
+
+def _render_sheet(job):
+    """Worker: compose one contact sheet JPEG from existing thumbnails"""
+    from PIL import Image, ImageDraw
+    
+    out_path, entries, title = job
+    label_h = 14
+    header_h = 20
+    rows = math.ceil(len(entries) / SHEET_COLUMNS)
+    sheet = Image.new("RGB", (SHEET_COLUMNS * SHEET_TILE, header_h + rows * (SHEET_TILE + label_h)), (24, 24, 24))
+    draw = ImageDraw.Draw(sheet)
+    draw.text((6, 4), title, fill=(255, 255, 255))
+    
+    for i, (margin, path) in enumerate(entries):
+        x = (i % SHEET_COLUMNS) * SHEET_TILE
+        y = header_h + (i // SHEET_COLUMNS) * (SHEET_TILE + label_h)
+        try:
+            with Image.open(path) as im:
+                im.draft("RGB", (SHEET_TILE, SHEET_TILE))  # JPEG: decode at reduced scale
+                im = im.convert("RGB")
+                im.thumbnail((SHEET_TILE, SHEET_TILE))
+                sheet.paste(im, (x + (SHEET_TILE - im.width) // 2, y + (SHEET_TILE - im.height) // 2))
+        except Exception:
+            draw.text((x + 6, y + 6), "unreadable", fill=(220, 80, 80))
+        draw.text((x + 4, y + SHEET_TILE), f"{margin:+.3f} {Path(path).name[:22]}", fill=(200, 200, 200))
+    
+    sheet.save(out_path, "JPEG", quality=85)
+    return str(out_path)
+
+def render_borderline_sheets(score_data, target_dir, content_thresh, neg_thresh,
+                             count=DEFAULT_SHEET_COUNT, workers=None):
+    """Render contact sheets for the images nearest the thresholds, cached by threshold pair"""
+    target_dir = Path(target_dir)
+    sheet_dir = target_dir / SHEETS_DIRNAME / f"c{content_thresh:.3f}_n{neg_thresh:.3f}"
+    manifest_path = sheet_dir / "manifest.json"
+    
+    db_path = target_dir / "image_scores.json"
+    scores_mtime = db_path.stat().st_mtime if db_path.exists() else 0
+    
+    # Cache hit: same thresholds, same score snapshot, same sample size
+    if manifest_path.exists():
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest["scores_mtime"] == scores_mtime and manifest["count"] == count \
+                    and all((sheet_dir / s).exists() for s in manifest["sheets"]):
+                print(f"♻️  Using cached contact sheets: {sheet_dir}")
+                return [sheet_dir / s for s in manifest["sheets"]]
+        except Exception:
+            pass  # Corrupted manifest → re-render
+    
+    keep_side, discard_side = find_borderline(score_data, content_thresh, neg_thresh, count)
+    if not keep_side and not discard_side:
+        print("❌ No thumbnails found near the thresholds")
+        return []
+    
+    sheet_dir.mkdir(parents=True, exist_ok=True)
+    jobs = []
+    for label, entries in (("keep", keep_side), ("discard", discard_side)):
+        pages = math.ceil(len(entries) / SHEET_PAGE_SIZE)
+        for page in range(pages):
+            chunk = entries[page * SHEET_PAGE_SIZE:(page + 1) * SHEET_PAGE_SIZE]
+            title = (f"{label.upper()} side, closest to content={content_thresh} neg={neg_thresh} "
+                     f"(page {page + 1}/{pages})")
+            jobs.append((sheet_dir / f"{label}_{page + 1:02d}.jpg", chunk, title))
+    
+    print(f"🖼️  Rendering {len(jobs)} contact sheet(s) from "
+          f"{len(keep_side) + len(discard_side):,} borderline thumbnails...")
+    workers = workers or min(len(jobs), os.cpu_count() or 4)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        sheets = [Path(p) for p in executor.map(_render_sheet, jobs)]
+    
+    with open(manifest_path, 'w') as f:
+        json.dump({
+            "content_thresh": content_thresh,
+            "neg_thresh": neg_thresh,
+            "scores_mtime": scores_mtime,
+            "count": count,
+            "sheets": [s.name for s in sheets],
+            "keep": keep_side,
+            "discard": discard_side,
+        }, f, indent=2)
+    
+    return sheets
+
+def export_decisions(keep_list, discard_list, output_path, root=None, legacy_json=False):
+    """Export keep/discard decisions (compact gzip format unless legacy_json)"""
+    if legacy_json:
+        decisions = {
+            "keep": keep_list,
+            "discard": discard_list,
+            "stats": {
+                "keep_count": len(keep_list),
+                "discard_count": len(discard_list),
+                "total": len(keep_list) + len(discard_list)
+            }
         }
-    }
+        
+        with open(output_path, 'w') as f:
+            json.dump(decisions, f, indent=2)
+    else:
+        root = root or Path(output_path).parent
+        decisions_io.write_decisions(
+            output_path, root, decisions_io.tag_items(keep_list, discard_list)
+        )
     
-    with open(output_path, 'w') as f:
-        json.dump(decisions, f, indent=2)
+    size_kb = Path(output_path).stat().st_size / 1024
+    print(f"✅ Decisions exported to: {output_path} ({size_kb:,.0f} KB)")
+
+def export_delta(keep_list, discard_list, snapshot_path, root):
+    """Export only decisions that changed since the last export"""
+    delta_path, changed = decisions_io.export_with_delta(
+        keep_list, discard_list, snapshot_path, root
+    )
     
-    print(f"✅ Decisions exported to: {output_path}")
+    if delta_path is None:
+        print(f"ℹ️  No previous export found - wrote full snapshot: {snapshot_path}")
+        return snapshot_path
+    
+    print(f"✅ {changed:,} changed decisions exported to: {delta_path}")
+    print(f"💾 Snapshot updated: {snapshot_path}")
+    return delta_path
 
-def interactive_preview(target_dir, export_path=None):
+def interactive_preview(target_dir, export_path=None, legacy_json=False,
+                        sheet_count=DEFAULT_SHEET_COUNT):
     """Interactive threshold adjustment"""
     target_dir = Path(target_dir).resolve()
     
@@ -125,8 +263,10 @@ def interactive_preview(target_dir, export_path=None):
         print("  [1] Change Content Threshold (higher = stricter)")
         print("  [2] Change Negative Threshold (lower = stricter)")
         print("  [3] Show detailed statistics")
-        print("  [4] Export decisions to JSON")
-        print("  [5] Exit")
+        print("  [4] Export decisions")
+        print("  [5] Export changes since last export (delta)")
+        print("  [6] Render borderline contact sheets")
+        print("  [7] Exit")
         
         choice = input("\nSelect option: ").strip()
         
@@ -155,28 +295,44 @@ def interactive_preview(target_dir, export_path=None):
             print("📈 DETAILED STATISTICS")
             print("="*60)
             
-            # Analyze score distributions
-            real_scores = [s['real'] for s in score_data.values()]
-            cgi_scores = [s['cgi'] for s in score_data.values()]
-            neg_scores = [s['neg'] for s in score_data.values()]
-            
-            print(f"Real scores:     min={min(real_scores):.2f} max={max(real_scores):.2f} avg={sum(real_scores)/len(real_scores):.2f}")
-            print(f"CGI scores:      min={min(cgi_scores):.2f} max={max(cgi_scores):.2f} avg={sum(cgi_scores)/len(cgi_scores):.2f}")
-            print(f"Negative scores: min={min(neg_scores):.2f} max={max(neg_scores):.2f} avg={sum(neg_scores)/len(neg_scores):.2f}")
+            try:
+                score_stats.print_stats(score_stats.compute_stats(target_dir, score_data))
+            except ImportError:
+                print("❌ Statistics need NumPy: pip install numpy")
             
             input("\nPress Enter to continue...")
         
         elif choice == '4':
             if export_path:
                 output = Path(export_path)
-            else:
+            elif legacy_json:
                 output = target_dir / "decisions.json"
+            else:
+                output = target_dir / decisions_io.DEFAULT_FILENAME
             
-            export_decisions(keep_list, discard_list, output)
+            export_decisions(keep_list, discard_list, output, target_dir, legacy_json)
             print(f"\n💡 Copy this file + thumbnails to review elsewhere")
             print(f"💡 Or use: python mover.py <originals_dir> --decisions {output}")
         
         elif choice == '5':
+            if legacy_json:
+                print("⚠️  Delta export needs the compact format (drop --legacy-json)")
+                continue
+            snapshot = Path(export_path) if export_path else target_dir / decisions_io.DEFAULT_FILENAME
+            
+            output = export_delta(keep_list, discard_list, snapshot, target_dir)
+            print(f"💡 Apply with: python mover.py <originals_dir> --decisions {output}")
+        
+        elif choice == '6':
+            try:
+                sheets = render_borderline_sheets(score_data, target_dir, c_thresh, n_thresh, sheet_count)
+            except ImportError:
+                print("❌ Contact sheets need Pillow: pip install pillow")
+                continue
+            for sheet in sheets:
+                print(f"   🖼️  {sheet}")
+        
+        elif choice == '7':
             print("\n👋 Exiting preview mode")
             break
 
@@ -193,11 +349,23 @@ def main():
     parser.add_argument(
         "--export",
         type=str,
-        help="Export decisions to JSON file"
+        help=f"Export decisions to this file (default: <folder>/{decisions_io.DEFAULT_FILENAME})"
+    )
+    parser.add_argument(
+        "--legacy-json",
+        action="store_true",
+        help="Export the old indented decisions.json instead of the compact format"
+    )
+    
+    parser.add_argument(
+        "--sheet-count",
+        type=int,
+        default=DEFAULT_SHEET_COUNT,
+        help=f"Borderline images per side in contact sheets (default: {DEFAULT_SHEET_COUNT})"
     )
     
     args = parser.parse_args()
-    interactive_preview(args.folder, args.export)
+    interactive_preview(args.folder, args.export, args.legacy_json, args.sheet_count)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -21,6 +21,8 @@ import json
 from pathlib import Path
 import argparse
 
+import clip_daemon
+
 def check_setup():
     try:
         import torch
@@ -87,11 +89,23 @@ def get_image_scores(model, processor, image_path):
         print(f"⚠️  Error scanning {image_path}: {e}")
         return None
 
+def iter_scores(paths, model=None, processor=None, client=None, chunk=64):
+    """Yield (path, scores) pairs, through the daemon in chunks or one by one in-process"""
+    if client:
+        for i in range(0, len(paths), chunk):
+            batch = paths[i:i + chunk]
+            yield from zip(batch, client.score(batch))
+    else:
+        for path in paths:
+            yield path, get_image_scores(model, processor, path)
+
 def scan_images(target_dir, force_rescan=False, skip_folders=None):
     """Scan all images and save scores to JSON"""
     target_dir = Path(target_dir).resolve()
     
-    if not check_setup():
+    # A running clip_daemon.py already has the model loaded
+    client = clip_daemon.connect()
+    if not client and not check_setup():
         return
     
     # Default folders to skip
@@ -143,16 +157,18 @@ def scan_images(target_dir, force_rescan=False, skip_folders=None):
     print(f"🎯 Scanning {len(to_scan):,} images with AI...")
     print("="*60)
     
-    # Load model and scan
-    model, processor = load_model()
+    # Load model (unless the daemon has it) and scan
+    model = processor = None
+    if client:
+        print(f"🔌 Using resident model daemon at {client.address}")
+    else:
+        model, processor = load_model()
     
     count = 0
     errors = 0
     
     try:
-        for i, img_path in enumerate(to_scan, 1):
-            scores = get_image_scores(model, processor, img_path)
-            
+        for i, (img_path, scores) in enumerate(iter_scores(to_scan, model, processor, client), 1):
             if scores:
                 score_data[str(img_path)] = scores
                 count += 1
@@ -10,22 +10,36 @@ Usage:
     # Or use pre-made decisions.json
     python mover.py /path/to/images --decisions decisions.json
     
-    # Dry run (preview without moving)
+    # Dry run (preview without moving, saves move_plan.jsonl)
     python mover.py /path/to/images --dry-run
     
     # Custom thresholds
     python mover.py /path/to/images --content-thresh 0.30 --neg-thresh 0.20
+    
+    # Apply the reviewed dry-run plan without recomputing it
+    python mover.py /path/to/images --execute-plan /path/to/images/move_plan.jsonl
+    
+    # Resume an interrupted run: just rerun the same command
+    # Revert the last run
+    python mover.py /path/to/images --undo
 """
 
 import os
 import sys
-import shutil
 import json
+import time
 from pathlib import Path
 import argparse
 
+import decisions_io
+import dest_names
+import exact_dupes
+import move_engine
+import move_journal
+
 DEFAULT_CONTENT_THRESH = 0.25
 DEFAULT_NEGATIVE_THRESH = 0.22
+SKIP_FOLDERS = {'Keep', 'Discard', 'webP-OG'}  # Output folders, never sources
 
 def load_scores_from_dir(target_dir):
     """Load image_scores.json from directory"""
@@ -45,44 +59,87 @@ def load_scores_from_dir(target_dir):
         print(f"❌ Failed to load scores: {e}")
         return None
 
-def load_decisions_json(decisions_path):
-    """Load pre-made decisions.json"""
+def load_decisions_json(decisions_path, root=None):
+    """Load pre-made decisions (compact .jsonl.gz or legacy decisions.json)"""
     try:
-        with open(decisions_path, 'r') as f:
-            data = json.load(f)
+        keep, discard, header = decisions_io.load_decisions(decisions_path, root)
         
-        keep = data.get('keep', [])
-        discard = data.get('discard', [])
+        if header.get('mode') == 'delta':
+            print(f"🔀 Delta file: only decisions changed since the previous export "
+                  f"({len(header['removed']):,} removed items are left where they are)")
         print(f"✅ Loaded decisions: {len(keep):,} keep, {len(discard):,} discard")
         return keep, discard
     except Exception as e:
         print(f"❌ Failed to load decisions: {e}")
         return None, None
 
-def map_score_to_file(score_path, target_dir):
-    """Find actual file from score path (handles path variations)"""
-    target_dir = Path(target_dir).resolve()
-    score_path = Path(score_path)
+def build_filename_index(target_dir, skip_folders=SKIP_FOLDERS):
+    """Map filename -> [full paths] for every file under target_dir in one scandir pass"""
+    index = {}
+    stack = [str(target_dir)]
+    
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in skip_folders:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        index.setdefault(entry.name, []).append(entry.path)
+        except OSError as e:
+            print(f"⚠️  Cannot read {current}: {e}")
+    
+    return index
+
+def _pick_candidate(score_path, candidates):
+    """Choose the candidate sharing the longest trailing path with score_path"""
+    score_parts = Path(score_path).parts[::-1]
+    
+    def shared_tail(candidate):
+        n = 0
+        for a, b in zip(score_parts, Path(candidate).parts[::-1]):
+            if a != b:
+                break
+            n += 1
+        return n
+    
+    ranked = sorted(((shared_tail(c), c) for c in candidates), reverse=True)
+    # Only the filename matches, or two candidates tie → refuse to guess
+    if ranked[0][0] < 2 or ranked[0][0] == ranked[1][0]:
+        return None
+    return ranked[0][1]
+
+def map_score_to_file(score_path, target_dir, name_index):
+    """Find actual file from score path (handles path variations)
     
-    # If score_path is absolute and exists, return it
-    if score_path.is_absolute() and score_path.exists():
-        return score_path
-    
-    # Try as relative path from target_dir
-    candidate = target_dir / score_path
-    if candidate.exists():
-        return candidate
-    
-    # Try just the filename in target_dir (recursive search)
-    filename = score_path.name
-    for root, dirs, files in os.walk(target_dir):
-        # Skip output folders
-        if any(skip in Path(root).parts for skip in ['Keep', 'Discard', 'webP-OG']):
-            continue
-        if filename in files:
-            return Path(root) / filename
-    
-    return None
+    Returns (path, None) on success or (None, reason) where reason is
+    "missing" or "ambiguous". All lookups go through the prebuilt index;
+    the filesystem is only touched for paths outside it.
+    """
+    score_path = Path(score_path)
+    candidates = name_index.get(score_path.name, ())
+    
+    # Exact hit: absolute path, or relative path from target_dir
+    exact = str(score_path if score_path.is_absolute() else target_dir / score_path)
+    if exact in candidates:
+        return Path(exact), None
+    
+    # Not indexed (output folder, another drive) but still there → one stat
+    if Path(exact).exists():
+        return Path(exact), None
+    
+    # Stale path: fall back to the filename
+    if len(candidates) == 1:
+        return Path(candidates[0]), None
+    if not candidates:
+        return None, "missing"
+    
+    picked = _pick_candidate(score_path, candidates)
+    if picked:
+        return Path(picked), None
+    return None, "ambiguous"
 
 def apply_thresholds(score_data, content_thresh, neg_thresh):
     """Apply thresholds to scores"""
@@ -100,39 +157,13 @@ def apply_thresholds(score_data, content_thresh, neg_thresh):
     
     return keep_list, discard_list
 
-def safe_move(src, dest_folder, dry_run=False):
-    """Move file with duplicate handling"""
-    src = Path(src)
-    dest_folder = Path(dest_folder)
-    
-    if not src.exists():
-        return False, "Source doesn't exist"
-    
-    if src.parent == dest_folder:
-        return False, "Already in target folder"
-    
-    dest_path = dest_folder / src.name
-    counter = 1
-    
-    while dest_path.exists():
-        if src.samefile(dest_path):
-            return False, "Same file already exists"
-        dest_path = dest_folder / f"{src.stem}_{counter}{src.suffix}"
-        counter += 1
-    
-    if dry_run:
-        return True, f"Would move to {dest_path}"
-    
-    try:
-        shutil.move(str(src), str(dest_path))
-        return True, "Moved"
-    except Exception as e:
-        return False, f"Error: {e}"
-
 def move_files(target_dir, decisions_path=None, 
                content_thresh=DEFAULT_CONTENT_THRESH, 
                neg_thresh=DEFAULT_NEGATIVE_THRESH,
-               dry_run=False):
+               dry_run=False,
+               workers=move_engine.RENAME_WORKERS,
+               copy_workers=move_engine.COPY_WORKERS,
+               verify_hash=False):
     """Main file moving logic"""
     
     target_dir = Path(target_dir).resolve()
@@ -145,6 +176,21 @@ def move_files(target_dir, decisions_path=None,
     if dry_run:
         print("🔍 DRY RUN MODE - No files will be moved")
     
+    # Continue an interrupted run straight from its journal
+    journal_path = target_dir / move_journal.JOURNAL_NAME
+    if not dry_run and journal_path.exists():
+        journal = move_journal.MoveJournal.load(journal_path)
+        if not journal.is_complete():
+            print(f"\n📓 Interrupted run found ({journal.header.get('created')}): "
+                  f"{len(journal.pending()):,} of {len(journal.entries):,} moves pending")
+            confirm = input("Resume it? (yes/no): ").strip().lower()
+            if confirm == 'yes':
+                results, stats = move_journal.run(
+                    journal, workers, copy_workers, verify_hash, resumed=True
+                )
+                move_journal.print_summary("RESUMED RUN COMPLETE", results, stats)
+                return
+    
     # Load decisions
     keep_paths = []
     discard_paths = []
@@ -152,7 +198,7 @@ def move_files(target_dir, decisions_path=None,
     if decisions_path:
         # Load from decisions.json
         print(f"📋 Using decisions from: {decisions_path}")
-        keep_paths, discard_paths = load_decisions_json(decisions_path)
+        keep_paths, discard_paths = load_decisions_json(decisions_path, target_dir)
         if keep_paths is None:
             return
     
@@ -172,23 +218,50 @@ def move_files(target_dir, decisions_path=None,
     # Map score paths to actual files
     print(f"\n🔗 Finding {len(keep_paths) + len(discard_paths):,} files...")
     
+    t0 = time.perf_counter()
+    name_index = build_filename_index(target_dir)
+    t_index = time.perf_counter() - t0
+    print(f"🗂️  Indexed {sum(len(v) for v in name_index.values()):,} files in {t_index:.2f}s")
+    
     keep_files = []
     discard_files = []
     not_found = []
-    
-    for score_path in keep_paths:
-        actual_file = map_score_to_file(score_path, target_dir)
-        if actual_file:
-            keep_files.append(actual_file)
+    ambiguous = []
+    collisions = []   # (score path, file another score path already resolved to)
+    seen = set()
+    
+    t0 = time.perf_counter()
+    resolved = []     # (found by filename fallback, score path, file, target list)
+    for score_paths, found in ((keep_paths, keep_files), (discard_paths, discard_files)):
+        for score_path in score_paths:
+            actual_file, reason = map_score_to_file(score_path, target_dir, name_index)
+            if actual_file:
+                direct = Path(score_path) if Path(score_path).is_absolute() else target_dir / score_path
+                resolved.append((str(actual_file) != str(direct), score_path, actual_file, found))
+            elif reason == "ambiguous":
+                ambiguous.append(score_path)
+            else:
+                not_found.append(score_path)
+    # A file is planned once; an entry naming it exactly wins over a stale
+    # path that only reached it through the filename fallback
+    resolved.sort(key=lambda r: r[0])
+    for _, score_path, actual_file, found in resolved:
+        if str(actual_file) in seen:
+            collisions.append((score_path, actual_file))
         else:
-            not_found.append(score_path)
+            seen.add(str(actual_file))
+            found.append(actual_file)
+    t_resolve = time.perf_counter() - t0
     
-    for score_path in discard_paths:
-        actual_file = map_score_to_file(score_path, target_dir)
-        if actual_file:
-            discard_files.append(actual_file)
-        else:
-            not_found.append(score_path)
+    total_paths = len(keep_paths) + len(discard_paths)
+    rate = total_paths / t_resolve if t_resolve > 0 else 0
+    print(f"⏱️  Resolved {total_paths:,} paths in {t_resolve:.2f}s ({rate:,.0f} paths/sec)")
+    
+    # Byte-identical copies (exact_duplicates.json) follow their keeper's decision
+    copies_of = exact_dupes.load_copies(target_dir)
+    if copies_of:
+        added = exact_dupes.add_copies((keep_files, discard_files), copies_of)
+        print(f"🔁 {added:,} exact copies follow their original's decision")
     
     print(f"✅ Found {len(keep_files):,} files to KEEP")
     print(f"❌ Found {len(discard_files):,} files to DISCARD")
@@ -196,6 +269,20 @@ def move_files(target_dir, decisions_path=None,
     if not_found:
         print(f"⚠️  {len(not_found):,} files not found (may have been moved/deleted)")
     
+    if ambiguous:
+        print(f"⚠️  {len(ambiguous):,} files skipped: filename matches several files, none clearly the same")
+        for path in ambiguous[:5]:
+            print(f"   • {path}")
+        if len(ambiguous) > 5:
+            print(f"   ... and {len(ambiguous) - 5:,} more")
+    
+    if collisions:
+        print(f"⚠️  {len(collisions):,} entries skipped: they resolve to a file another entry already covers")
+        for path, actual in collisions[:5]:
+            print(f"   • {path} → {actual}")
+        if len(collisions) > 5:
+            print(f"   ... and {len(collisions) - 5:,} more")
+    
     if not keep_files and not discard_files:
         print("\n❌ No files to move!")
         return
@@ -221,26 +308,37 @@ def move_files(target_dir, decisions_path=None,
         keep_dir.mkdir(exist_ok=True)
         discard_dir.mkdir(exist_ok=True)
     
-    # Move files
+    # Plan duplicate-safe destinations, then move in parallel
     print(f"\n{'🔍 SIMULATING' if dry_run else '📦 MOVING'} files...")
     
-    moved_keep = 0
-    moved_discard = 0
     errors = []
+    moves = []
+    namer = dest_names.DestinationNamer()
+    
+    for files, dest_dir in ((keep_files, keep_dir), (discard_files, discard_dir)):
+        for file in files:
+            dest, reason = move_engine.plan_destination(file, dest_dir, namer)
+            if dest:
+                moves.append((file, dest))
+            else:
+                errors.append(f"{file.name}: {reason}")
+    
+    stats = None
+    plan_path = None
+    if dry_run:
+        plan_path = target_dir / move_journal.PLAN_NAME
+        plan, missing = move_journal.write_plan(plan_path, moves, target_dir, workers)
+        moved = [Path(dest) for _, dest in plan.entries]
+        errors.extend(f"{Path(src).name}: Source doesn't exist" for src in missing)
+    else:
+        journal = move_journal.MoveJournal.create(journal_path, moves, target_dir)
+        print(f"📓 Journal: {journal.path} (rerun to resume, --undo to revert)")
+        results, stats = move_journal.run(journal, workers, copy_workers, verify_hash)
+        moved = [Path(dest) for _, dest, ok, _, _ in results if ok]
+        errors.extend(f"{Path(src).name}: {msg}" for src, _, ok, msg, _ in results if not ok)
     
-    for file in keep_files:
-        success, msg = safe_move(file, keep_dir, dry_run)
-        if success:
-            moved_keep += 1
-        else:
-            errors.append(f"{file.name}: {msg}")
-    
-    for file in discard_files:
-        success, msg = safe_move(file, discard_dir, dry_run)
-        if success:
-            moved_discard += 1
-        else:
-            errors.append(f"{file.name}: {msg}")
+    moved_keep = sum(1 for dest in moved if dest.parent == keep_dir)
+    moved_discard = len(moved) - moved_keep
     
     # Summary
     print("\n" + "="*60)
@@ -249,6 +347,9 @@ def move_files(target_dir, decisions_path=None,
     print(f"✅ Keep:    {moved_keep:,} files {'would be ' if dry_run else ''}moved")
     print(f"❌ Discard: {moved_discard:,} files {'would be ' if dry_run else ''}moved")
     
+    if stats:
+        print(f"⚡ {stats.summary()}")
+    
     if errors:
         print(f"\n⚠️  Errors/Skipped: {len(errors)}")
         for err in errors[:10]:
@@ -256,6 +357,10 @@ def move_files(target_dir, decisions_path=None,
         if len(errors) > 10:
             print(f"   ... and {len(errors)-10} more")
     
+    if plan_path:
+        print(f"\n📝 Plan saved: {plan_path}")
+        print(f"💡 Apply it without re-resolving: python mover.py {target_dir} --execute-plan {plan_path}")
+    
     if not dry_run:
         print(f"\n📂 Files moved to:")
         print(f"   {keep_dir}")
@@ -263,6 +368,72 @@ def move_files(target_dir, decisions_path=None,
     
     print("="*60)
 
+def execute_plan(target_dir, plan_path, workers=move_engine.RENAME_WORKERS,
+                 copy_workers=move_engine.COPY_WORKERS, verify_hash=False):
+    """Apply a saved dry-run plan, only re-checking that each source is unchanged"""
+    target_dir = Path(target_dir).resolve()
+    
+    try:
+        plan = move_journal.MoveJournal.load(plan_path)
+        if not plan.header.get("plan"):
+            raise ValueError("not a dry-run plan")
+    except Exception as e:
+        print(f"❌ Failed to load plan: {e}")
+        return
+    
+    print("="*60)
+    print("AI IMAGE MOVER - EXECUTE PLAN")
+    print("="*60)
+    print(f"📝 Plan: {plan_path} ({plan.header.get('created')}, {len(plan.entries):,} moves)")
+    
+    moves, changed = move_journal.verify_plan(plan, workers)
+    print(f"✅ {len(moves):,} sources unchanged")
+    if changed:
+        print(f"⚠️  {len(changed):,} sources missing or modified - skipped")
+        for src, reason in changed[:5]:
+            print(f"   • {Path(src).name}: {reason}")
+    
+    if not moves:
+        print("\n❌ No files to move!")
+        return
+    
+    confirm = input(f"Move {len(moves):,} files? (yes/no): ").strip().lower()
+    if confirm != 'yes':
+        print("❌ Aborted")
+        return
+    
+    journal = move_journal.MoveJournal.create(target_dir / move_journal.JOURNAL_NAME, moves, target_dir)
+    print(f"📓 Journal: {journal.path} (rerun to resume, --undo to revert)")
+    results, stats = move_journal.run(journal, workers, copy_workers, verify_hash)
+    move_journal.print_summary("PLAN EXECUTED", results, stats)
+
+def undo_last_run(target_dir, workers=move_engine.RENAME_WORKERS,
+                  copy_workers=move_engine.COPY_WORKERS, verify_hash=False):
+    """Move every file from the last journaled run back where it came from"""
+    journal_path = Path(target_dir).resolve() / move_journal.JOURNAL_NAME
+    
+    if not journal_path.exists():
+        print(f"❌ No move journal found: {journal_path}")
+        return
+    
+    journal = move_journal.MoveJournal.load(journal_path)
+    undoable = journal.undoable()
+    if not undoable:
+        print("✅ Nothing to undo")
+        return
+    
+    print("="*60)
+    print(f"⚠️  About to move {len(undoable):,} files back (run from {journal.header.get('created')})")
+    print("="*60)
+    confirm = input("Continue? (yes/no): ").strip().lower()
+    
+    if confirm != 'yes':
+        print("❌ Aborted")
+        return
+    
+    results, stats = move_journal.undo(journal, workers, copy_workers, verify_hash)
+    move_journal.print_summary("UNDO COMPLETE", results, stats)
+
 def main():
     parser = argparse.ArgumentParser(
         description="Move files based on AI scoring decisions"
@@ -274,7 +445,7 @@ def main():
     parser.add_argument(
         "--decisions",
         type=str,
-        help="Path to decisions.json file (optional)"
+        help="Path to decisions file, compact .jsonl.gz or legacy .json (optional)"
     )
     parser.add_argument(
         "--content-thresh",
@@ -293,15 +464,54 @@ def main():
         action="store_true",
         help="Preview what would be moved without actually moving"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=move_engine.RENAME_WORKERS,
+        help=f"Parallel renames on the same filesystem (default: {move_engine.RENAME_WORKERS})"
+    )
+    parser.add_argument(
+        "--copy-workers",
+        type=int,
+        default=move_engine.COPY_WORKERS,
+        help=f"Parallel copies for cross-device moves (default: {move_engine.COPY_WORKERS})"
+    )
+    parser.add_argument(
+        "--verify-hash",
+        action="store_true",
+        help="Checksum cross-device copies before deleting the source"
+    )
+    parser.add_argument(
+        "--execute-plan",
+        type=str,
+        metavar="PLAN",
+        help=f"Apply a plan saved by --dry-run (default name: {move_journal.PLAN_NAME})"
+    )
+    parser.add_argument(
+        "--undo",
+        action="store_true",
+        help="Move files from the last journaled run back to where they were"
+    )
     
     args = parser.parse_args()
     
+    if args.undo:
+        undo_last_run(args.folder, args.workers, args.copy_workers, args.verify_hash)
+        return
+    
+    if args.execute_plan:
+        execute_plan(args.folder, args.execute_plan, args.workers, args.copy_workers, args.verify_hash)
+        return
+    
     move_files(
         args.folder,
         args.decisions,
         args.content_thresh,
         args.neg_thresh,
-        args.dry_run
+        args.dry_run,
+        args.workers,
+        args.copy_workers,
+        args.verify_hash
     )
 
 if __name__ == "__main__":
@@ -10,17 +10,30 @@ Usage:
     # Or use pre-made decisions.json
     python mover.py /path/to/originals --decisions decisions.json
     
-    # Dry run (preview without moving)
+    # Dry run (preview without moving, saves move_plan.jsonl)
     python mover.py /path/to/originals --thumb-dir /path/to/thumbnails --dry-run
+    
+    # Apply the reviewed dry-run plan without recomputing it
+    python mover.py /path/to/originals --execute-plan /path/to/originals/move_plan.jsonl
+    
+    # Resume an interrupted run: just rerun the same command
+    # Revert the last run
+    python mover.py /path/to/originals --undo
 """
 
 import os
 import sys
-import shutil
 import json
 from pathlib import Path
 import argparse
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import decisions_io
+import dest_names
+import exact_dupes
+import move_engine
+import move_journal
+
 DEFAULT_CONTENT_THRESH = 0.25
 DEFAULT_NEGATIVE_THRESH = 0.22
 
@@ -41,14 +54,14 @@ def load_scores_from_thumbs(thumb_dir):
         print(f"❌ Failed to load scores: {e}")
         return None
 
-def load_decisions_json(decisions_path):
-    """Load pre-made decisions.json"""
+def load_decisions_json(decisions_path, root=None):
+    """Load pre-made decisions (compact .jsonl.gz or legacy decisions.json)"""
     try:
-        with open(decisions_path, 'r') as f:
-            data = json.load(f)
+        keep, discard, header = decisions_io.load_decisions(decisions_path, root)
         
-        keep = data.get('keep', [])
-        discard = data.get('discard', [])
+        if header.get('mode') == 'delta':
+            print(f"🔀 Delta file: only decisions changed since the previous export "
+                  f"({len(header['removed']):,} removed items are left where they are)")
         print(f"✅ Loaded decisions: {len(keep):,} keep, {len(discard):,} discard")
         return keep, discard
     except Exception as e:
@@ -96,39 +109,13 @@ def apply_thresholds(score_data, content_thresh, neg_thresh):
     
     return keep_list, discard_list
 
-def safe_move(src, dest_folder, dry_run=False):
-    """Move file with duplicate handling"""
-    src = Path(src)
-    dest_folder = Path(dest_folder)
-    
-    if not src.exists():
-        return False, "Source doesn't exist"
-    
-    if src.parent == dest_folder:
-        return False, "Already in target folder"
-    
-    dest_path = dest_folder / src.name
-    counter = 1
-    
-    while dest_path.exists():
-        if src.samefile(dest_path):
-            return False, "Same file already exists"
-        dest_path = dest_folder / f"{src.stem}_{counter}{src.suffix}"
-        counter += 1
-    
-    if dry_run:
-        return True, f"Would move to {dest_path}"
-    
-    try:
-        shutil.move(str(src), str(dest_path))
-        return True, "Moved"
-    except Exception as e:
-        return False, f"Error: {e}"
-
 def move_files(orig_dir, thumb_dir=None, decisions_path=None, 
                content_thresh=DEFAULT_CONTENT_THRESH, 
                neg_thresh=DEFAULT_NEGATIVE_THRESH,
-               dry_run=False):
+               dry_run=False,
+               workers=move_engine.RENAME_WORKERS,
+               copy_workers=move_engine.COPY_WORKERS,
+               verify_hash=False):
     """Main file moving logic"""
     
     orig_dir = Path(orig_dir).resolve()
@@ -141,6 +128,21 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
     if dry_run:
         print("🔍 DRY RUN MODE - No files will be moved")
     
+    # Continue an interrupted run straight from its journal
+    journal_path = orig_dir / move_journal.JOURNAL_NAME
+    if not dry_run and journal_path.exists():
+        journal = move_journal.MoveJournal.load(journal_path)
+        if not journal.is_complete():
+            print(f"\n📓 Interrupted run found ({journal.header.get('created')}): "
+                  f"{len(journal.pending()):,} of {len(journal.entries):,} moves pending")
+            confirm = input("Resume it? (yes/no): ").strip().lower()
+            if confirm == 'yes':
+                results, stats = move_journal.run(
+                    journal, workers, copy_workers, verify_hash, resumed=True
+                )
+                move_journal.print_summary("RESUMED RUN COMPLETE", results, stats)
+                return
+    
     # Load decisions
     keep_thumbs = []
     discard_thumbs = []
@@ -148,10 +150,17 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
     if decisions_path:
         # Load from decisions.json
         print(f"📋 Using decisions from: {decisions_path}")
-        keep_thumbs, discard_thumbs = load_decisions_json(decisions_path)
+        # Relative paths belong to the folder recorded at export (or --thumb-dir),
+        # not to wherever the file was saved
+        try:
+            root = Path(thumb_dir).resolve() if thumb_dir else decisions_io.decisions_root(decisions_path)
+        except Exception as e:
+            print(f"❌ Failed to load decisions: {e}")
+            return
+        keep_thumbs, discard_thumbs = load_decisions_json(decisions_path, root)
         if keep_thumbs is None:
             return
-        thumb_dir = Path(decisions_path).parent  # Assume same directory
+        thumb_dir = root
     
     elif thumb_dir:
         # Load from thumbnail scores
@@ -192,6 +201,12 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
         else:
             not_found.append(thumb_path)
     
+    # Byte-identical copies (exact_duplicates.json) follow their keeper's decision
+    copies_of = exact_dupes.load_copies(orig_dir)
+    if copies_of:
+        added = exact_dupes.add_copies((keep_originals, discard_originals), copies_of)
+        print(f"🔁 {added:,} exact copies follow their original's decision")
+    
     print(f"✅ Found {len(keep_originals):,} originals to KEEP")
     print(f"❌ Found {len(discard_originals):,} originals to DISCARD")
     
@@ -223,26 +238,37 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
         keep_dir.mkdir(exist_ok=True)
         discard_dir.mkdir(exist_ok=True)
     
-    # Move files
+    # Plan duplicate-safe destinations, then move in parallel
     print(f"\n{'🔍 SIMULATING' if dry_run else '📦 MOVING'} files...")
     
-    moved_keep = 0
-    moved_discard = 0
     errors = []
+    moves = []
+    namer = dest_names.DestinationNamer()
+    
+    for files, dest_dir in ((keep_originals, keep_dir), (discard_originals, discard_dir)):
+        for orig in files:
+            dest, reason = move_engine.plan_destination(orig, dest_dir, namer)
+            if dest:
+                moves.append((orig, dest))
+            else:
+                errors.append(f"{orig.name}: {reason}")
+    
+    stats = None
+    plan_path = None
+    if dry_run:
+        plan_path = orig_dir / move_journal.PLAN_NAME
+        plan, missing = move_journal.write_plan(plan_path, moves, orig_dir, workers)
+        moved = [Path(dest) for _, dest in plan.entries]
+        errors.extend(f"{Path(src).name}: Source doesn't exist" for src in missing)
+    else:
+        journal = move_journal.MoveJournal.create(journal_path, moves, orig_dir)
+        print(f"📓 Journal: {journal.path} (rerun to resume, --undo to revert)")
+        results, stats = move_journal.run(journal, workers, copy_workers, verify_hash)
+        moved = [Path(dest) for _, dest, ok, _, _ in results if ok]
+        errors.extend(f"{Path(src).name}: {msg}" for src, _, ok, msg, _ in results if not ok)
     
-    for orig in keep_originals:
-        success, msg = safe_move(orig, keep_dir, dry_run)
-        if success:
-            moved_keep += 1
-        else:
-            errors.append(f"{orig.name}: {msg}")
-    
-    for orig in discard_originals:
-        success, msg = safe_move(orig, discard_dir, dry_run)
-        if success:
-            moved_discard += 1
-        else:
-            errors.append(f"{orig.name}: {msg}")
+    moved_keep = sum(1 for dest in moved if dest.parent == keep_dir)
+    moved_discard = len(moved) - moved_keep
     
     # Summary
     print("\n" + "="*60)
@@ -251,6 +277,9 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
     print(f"✅ Keep:    {moved_keep:,} files {'would be ' if dry_run else ''}moved")
     print(f"❌ Discard: {moved_discard:,} files {'would be ' if dry_run else ''}moved")
     
+    if stats:
+        print(f"⚡ {stats.summary()}")
+    
     if errors:
         print(f"\n⚠️  Errors/Skipped: {len(errors)}")
         for err in errors[:10]:
@@ -258,6 +287,10 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
         if len(errors) > 10:
             print(f"   ... and {len(errors)-10} more")
     
+    if plan_path:
+        print(f"\n📝 Plan saved: {plan_path}")
+        print(f"💡 Apply it without re-resolving: python mover.py {orig_dir} --execute-plan {plan_path}")
+    
     if not dry_run:
         print(f"\n📂 Files moved to:")
         print(f"   {keep_dir}")
@@ -265,6 +298,72 @@ def move_files(orig_dir, thumb_dir=None, decisions_path=None,
     
     print("="*60)
 
+def execute_plan(orig_dir, plan_path, workers=move_engine.RENAME_WORKERS,
+                 copy_workers=move_engine.COPY_WORKERS, verify_hash=False):
+    """Apply a saved dry-run plan, only re-checking that each source is unchanged"""
+    orig_dir = Path(orig_dir).resolve()
+    
+    try:
+        plan = move_journal.MoveJournal.load(plan_path)
+        if not plan.header.get("plan"):
+            raise ValueError("not a dry-run plan")
+    except Exception as e:
+        print(f"❌ Failed to load plan: {e}")
+        return
+    
+    print("="*60)
+    print("AI IMAGE MOVER - EXECUTE PLAN")
+    print("="*60)
+    print(f"📝 Plan: {plan_path} ({plan.header.get('created')}, {len(plan.entries):,} moves)")
+    
+    moves, changed = move_journal.verify_plan(plan, workers)
+    print(f"✅ {len(moves):,} sources unchanged")
+    if changed:
+        print(f"⚠️  {len(changed):,} sources missing or modified - skipped")
+        for src, reason in changed[:5]:
+            print(f"   • {Path(src).name}: {reason}")
+    
+    if not moves:
+        print("\n❌ No files to move!")
+        return
+    
+    confirm = input(f"Move {len(moves):,} files? (yes/no): ").strip().lower()
+    if confirm != 'yes':
+        print("❌ Aborted")
+        return
+    
+    journal = move_journal.MoveJournal.create(orig_dir / move_journal.JOURNAL_NAME, moves, orig_dir)
+    print(f"📓 Journal: {journal.path} (rerun to resume, --undo to revert)")
+    results, stats = move_journal.run(journal, workers, copy_workers, verify_hash)
+    move_journal.print_summary("PLAN EXECUTED", results, stats)
+
+def undo_last_run(orig_dir, workers=move_engine.RENAME_WORKERS,
+                  copy_workers=move_engine.COPY_WORKERS, verify_hash=False):
+    """Move every file from the last journaled run back where it came from"""
+    journal_path = Path(orig_dir).resolve() / move_journal.JOURNAL_NAME
+    
+    if not journal_path.exists():
+        print(f"❌ No move journal found: {journal_path}")
+        return
+    
+    journal = move_journal.MoveJournal.load(journal_path)
+    undoable = journal.undoable()
+    if not undoable:
+        print("✅ Nothing to undo")
+        return
+    
+    print("="*60)
+    print(f"⚠️  About to move {len(undoable):,} files back (run from {journal.header.get('created')})")
+    print("="*60)
+    confirm = input("Continue? (yes/no): ").strip().lower()
+    
+    if confirm != 'yes':
+        print("❌ Aborted")
+        return
+    
+    results, stats = move_journal.undo(journal, workers, copy_workers, verify_hash)
+    move_journal.print_summary("UNDO COMPLETE", results, stats)
+
 def main():
     parser = argparse.ArgumentParser(
         description="Move original files based on AI scoring decisions"
@@ -281,7 +380,7 @@ def main():
     parser.add_argument(
         "--decisions",
         type=str,
-        help="Path to decisions.json file (alternative to --thumb-dir)"
+        help="Path to decisions file, compact .jsonl.gz or legacy .json (alternative to --thumb-dir)"
     )
     parser.add_argument(
         "--content-thresh",
@@ -300,9 +399,45 @@ def main():
         action="store_true",
         help="Preview what would be moved without actually moving"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=move_engine.RENAME_WORKERS,
+        help=f"Parallel renames on the same filesystem (default: {move_engine.RENAME_WORKERS})"
+    )
+    parser.add_argument(
+        "--copy-workers",
+        type=int,
+        default=move_engine.COPY_WORKERS,
+        help=f"Parallel copies for cross-device moves (default: {move_engine.COPY_WORKERS})"
+    )
+    parser.add_argument(
+        "--verify-hash",
+        action="store_true",
+        help="Checksum cross-device copies before deleting the source"
+    )
+    parser.add_argument(
+        "--execute-plan",
+        type=str,
+        metavar="PLAN",
+        help=f"Apply a plan saved by --dry-run (default name: {move_journal.PLAN_NAME})"
+    )
+    parser.add_argument(
+        "--undo",
+        action="store_true",
+        help="Move files from the last journaled run back to where they were"
+    )
     
     args = parser.parse_args()
     
+    if args.undo:
+        undo_last_run(args.folder, args.workers, args.copy_workers, args.verify_hash)
+        return
+    
+    if args.execute_plan:
+        execute_plan(args.folder, args.execute_plan, args.workers, args.copy_workers, args.verify_hash)
+        return
+    
     if not args.thumb_dir and not args.decisions:
         print("❌ Error: Must specify either --thumb-dir or --decisions")
         parser.print_help()
@@ -314,7 +449,10 @@ def main():
         args.decisions,
         args.content_thresh,
         args.neg_thresh,
-        args.dry_run
+        args.dry_run,
+        args.workers,
+        args.copy_workers,
+        args.verify_hash
     )
 
 if __name__ == "__main__":
@@ -21,6 +21,9 @@ import json
 from pathlib import Path
 import argparse
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import exact_dupes
+
 def check_setup():
     try:
         import torch
@@ -117,6 +120,13 @@ def scan_images(target_dir, force_rescan=False, skip_folders=None):
     
     print(f"📸 Found {len(image_paths):,} images")
     
+    # Byte-identical copies found by exact_dupes.py only need one score
+    redundant = exact_dupes.redundant_paths(target_dir)
+    if redundant:
+        before = len(image_paths)
+        image_paths = [p for p in image_paths if str(p) not in redundant]
+        print(f"🔁 Skipping {before - len(image_paths):,} exact duplicate copies")
+    
     # Load existing database
     db_path = target_dir / "image_scores.json"
     score_data = {}
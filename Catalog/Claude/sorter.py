@@ -9,11 +9,13 @@ Usage:
 
 import os
 import sys
-import shutil
 import json
 import time
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import dest_names
+
 # === DEFAULT CONFIGURATION ===
 DEFAULT_CONTENT_THRESH = 0.25
 DEFAULT_NEGATIVE_THRESH = 0.22
@@ -185,26 +187,28 @@ def apply_thresholds(score_data, thumb_to_orig, content_thresh, neg_thresh):
     
     return keep_list, discard_list
 
-def safe_move(src, dest_folder):
-    """Move file with duplicate handling"""
+def safe_move(src, dest_folder, namer):
+    """Move file with duplicate handling (O(1) naming via a shared namer)"""
     src = Path(src)
     dest_folder = Path(dest_folder)
     
     if src.parent == dest_folder:
         return  # Already there
     
-    dest_path = dest_folder / src.name
-    counter = 1
-    
-    while dest_path.exists():
-        if src.samefile(dest_path):
-            return  # Same file
-        dest_path = dest_folder / f"{src.stem}_{counter}{src.suffix}"
-        counter += 1
+    if namer.is_taken(dest_folder, src.name):
+        try:
+            if src.samefile(dest_folder / src.name):
+                return  # Same file
+        except OSError:
+            pass
     
+    dest_path = None
     try:
-        shutil.move(str(src), str(dest_path))
+        dest_path = namer.claim(dest_folder, src.name)
+        dest_names.move_into(src, dest_path)
     except Exception as e:
+        if dest_path is not None and src.exists():
+            dest_names.discard(dest_path)  # Not moved: drop the empty placeholder
         print(f"⚠️  Move failed: {e}")
 
 def main():
@@ -276,10 +280,11 @@ def main():
                 discard_dir.mkdir(exist_ok=True)
                 
                 print("\n📦 Moving files...")
+                namer = dest_names.DestinationNamer()
                 for f in keep_files:
-                    safe_move(f, keep_dir)
+                    safe_move(f, keep_dir, namer)
                 for f in discard_files:
-                    safe_move(f, discard_dir)
+                    safe_move(f, discard_dir, namer)
                 
                 print("✅ Done! Thumbnails remain unchanged.")
                 print("💡 You can re-run this script to re-sort.")
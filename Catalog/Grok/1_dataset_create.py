@@ -1,46 +1,79 @@
 """
-thumbnail_generator.py — Ultra-fast GPU thumbnail creation
+thumbnail_generator.py — Ultra-fast thumbnail creation
 Creates 512px thumbnails in parallel folder structure for CLIP processing
 while preserving originals for web gallery viewing.
 
+The default engine (thumb_engine.py) needs only Pillow: worker processes,
+JPEG draft decoding and Image.reduce before the final Lanczos pass. The old
+torch DataLoader path is still there as --engine torch; torch is only
+imported when that engine runs.
+
+--pyramid adds more sizes from the same decode, each in its own parallel
+tree next to thumbnails/ (thumbnails_224/, thumbnails_1600/ ...), given as
+SIZE[:QUALITY][:fit|crop]. crop (default) makes square centre crops like
+the main size; fit keeps the whole frame with the long side at SIZE.
+
 Usage:
     python thumbnail_generator.py /path/to/images
     python thumbnail_generator.py  # Uses current directory
+    python thumbnail_generator.py /path/to/images --engine torch
+    python thumbnail_generator.py /path/to/images --pyramid 224:90 1600:80:fit
+    python thumbnail_generator.py --benchmark  # engines on synthetic photos
 """
 
 import os
 import sys
+import time
+import tempfile
 from pathlib import Path
 from PIL import Image
-import torch
-from torch.utils.data import Dataset, DataLoader
-from torchvision import transforms
 from tqdm import tqdm
 import argparse
 
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-print(f"🚀 Running on: {device}")
-
-class ThumbnailDataset(Dataset):
-    def __init__(self, file_paths, thumb_size=512):
-        self.paths = file_paths
-        self.thumb_size = thumb_size
-        self.transform = transforms.Compose([
-            transforms.Resize(thumb_size, interpolation=transforms.InterpolationMode.LANCZOS),
-            transforms.CenterCrop(thumb_size),
-        ])
-    
-    def __len__(self):
-        return len(self.paths)
-    
-    def __getitem__(self, idx):
-        path = self.paths[idx]
-        try:
-            img = Image.open(path).convert("RGB")
-            return self.transform(img), path
-        except Exception as e:
-            print(f"⚠️  Failed to load {path}: {e}")
-            return None, path
+from thumb_engine import cores, generate, stale_jobs
+
+ENGINES = ("pil", "torch")
+VALID_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+
+
+def torch_batches(image_paths, thumb_size, batch_size):
+    """DataLoader path: yields batches of (thumbnail, path), None for failed loads"""
+    import torch
+    from torch.utils.data import Dataset, DataLoader
+    from torchvision import transforms
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    print(f"🚀 Running on: {device}")
+
+    class ThumbnailDataset(Dataset):
+        def __init__(self, file_paths, thumb_size=512):
+            self.paths = file_paths
+            self.thumb_size = thumb_size
+            self.transform = transforms.Compose([
+                transforms.Resize(thumb_size, interpolation=transforms.InterpolationMode.LANCZOS),
+                transforms.CenterCrop(thumb_size),
+            ])
+
+        def __len__(self):
+            return len(self.paths)
+
+        def __getitem__(self, idx):
+            path = self.paths[idx]
+            try:
+                img = Image.open(path).convert("RGB")
+                return self.transform(img), path
+            except Exception as e:
+                print(f"⚠️  Failed to load {path}: {e}")
+                return None, path
+
+    loader = DataLoader(
+        ThumbnailDataset(image_paths, thumb_size),
+        batch_size=batch_size,
+        num_workers=min(8, os.cpu_count() or 4),
+        pin_memory=(device.type == 'cuda'),
+        collate_fn=collate_fn  # Use custom collate to handle PIL Images
+    )
+    yield from loader
 
 
 def collate_fn(batch):
@@ -49,9 +82,10 @@ def collate_fn(batch):
 
 def process_batch(batch, source_root, thumb_root, quality=85):
     """Save thumbnails maintaining folder structure"""
-    imgs, paths = zip(*[(b[0], b[1]) for b in batch if b[0] is not None])
-    if not imgs:
+    loaded = [(b[0], b[1]) for b in batch if b[0] is not None]
+    if not loaded:
         return 0
+    imgs, paths = zip(*loaded)
     
     saved = 0
     for img, src_path in zip(imgs, paths):
@@ -65,11 +99,6 @@ def process_batch(batch, source_root, thumb_root, quality=85):
         # Create parent directories
         thumb_path.parent.mkdir(parents=True, exist_ok=True)
         
-        # Save thumbnail (skip if already exists and is newer than source)
-        if thumb_path.exists():
-            if thumb_path.stat().st_mtime > Path(src_path).stat().st_mtime:
-                continue  # Thumbnail is up to date
-        
         try:
             img.save(thumb_path, "JPEG", quality=quality, optimize=True, subsampling="4:2:0")
             saved += 1
@@ -79,10 +108,70 @@ def process_batch(batch, source_root, thumb_root, quality=85):
     return saved
 
 
-def create_thumbnails(source_dir, thumb_size=512, quality=85, batch_size=64):
-    """Main thumbnail generation function"""
+def tree_name(size, main_size):
+    """Folder next to the sources holding one pyramid level"""
+    return "thumbnails" if size == main_size else f"thumbnails_{size}"
+
+
+def parse_level(spec):
+    """"SIZE[:QUALITY][:fit|crop]" → (size, quality or None, crop)"""
+    size, quality, crop = None, None, True
+    try:
+        size, *rest = spec.split(":")
+        size = int(size)
+        for part in rest:
+            if part in ("fit", "crop"):
+                crop = part == "crop"
+            else:
+                quality = int(part)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected SIZE[:QUALITY][:fit|crop], got {spec!r}")
+    return size, quality, crop
+
+
+def run_engine(engine, jobs, source_root, thumb_root, levels=((512, 85, True),),
+               batch_size=64, workers=None, progress=True):
+    """Write the thumbnails for (src, [dest per level]) jobs with one engine; returns how many sources were done
+
+    levels are (size, quality, crop); the torch engine only makes the first,
+    into thumb_root.
+    engine "full" is the pil engine without draft/reduce (full decode, one
+    Lanczos pass) — the DataLoader's per-image work, for --benchmark.
+    """
+    if engine == "torch":
+        total_saved = 0
+        thumb_size, quality, _ = levels[0]
+        batches = torch_batches([src for src, _ in jobs], thumb_size, batch_size)
+        for batch in tqdm(batches, total=-(-len(jobs) // batch_size), desc="🎨 Creating thumbnails",
+                          unit="batch", colour="#00ff00", disable=not progress):
+            total_saved += process_batch(batch, source_root, thumb_root, quality)
+        return total_saved
+
+    results = generate(jobs, levels, workers, fast=engine != "full")
+    total_saved = 0
+    for src, status, error in tqdm(results, total=len(jobs), desc="🎨 Creating thumbnails",
+                                   unit="img", colour="#00ff00", disable=not progress):
+        if status == "saved":
+            total_saved += 1
+        elif status == "failed":
+            print(f"⚠️  Failed {src}: {error}")
+    return total_saved
+
+
+def create_thumbnails(source_dir, thumb_size=512, quality=85, batch_size=64, engine="pil", workers=None,
+                      pyramid=()):
+    """Main thumbnail generation function (pyramid: extra (size, quality, crop) levels)"""
     source_root = Path(source_dir).resolve()
     thumb_root = source_root / "thumbnails"
+    levels = [(thumb_size, quality, True)] + [(size, q or quality, crop) for size, q, crop in pyramid]
+    sizes = [size for size, _, _ in levels]
+    if len(set(sizes)) != len(sizes):
+        print("❌ Every pyramid size needs its own tree; sizes must differ")
+        return
+    if engine == "torch" and pyramid:
+        print("❌ --pyramid needs the pil engine (the DataLoader path makes one size)")
+        return
+    thumb_roots = [source_root / tree_name(size, thumb_size) for size in sizes]
     
     print("="*60)
     print("THUMBNAIL GENERATOR FOR CLIP")
@@ -91,56 +180,102 @@ def create_thumbnails(source_dir, thumb_size=512, quality=85, batch_size=64):
     print(f"📦 Output: {thumb_root}")
     print(f"🎯 Size: {thumb_size}x{thumb_size}px")
     print(f"💾 Quality: {quality}")
-    print(f"⚡ Batch: {batch_size}")
+    for size, q, crop in levels[1:]:
+        print(f"➕ {thumb_roots[sizes.index(size)].name}: {size}px {'crop' if crop else 'fit'}, quality {q}")
+    if engine == "torch":
+        print(f"⚡ Engine: torch DataLoader, batch {batch_size}")
+    else:
+        print(f"⚡ Engine: PIL, {workers or cores()} processes")
     print("="*60)
     
-    # Gather all image files
-    valid_exts = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
-    image_paths = []
-    
-    for root, dirs, files in os.walk(source_root):
-        # Skip the thumbnails folder itself
-        if 'thumbnails' in Path(root).parts:
-            continue
-        
-        for f in files:
-            if Path(f).suffix.lower() in valid_exts:
-                image_paths.append(Path(root) / f)
+    # Gather all image files and keep only those whose thumbnail is missing
+    # or older than the source (skips the thumbnails folder itself)
+    t = time.perf_counter()
+    jobs, total = stale_jobs(source_root, thumb_roots, VALID_EXTS)
     
-    if not image_paths:
+    if not total:
         print("❌ No images found!")
         return
     
-    print(f"📸 Found {len(image_paths):,} images\n")
-    
-    # Create dataset and dataloader
-    dataset = ThumbnailDataset(image_paths, thumb_size)
-    loader = DataLoader(
-        dataset, 
-        batch_size=batch_size, 
-        num_workers=min(8, os.cpu_count() or 4),
-        pin_memory=(device.type == 'cuda'),
-        collate_fn=collate_fn  # Use custom collate to handle PIL Images
-    )
+    print(f"📸 Found {total:,} images, {len(jobs):,} need thumbnails "
+          f"(scanned in {time.perf_counter() - t:.1f}s)\n")
     
-    # Process batches with progress bar
-    total_saved = 0
-    for batch in tqdm(loader, desc="🎨 Creating thumbnails", unit="batch", colour="#00ff00"):
-        saved = process_batch(batch, source_root, thumb_root, quality)
-        total_saved += saved
+    total_saved = run_engine(engine, jobs, source_root, thumb_root, levels,
+                             batch_size, workers) if jobs else 0
     
     print("\n" + "="*60)
     print("✅ COMPLETE!")
     print("="*60)
-    print(f"📊 Total images: {len(image_paths):,}")
+    print(f"📊 Total images: {total:,}")
     print(f"💾 New thumbnails: {total_saved:,}")
-    print(f"⏭️  Skipped (up-to-date): {len(image_paths) - total_saved:,}")
+    print(f"⏭️  Skipped (up-to-date): {total - len(jobs):,}")
+    if len(jobs) > total_saved:
+        print(f"⚠️  Failed: {len(jobs) - total_saved:,}")
     print(f"\n📂 Thumbnails ready at: {thumb_root}")
     print("\n💡 Next steps:")
     print(f"   python sorter.py {thumb_root}  # Run CLIP on thumbnails")
     print("="*60)
 
 
+def _synthetic_photos(folder, count):
+    """Camera-sized JPEGs (and a few PNGs) with smooth detail, for --benchmark"""
+    paths = []
+    for i in range(count):
+        if i % 10 == 9:
+            size, ext = (1600, 1200), ".png"
+        else:
+            size, ext = ((4000, 3000) if i % 3 else (2400, 3600)), ".jpg"
+        small = Image.merge("RGB", [Image.effect_noise((size[0] // 10, size[1] // 10), 60 + 10 * c)
+                                    for c in range(3)])
+        img = small.resize(size, Image.BICUBIC)
+        path = folder / f"set{i % 4}" / f"photo_{i:04}{ext}"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        img.save(path, quality=92)
+        paths.append(path)
+    return paths
+
+
+def benchmark(count=60, thumb_size=512, quality=85, batch_size=64, workers=None):
+    """PIL engine vs the DataLoader path, and a pyramid in one decode vs one run per size"""
+    runs = [("pil (draft + reduce)", "pil"), ("pil, full decode", "full")]
+    try:
+        import torch, torchvision  # noqa: F401
+        runs.append(("torch DataLoader", "torch"))
+    except ImportError:
+        print("torch/torchvision not installed → DataLoader run skipped "
+              "(\"full decode\" is its per-image work: full decode + one Lanczos pass)")
+    with tempfile.TemporaryDirectory() as tmp:
+        source_root = Path(tmp) / "source"
+        print(f"Writing {count} synthetic photos (4000x3000 / 2400x3600 JPEG, 1600x1200 PNG)...")
+        _synthetic_photos(source_root, count)
+        print(f"{thumb_size}px thumbnails, {workers or cores()} processes")
+        level = [(thumb_size, quality, True)]
+        for label, engine in runs:
+            t = time.perf_counter()
+            jobs, _ = stale_jobs(source_root, [Path(tmp) / engine], VALID_EXTS)
+            saved = run_engine(engine, jobs, source_root, Path(tmp) / engine, level,
+                               batch_size, workers, progress=False)
+            dt = time.perf_counter() - t
+            print(f"  {label:<22} {dt:7.2f}s  {saved / dt:7.1f} images/sec")
+        t = time.perf_counter()
+        jobs, _ = stale_jobs(source_root, [Path(tmp) / "pil"], VALID_EXTS)
+        print(f"  {'rerun, nothing changed':<22} {time.perf_counter() - t:7.2f}s  {len(jobs)} to redo")
+
+        levels = [(224, 90, True), (thumb_size, quality, True), (1600, 80, False)]
+        print(f"Pyramid {thumb_size} + 224 crop + 1600 fit")
+        t = time.perf_counter()
+        roots = [Path(tmp) / "pyramid" / tree_name(size, thumb_size) for size, _, _ in levels]
+        run_engine("pil", stale_jobs(source_root, roots, VALID_EXTS)[0], source_root, roots[1], levels,
+                   workers=workers, progress=False)
+        print(f"  {'one decode':<22} {time.perf_counter() - t:7.2f}s")
+        t = time.perf_counter()
+        for size, q, crop in levels:
+            root = Path(tmp) / "separate" / tree_name(size, thumb_size)
+            run_engine("pil", stale_jobs(source_root, [root], VALID_EXTS)[0], source_root, root, [(size, q, crop)],
+                       workers=workers, progress=False)
+        print(f"  {'one run per size':<22} {time.perf_counter() - t:7.2f}s")
+
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate CLIP-optimized thumbnails in parallel folder structure"
@@ -167,11 +302,40 @@ def main():
         "--batch-size",
         type=int,
         default=64,
-        help="Batch size for GPU processing (default: 64)"
+        help="Batch size for the torch engine (default: 64)"
     )
-    
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="pil",
+        help="pil: Pillow only, process pool (default); torch: the DataLoader path"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Processes for the pil engine (default: all cores)"
+    )
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="Time the engines on synthetic photos instead of processing a folder"
+    )
+    parser.add_argument(
+        "--pyramid",
+        type=parse_level,
+        nargs="+",
+        default=[],
+        metavar="SIZE[:QUALITY][:fit|crop]",
+        help="Extra sizes from the same decode, in thumbnails_<SIZE>/ (e.g. 224:90 1600:80:fit)"
+    )
+
     args = parser.parse_args()
-    create_thumbnails(args.folder, args.size, args.quality, args.batch_size)
+    if args.benchmark:
+        benchmark(thumb_size=args.size, quality=args.quality, batch_size=args.batch_size, workers=args.workers)
+        return
+    create_thumbnails(args.folder, args.size, args.quality, args.batch_size, args.engine, args.workers,
+                      args.pyramid)
 
 
 if __name__ == "__main__":
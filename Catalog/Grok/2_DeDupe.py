@@ -1,14 +1,23 @@
 # ultimate_anime_dedup_thumbs_2025.py
 # Uses your pre-made thumbnails → 500k images in <30 min on GTX 1650
 
-import os, shutil, time, random, json
+import os, sys, time, random, json
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 import numpy as np
-import faiss
+from PIL import Image
 import torch
 from torch.utils.data import Dataset, DataLoader
-import open_clip
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from manifest import OutputCollection
+from dedupe_index import cluster_labels, representatives
+from embed_cache import EmbeddingCache
+from clip_daemon import connect as connect_daemon
+from torch_runtime import pick_device, configure, prepare_model, to_device, Throughput
+from phash import collapse
+from exact_dupes import redundant_paths
 
 # ========================= CONFIG =========================
 ROOT = r"Q:\Aippealing"                                      # ← your main folder
@@ -17,15 +26,23 @@ THUMBS_DIR = Path(ROOT) / "thumbnails"                        # auto-detected
 
 MODEL_NAME = "ViT-L-14"
 PRETRAINED = "laion2B-s32B-b82K"                              # your cached god model
-DEVICE = "cuda"
+DEVICE = "auto"                                               # auto | cuda | cpu
+LOADER_WORKERS = None                                         # None = pick from cores/device
 BATCH_SIZE = 256                                              # ← now safe! thumbs are tiny
 GLOBAL_THRESHOLD = 0.965
 ARTIST_THRESHOLD = 0.955
 MAX_PER_GROUP = 4
+PHASH_PREFILTER = True                                        # collapse re-encodes/resizes before CLIP
+PHASH_DISTANCE = 6                                            # max differing bits (pHash and dHash)
+ANN_INDEX = "auto"                                            # auto | flat | ivf | ivfpq | hnsw (auto: flat, then ivfpq; ivf/hnsw keep every vector in RAM)
 MIN_PER_ARTIST = 20
+OUTPUT_MODE = "copy"                                          # copy | hardlink | symlink | manifest (list only; view with makegallery.py)
 
 OUTPUT = Path(ROOT) / "_PERFECT_2025_THUMBS"
 REPS = Path(ROOT) / "_BROWSE_THESE_ARTISTS_THUMBS"
+CACHE_DIR = Path(ROOT) / "_embed_cache"                      # shared with 3_CreateRepSample.py
+STREAM_EMBEDDINGS = True                                      # keep this run's embeddings in an on-disk memmap, not RAM
+STREAM_FILE = CACHE_DIR / "dedupe_run.f16"
 # =========================================================
 
 # Auto-switch to thumbnails if exist
@@ -37,69 +54,91 @@ else:
     image_root = Path(ROOT)
 
 print(f"Using images from: {image_root}")
-print("Loading LAION 2B CLIP (cached, instant)...")
 
-model, _, preprocess = open_clip.create_model_and_transforms(
-    MODEL_NAME, pretrained=PRETRAINED, device=DEVICE
-)
-model.eval()
+DEVICE = pick_device(DEVICE)
+LOADER_WORKERS, PIN_MEMORY, TORCH_THREADS = configure(DEVICE, LOADER_WORKERS)
+speed = Throughput()
+
+# CLIP loads on first use: never when clip_daemon.py is running or every
+# thumbnail is already in the embedding cache
+daemon = connect_daemon()
+if daemon:
+    print(f"Using resident model daemon at {daemon.address}")
+model = preprocess = None
+
+def load_model():
+    global model, preprocess
+    if model is None:
+        import open_clip
+        print("Loading LAION 2B CLIP (cached, instant)...")
+        print(f"Device: {DEVICE} ({TORCH_THREADS} torch threads, {LOADER_WORKERS} loader workers)")
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            MODEL_NAME, pretrained=PRETRAINED, device=DEVICE
+        )
+        model = prepare_model(model, DEVICE)
+    return model, preprocess
+
+cache = EmbeddingCache(CACHE_DIR, f"{MODEL_NAME}/{PRETRAINED}")
 
-# Dataset that loads from thumbnails but returns original paths for copying later
 class ThumbDataset(Dataset):
-    def __init__(self, thumb_paths, original_root):
+    def __init__(self, thumb_paths, preprocess):
         self.thumb_paths = thumb_paths
-        self.original_root = Path(original_root)
-        self.thumbs_root = THUMBS_DIR
+        self.preprocess = preprocess
     
     def __len__(self): return len(self.thumb_paths)
     
     def __getitem__(self, i):
-        thumb_path = self.thumb_paths[i]
         try:
-            img = preprocess(Image.open(thumb_path).convert("RGB"))
-            # Map back to original full-res path
-            rel = Path(thumb_path).relative_to(self.thumbs_root)
-            original_path = self.original_root / rel.with_suffix('.png').with_suffix('')  # remove .jpg, try common exts
-            for ext in ['.png', '.jpg', '.jpeg', '.webp']:
-                candidate = self.original_root / rel.with_name(rel.stem + ext)
-                if candidate.exists():
-                    original_path = str(candidate)
-                    break
-            else:
-                original_path = str(thumb_path)  # fallback
-            return img, original_path
+            return self.preprocess(Image.open(self.thumb_paths[i]).convert("RGB")), True
         except:
-            return torch.zeros(3, 224, 224), str(thumb_path)
+            return torch.zeros(3, 224, 224), False
 
-@torch.no_grad()
-def embed(thumb_paths):
-    ds = ThumbDataset(thumb_paths, ROOT)
-    dl = DataLoader(ds, batch_size=BATCH_SIZE, num_workers=8, pin_memory=True)
-    embs = []
-    original_paths = []
-    for img_batch, path_batch in tqdm(dl, desc="Embedding thumbnails", leave=False):
-        emb = model.encode_image(img_batch.to(DEVICE))
+def original_for(thumb_path):
+    """Map a thumbnail back to its full-res original (falls back to the thumbnail)"""
+    try:
+        rel = Path(thumb_path).relative_to(THUMBS_DIR)
+    except ValueError:
+        return str(thumb_path)
+    for ext in ['.png', '.jpg', '.jpeg', '.webp']:
+        candidate = Path(ROOT) / rel.with_name(rel.stem + ext)
+        if candidate.exists():
+            return str(candidate)
+    return str(thumb_path)
+
+@torch.inference_mode()
+def encode(thumb_paths):
+    """Run the model over thumbnails the cache doesn't have yet"""
+    if daemon:
+        speed.start()
+        embs, oks = daemon.embed(thumb_paths, MODEL_NAME, PRETRAINED)
+        speed.stop(len(thumb_paths))
+        return embs, oks
+    model, preprocess = load_model()
+    dl = DataLoader(ThumbDataset(thumb_paths, preprocess), batch_size=BATCH_SIZE,
+                    num_workers=LOADER_WORKERS, pin_memory=PIN_MEMORY)
+    embs, oks = [], []
+    speed.start()
+    for img_batch, ok_batch in tqdm(dl, desc="Embedding thumbnails", leave=False):
+        emb = model.encode_image(to_device(img_batch, DEVICE))
         emb /= emb.norm(dim=-1, keepdim=True)
         embs.append(emb.half().cpu().numpy())
-        original_paths.extend(path_batch)
-    return np.concatenate(embs), original_paths
+        oks.append(ok_batch.numpy())
+    speed.stop(len(thumb_paths))
+    return np.concatenate(embs), np.concatenate(oks)
+
+def embed(thumb_paths):
+    # Streamed: rows land in a float16 memmap chunk by chunk and dedup reads it
+    # back block by block, so RAM stays flat however big the collection is
+    embs = cache.embed(thumb_paths, encode, STREAM_FILE if STREAM_EMBEDDINGS else None)
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        original_paths = list(pool.map(original_for, thumb_paths))
+    return embs, original_paths
 
 def dedup(embs, paths, thresh):
-    embs = embs.astype('float32')
-    faiss.normalize_L2(embs)
-    index = faiss.IndexFlatIP(embs.shape[1])
-    index.add(embs)
-    D, I = index.search(embs, 50)
-    
-    used = set()
-    reps = []
-    for i in range(len(paths)):
-        if i in used: continue
-        cluster = [j for j in I[i] if D[i][j] >= thresh]
-        reps.extend([paths[j] for j in cluster[:MAX_PER_GROUP]])
-        used.update(cluster)
-        used.add(i)
-    return reps
+    # Every pair >= thresh joins a cluster (no neighbour cap), then keep the
+    # first MAX_PER_GROUP of each cluster
+    labels = cluster_labels(embs, thresh, index=ANN_INDEX)
+    return [paths[i] for i in representatives(labels, MAX_PER_GROUP)]
 
 def get_artist(path):
     rel = Path(path).relative_to(ROOT)
@@ -112,10 +151,23 @@ start = time.time()
 thumb_paths = [p for p in image_root.rglob("*.jpg") 
                if p.is_file() and "thumbnails" in p.parts]
 
-print(f"Found {len(len(thumb_paths):,} thumbnails → starting lightning dedup")
+print(f"Found {len(thumb_paths):,} thumbnails → starting lightning dedup")
+
+# Byte-identical copies (listed by exact_dupes.py) never need embedding
+redundant = redundant_paths(image_root)
+if redundant:
+    thumb_paths = [p for p in thumb_paths if str(p) not in redundant]
+    print(f"Skipping {len(redundant):,} exact duplicate copies")
 
-embs, original_paths = embed(thumb_paths)
-print(f"Embedded {len(original_paths)} images")
+# Cheap perceptual-hash pass first: near-identical copies never reach CLIP
+to_embed = thumb_paths
+if PHASH_PREFILTER:
+    to_embed, _ = collapse(thumb_paths, PHASH_DISTANCE)
+    print(f"Perceptual-hash prefilter → {len(thumb_paths) - len(to_embed):,} near-identical copies skipped")
+
+embs, original_paths = embed(to_embed)
+print(f"Embedded {len(original_paths)} images ({cache.hits:,} from cache, {cache.misses:,} new)")
+row_of = {p: i for i, p in enumerate(original_paths)}  # path → row in embs
 
 # Global dedup
 global_reps = dedup(embs, original_paths, GLOBAL_THRESHOLD)
@@ -129,37 +181,41 @@ for p in global_reps:
 
 print(f"\n{len(by_artist)} artists → final artist pass")
 final = []
+browse = OutputCollection(REPS, OUTPUT_MODE)
 
 for artist, imgs in tqdm(by_artist.items(), desc="Artist pass"):
     if len(imgs) <= MIN_PER_ARTIST:
         final.extend(imgs)
         continue
-    e, p = embed([Path(t).with_suffix('.jpg') if "thumbnails" in t else Path(t) for t in imgs])
-    reps = dedup(e, p, ARTIST_THRESHOLD)
+    # Same images as the global pass → slice its embeddings, no second inference
+    reps = dedup(embs[[row_of[p] for p in imgs]], imgs, ARTIST_THRESHOLD)
     if len(reps) < MIN_PER_ARTIST:
-        extra = random.sample([x for x in imgs if x not in reps], MIN_PER_ARTIST - len(reps))
+        chosen = set(reps)
+        extra = random.sample([x for x in imgs if x not in chosen], MIN_PER_ARTIST - len(reps))
         reps += extra
     final.extend(reps)
     
     # Create browse folder with originals
-    out_dir = REPS / artist
-    out_dir.mkdir(parents=True, exist_ok=True)
     for src in reps:
         try:
-            shutil.copy2(src, out_dir / Path(src).name)
+            browse.add(src, artist)
         except:
             pass  # corrupted original → skip
+browse.save()
+
+del embs  # Release the memmap so the run file can go
+if STREAM_EMBEDDINGS:
+    STREAM_FILE.unlink(missing_ok=True)
 
 # Final perfect set (original full-res files)
 OUTPUT.mkdir(exist_ok=True)
-for src in tqdm(final, desc="Copying full-res perfect set"):
-    dst = OUTPUT / Path(src).name
-    if dst.exists():
-        dst = dst.with_name(f"{dst.stem}_{random.randint(0,9999)}{dst.suffix}")
+perfect = OutputCollection(OUTPUT, OUTPUT_MODE)
+for src in tqdm(final, desc=f"Placing full-res perfect set ({OUTPUT_MODE})"):
     try:
-        shutil.copy2(src, dst)
-    except:
-        pass
+        perfect.add(src, unique=True)
+    except OSError as e:
+        print(f"⚠️  Could not place {src}: {e}")
+perfect.save()
 
 mins = (time.time() - start) / 60
 print("\n" + "="*70)
@@ -167,8 +223,11 @@ print("THUNDERDOME COMPLETE — YOUR COLLECTION IS NOW GOD-TIER")
 print("="*70)
 print(f"Thumbnails used : Yes ({len(thumb_paths):,})")
 print(f"Original images : {len(original_paths):,}")
-print(f"Perfect set     : {len(final):,} ({len(final)/len(original_paths)*100:.1f}% kept)")
+print(f"Hash duplicates : {len(thumb_paths) - len(to_embed):,} (skipped before CLIP)")
+print(f"Perfect set     : {len(final):,} ({len(final)/len(thumb_paths)*100:.1f}% kept)")
+print(f"Embedding speed : {speed.summary('daemon' if daemon else DEVICE, TORCH_THREADS)}")
 print(f"Time            : {mins:.1f} minutes")
+print(f"Output files    : {perfect.summary()}")
 print(f"Output          → {OUTPUT}")
 print(f"Browse artists  → {REPS}")
 print("\nNow open the folders in _BROWSE_THESE_ARTISTS_THUMBS and delete the artists you don't care about.")
@@ -181,5 +240,9 @@ json.dump({
     "thumbnail_count": len(thumb_paths),
     "final_count": len(final),
     "runtime_min": round(mins, 1),
+    "device": DEVICE,
+    "torch_threads": TORCH_THREADS,
+    "images_per_sec": round(speed.rate(), 1),
+    "output_mode": OUTPUT_MODE,
     "model": "LAION 2B CLIP ViT-L/14"
 }, open(OUTPUT / "summary.json", "w"), indent=2)
\ No newline at end of file
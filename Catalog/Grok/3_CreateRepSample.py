@@ -1,168 +1,352 @@
 # representative_sampler_FINAL_2025.py
 # Zero duplicates. Zero clutter. Pure enlightenment.
 
-import os, shutil, random, json, time
+import os, sys, random, json, time, hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from pathlib import Path
 from tqdm import tqdm
 import numpy as np
+from PIL import Image
 import torch
 from torch.utils.data import Dataset, DataLoader
-from sklearn.metrics.pairwise import cosine_distances
-import open_clip
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from manifest import OutputCollection, iter_files
+from embed_cache import EmbeddingCache
+from clip_daemon import connect as connect_daemon
+from torch_runtime import available_cores, pick_device, configure, prepare_model, to_device, Throughput
+from sampling import sample_batched
 
 # ========================= CONFIG =========================
 ROOT = r"D:\Anime"
-DEDUPED = Path(ROOT) / "_PERFECT_2025_THUMBS"          # your deduped full-res files
+DEDUPED = Path(ROOT) / "_PERFECT_2025_THUMBS"          # your deduped full-res files (folder or manifest)
 THUMBS = Path(ROOT) / "thumbnails"
 
 MODEL_NAME = "ViT-L-14"
 PRETRAINED = "laion2B-s32B-b82K"
-DEVICE = "cuda"
+DEVICE = "auto"                     # auto | cuda | cpu
+LOADER_WORKERS = None               # None = pick from cores/device
 BATCH_SIZE = 256
 
 # Per-artist rules
 ONE_OFF_MAX = 5                     # ≤5 images  → go to _ONE_OFFS
 SMALL_MAX   = 14                    # 6–14      → keep ALL
 MIN_REPS    = 15                    # 15–99     → at least this many
-MAX_REPS    = 50                    # 100+      → cap here
+MAX_REPS    = 50                    # 100+      → cap here (incremental runs add 1 per 8 new images on top)
+SAMPLER     = "fps"                 # fps (most distinct, outliers first) | kmeans (typical image per cluster)
 
 OUTPUT       = Path(ROOT) / "_ICONIC_REPRESENTATIVES_2025"
 ONE_OFFS     = Path(ROOT) / "_ONE_OFFS_PRECIOUS_RARE_IMAGES"
 GLOBAL_CLEAN = Path(ROOT) / "_FINAL_MASTERPIECE_COLLECTION"
+CACHE_DIR    = Path(ROOT) / "_embed_cache"          # shared with 2_DeDupe.py
+OUTPUT_MODE  = "copy"                               # copy | hardlink | symlink | manifest (list only; view with makegallery.py)
 
-for p in [OUTPUT, ONE_OFFS, GLOBAL_CLEAN]:
-    p.mkdir(exist_ok=True)
+SAMPLE_WORKERS = None               # processes running FPS (None = all cores)
+COPY_WORKERS   = 8                  # threads placing files / looking up thumbnails
+CHUNK_IMAGES   = 50_000             # thumbnails embedded per round, across artists (bounds RAM)
+INCREMENTAL    = True               # keep earlier representatives; only changed artists are re-sampled
+STATE_FILE     = CACHE_DIR / "representatives_state.json"
 # =========================================================
 
-print("Loading LAION 2B CLIP (cached)...")
-model, _, preprocess = open_clip.create_model_and_transforms(
-    MODEL_NAME, pretrained=PRETRAINED, device=DEVICE
-)
-model.eval()
+DEVICE = pick_device(DEVICE)
+LOADER_WORKERS, PIN_MEMORY, TORCH_THREADS = configure(DEVICE, LOADER_WORKERS)
+speed = Throughput()
+
+# CLIP loads on first use: never when clip_daemon.py is running or every
+# thumbnail is already in the embedding cache. daemon/cache are set in main()
+# so sampling worker processes (which import this file) stay cheap.
+daemon = cache = None
+model = preprocess = None
 
-# Global duplicate guard
-already_copied = set()
+def load_model():
+    global model, preprocess
+    if model is None:
+        import open_clip
+        print("Loading LAION 2B CLIP (cached)...")
+        print(f"Device: {DEVICE} ({TORCH_THREADS} torch threads, {LOADER_WORKERS} loader workers)")
+        model, _, preprocess = open_clip.create_model_and_transforms(
+            MODEL_NAME, pretrained=PRETRAINED, device=DEVICE
+        )
+        model = prepare_model(model, DEVICE)
+    return model, preprocess
 
 class ThumbDataset(Dataset):
     def __len__(self): return len(self.paths)
-    def __init__(self, paths): self.paths = paths
+    def __init__(self, paths, preprocess): self.paths, self.preprocess = paths, preprocess
     def __getitem__(self, i):
         try:
-            return preprocess(Image.open(self.paths[i]).convert("RGB")), str(self.paths[i])
+            return self.preprocess(Image.open(self.paths[i]).convert("RGB")), True
         except:
-            return torch.zeros(3, 224, 224), ""
+            return torch.zeros(3, 224, 224), False
 
-@torch.no_grad()
-def get_embeddings(thumb_paths):
-    if not thumb_paths: return np.array([])
-    ds = ThumbDataset(thumb_paths)
-    dl = DataLoader(ds, batch_size=BATCH_SIZE, num_workers=8, pin_memory=True)
-    embs = []
-    for img, _ in tqdm(dl, desc="Embedding", leave=False):
-        emb = model.encode_image(img.to(DEVICE))
+@torch.inference_mode()
+def encode(thumb_paths):
+    if daemon:
+        speed.start()
+        embs, oks = daemon.embed(thumb_paths, MODEL_NAME, PRETRAINED)
+        speed.stop(len(thumb_paths))
+        return embs, oks
+    model, preprocess = load_model()
+    dl = DataLoader(ThumbDataset(thumb_paths, preprocess), batch_size=BATCH_SIZE,
+                    num_workers=LOADER_WORKERS, pin_memory=PIN_MEMORY)
+    embs, oks = [], []
+    speed.start()
+    for img, ok in tqdm(dl, desc="Embedding", leave=False):
+        emb = model.encode_image(to_device(img, DEVICE))
         emb /= emb.norm(dim=-1, keepdim=True)
         embs.append(emb.half().cpu().numpy())
-    return np.concatenate(embs)
-
-def farthest_point_sampling(embs, n):
-    if len(embs) <= n: return list(range(len(embs)))
-    selected = [0]
-    dists = np.full(len(embs), np.inf)
-    for _ in range(1, n):
-        last = embs[selected[-1]]
-        cosine_dist = cosine_distances(last[None, :], embs)[0]
-        dists = np.minimum(dists, cosine_dist)
-        selected.append(int(np.argmax(dists)))
-    return selected
-
-# ======================= MAIN =======================
-start = time.time()
-
-by_artist = {}
-for p in DEDUPED.rglob("*.*"):
-    if not p.is_file(): continue
-    artist = p.relative_to(DEDUPED).parts[0]
-    by_artist.setdefault(artist, []).append(str(p))
-
-print(f"Found {len(by_artist)} artists in deduped collection")
+        oks.append(ok.numpy())
+    speed.stop(len(thumb_paths))
+    return np.concatenate(embs), np.concatenate(oks)
 
-stats = {"one_offs": 0, "small": 0, "sampled": 0, "total_images": 0}
+def get_embeddings(thumb_paths):
+    if not thumb_paths: return np.array([])
+    return cache.embed(thumb_paths, encode)
 
-for artist, full_paths in tqdm(by_artist.items(), desc="Processing artists"):
-    n = len(full_paths)
-    
-    # Find matching thumbnails
-    thumb_paths = []
+def find_thumbs(full_paths, rel_of):
+    """(thumb_paths, thumb_full) for an artist; thumb_full[i] = original of thumb_paths[i]"""
+    thumb_paths, thumb_full = [], []
     for fp in full_paths:
-        rel = Path(fp).relative_to(DEDUPED)
+        rel = rel_of[fp]
         for ext in ['.jpg', '.jpeg', '.png', '.webp']:
             cand = THUMBS / rel.parent / f"{rel.stem}{ext}"
             if cand.exists():
                 thumb_paths.append(str(cand))
+                thumb_full.append(fp)
                 break
-    
-    # Decide fate
-    if n <= ONE_OFF_MAX:
-        dest_folder = ONE_OFFS / artist
-        dest_folder.mkdir(parents=True, exist_ok=True)
-        for src in full_paths:
-            if src not in already_copied:
-                shutil.copy2(src, dest_folder / Path(src).name)
-                already_copied.add(src)
-        stats["one_offs"] += n
-        
-    elif n <= SMALL_MAX:
-        dest_folder = OUTPUT / artist
-        dest_folder.mkdir(parents=True, exist_ok=True)
-        for src in full_paths:
-            if src not in already_copied:
-                shutil.copy2(src, dest_folder / Path(src).name)
-                already_copied.add(src)
-        stats["small"] += n
-        
-    else:
-        # Diversity sampling
-        embs = get_embeddings(thumb_paths)
-        target = min(MAX_REPS, max(MIN_REPS, n // 8))   # e.g. 200 imgs → ~25 reps
-        indices = farthest_point_sampling(embs, target)
-        chosen = [full_paths[i] for i in indices]
-        
-        dest_folder = OUTPUT / artist
-        dest_folder.mkdir(parents=True, exist_ok=True)
-        for src in chosen:
-            if src not in already_copied:
-                shutil.copy2(src, dest_folder / Path(src).name)
-                already_copied.add(src)
-        stats["sampled"] += len(chosen)
-
-# Final flat masterpiece collection (no duplicates ever)
-for src in tqdm(already_copied, desc="Building final flat set"):
-    dst = GLOBAL_CLEAN / Path(src).name
-    if dst.exists():
-        stem = dst.stem
-        ext = dst.suffix
-        counter = 1
-        while (GLOBAL_CLEAN / f"{stem}_{counter}{ext}").exists():
-            counter += 1
-        dst = GLOBAL_CLEAN / f"{stem}_{counter}{ext}"
-    shutil.copy2(src, dst)
-
-mins = (time.time() - start) / 60
-print("\n" + "="*80)
-print("REPRESENTATIVE SAMPLING COMPLETE — ZERO DUPLICATES, ZERO CLUTTER")
-print("="*80)
-print(f"Artists processed          : {len(by_artist)}")
-print(f"One-offs (≤5 images)       : {stats['one_offs']:,} images  → _ONE_OFFS_PRECIOUS_RARE_IMAGES")
-print(f"Small artists (6–14)       : {stats['small']:,} images  → kept in full")
-print(f"Sampled artists (≥15)     : {stats['sampled']:,} iconic images")
-print(f"Final masterpiece set      : {len(already_copied):,} images")
-print(f"Runtime                    : {mins:.1f} minutes")
-print(f"\nMain gallery               → {OUTPUT}")
-print(f"Precious rare images       → {ONE_OFFS}")
-print(f"Final flat collection      → {GLOBAL_CLEAN}")
-print("\nYou now have three perfect folders:")
-print("   • _ICONIC_REPRESENTATIVES_2025      ← browse & decide")
-print("   • _ONE_OFFS_PRECIOUS_RARE_IMAGES    ← never lose these gems")
-print("   • _FINAL_MASTERPIECE_COLLECTION     ← your eternal gallery")
-print("\nYou have reached the end. There is nothing left to optimize.")
-print("Go forth and enjoy your flawless collection.")
\ No newline at end of file
+    return thumb_paths, thumb_full
+
+def target_reps(n):
+    return min(MAX_REPS, max(MIN_REPS, n // 8))   # e.g. 200 imgs → ~25 reps
+
+def artist_chunks(artists, sizes, limit):
+    """Consecutive runs of artists whose thumbnails add up to about `limit`"""
+    chunk, total = [], 0
+    for a in artists:
+        if chunk and total + sizes[a] > limit:
+            yield chunk
+            chunk, total = [], 0
+        chunk.append(a)
+        total += sizes[a]
+    if chunk:
+        yield chunk
+
+STATE_FORMAT = "owngallery-representatives"
+
+def artist_signature(full_paths):
+    """Changes whenever an artist gains or loses images"""
+    h = hashlib.blake2b(digest_size=16)
+    for p in sorted(full_paths):
+        h.update(p.encode("utf-8", "surrogatepass") + b"\0")
+    return h.hexdigest()
+
+def load_state():
+    """Last run's per-artist selections: {"artists": {...}, "flat": {src: name}}"""
+    empty = {"artists": {}, "flat": {}}
+    if not INCREMENTAL or not STATE_FILE.exists():
+        return empty
+    try:
+        doc = json.loads(STATE_FILE.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        print(f"⚠️  Could not read {STATE_FILE}, sampling every artist from scratch")
+        return empty
+    if doc.get("format") != STATE_FORMAT or doc.get("model") != f"{MODEL_NAME}/{PRETRAINED}":
+        return empty
+    return doc
+
+def save_state(artists, flat):
+    doc = {
+        "format": STATE_FORMAT,
+        "version": 1,
+        "model": f"{MODEL_NAME}/{PRETRAINED}",
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "artists": artists,   # artist -> {"signature", "images", "sampler", "kept": [originals]}
+        "flat": flat,         # original -> its name in GLOBAL_CLEAN
+    }
+    tmp = STATE_FILE.with_name(STATE_FILE.name + ".tmp")
+    tmp.write_text(json.dumps(doc, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, STATE_FILE)
+
+class _Done:
+    """Future-alike for work run inline (single-core runs skip the process pool)"""
+    def __init__(self, value): self._value = value
+    def result(self): return self._value
+
+# ======================= MAIN =======================
+def main():
+    global daemon, cache
+    start = time.time()
+    for p in [OUTPUT, ONE_OFFS, GLOBAL_CLEAN]:
+        p.mkdir(exist_ok=True)
+    daemon = connect_daemon()
+    if daemon:
+        print(f"Using resident model daemon at {daemon.address}")
+    cache = EmbeddingCache(CACHE_DIR, f"{MODEL_NAME}/{PRETRAINED}")
+
+    by_artist = {}
+    rel_of = {}   # file → its path inside DEDUPED (the file itself lives elsewhere for a manifest)
+    for rel, p in iter_files(DEDUPED):
+        if not rel.suffix: continue
+        artist = rel.parts[0]
+        by_artist.setdefault(artist, []).append(str(p))
+        rel_of[str(p)] = rel
+
+    print(f"Found {len(by_artist)} artists in deduped collection")
+
+    stats = {"one_offs": 0, "small": 0, "sampled": 0, "total_images": 0, "reused": 0}
+
+    # Incremental runs: artists whose image set is unchanged keep last run's
+    # representatives as they are; changed artists are extended from them
+    state = load_state()
+    prev = state["artists"]
+    artists_state = {}
+
+    # Global duplicate guard: only this thread reads/writes it, before a
+    # file is handed to the copy pool, so each original is placed once
+    already_copied = set()
+    reps_out = OutputCollection(OUTPUT, OUTPUT_MODE)
+    one_offs_out = OutputCollection(ONE_OFFS, OUTPUT_MODE)
+
+    workers = SAMPLE_WORKERS or available_cores()
+    cpu_pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+
+    def run_sampler(groups, counts, seeds):
+        if cpu_pool is None:
+            return _Done(sample_batched(groups, counts, SAMPLER, seeds))
+        return cpu_pool.submit(sample_batched, groups, counts, SAMPLER, seeds)
+
+    with ThreadPoolExecutor(max_workers=COPY_WORKERS) as io_pool:
+        placing = []
+
+        def place(collection, artist, srcs):
+            for src in srcs:
+                if src not in already_copied:
+                    already_copied.add(src)
+                    placing.append(io_pool.submit(collection.add, src, artist, keep_existing=INCREMENTAL))
+
+        # Decide fate: small and unchanged artists need no compute at all
+        sampled = []
+        signature = {}
+        for artist, full_paths in by_artist.items():
+            n = len(full_paths)
+            signature[artist] = sig = artist_signature(full_paths)
+            old = prev.get(artist)
+            if n <= ONE_OFF_MAX:
+                place(one_offs_out, artist, full_paths)
+                stats["one_offs"] += n
+                artists_state[artist] = {"signature": sig, "images": n, "kept": full_paths}
+            elif n <= SMALL_MAX:
+                place(reps_out, artist, full_paths)
+                stats["small"] += n
+                artists_state[artist] = {"signature": sig, "images": n, "kept": full_paths}
+            elif old and old["signature"] == sig and old.get("sampler") == SAMPLER:
+                place(reps_out, artist, old["kept"])
+                stats["sampled"] += len(old["kept"])
+                stats["reused"] += 1
+                artists_state[artist] = old
+            else:
+                sampled.append(artist)
+
+        # Diversity sampling. Thumbnail lookups are stat calls → thread pool
+        thumbs = dict(zip(sampled, io_pool.map(lambda a: find_thumbs(by_artist[a], rel_of), sampled)))
+        sizes = {a: len(thumbs[a][0]) for a in sampled}
+        progress = tqdm(total=len(sampled), desc="Sampling artists")
+
+        def seed_rows(artist):
+            """Rows of last run's representatives that are still there"""
+            old = prev.get(artist)
+            if not old or old.get("sampler") not in (None, SAMPLER):
+                return []
+            kept = set(old["kept"])
+            return [i for i, fp in enumerate(thumbs[artist][1]) if fp in kept]
+
+        def rep_count(artist, seeds):
+            """target_reps() for a fresh artist. A seeded one also gains a rep
+            per 8 images added since last run, so growth past the target (or
+            MAX_REPS) still brings in new representatives"""
+            n = len(by_artist[artist])
+            if not seeds:
+                return target_reps(n)
+            added = max(0, n - prev[artist].get("images", n))
+            return max(target_reps(n), len(seeds) + -(-added // 8))
+
+        def collect(parts, jobs):
+            for part, job in zip(parts, jobs):
+                for artist, indices in zip(part, job.result()):
+                    chosen = [thumbs[artist][1][i] for i in indices]
+                    place(reps_out, artist, chosen)
+                    stats["sampled"] += len(chosen)
+                    artists_state[artist] = {"signature": signature[artist], "images": len(by_artist[artist]),
+                                             "sampler": SAMPLER, "kept": chosen}
+                progress.update(len(part))
+
+        try:
+            pending = None
+            for chunk in artist_chunks(sampled, sizes, CHUNK_IMAGES):
+                # One embedding call for the whole chunk → full model batches
+                embs = get_embeddings([t for a in chunk for t in thumbs[a][0]])
+                bounds = np.cumsum([0] + [sizes[a] for a in chunk])
+                groups = {a: embs[bounds[k]:bounds[k + 1]] for k, a in enumerate(chunk)}
+
+                # Sampling in worker processes, artists dealt round-robin;
+                # the next chunk embeds while these run
+                parts = [p for p in (chunk[w::workers] for w in range(workers)) if p]
+                seeds = {a: seed_rows(a) for a in chunk}
+                jobs = [run_sampler([groups[a] for a in part], [rep_count(a, seeds[a]) for a in part],
+                                    [seeds[a] for a in part])
+                        for part in parts]
+                if pending:
+                    collect(*pending)
+                pending = (parts, jobs)
+            if pending:
+                collect(*pending)
+        finally:
+            progress.close()
+            if cpu_pool:
+                cpu_pool.shutdown()
+
+        for job in tqdm(placing, desc=f"Placing files ({OUTPUT_MODE})", leave=False):
+            job.result()
+
+        # Final flat masterpiece collection (no duplicates ever). Files from
+        # the last run keep their names first, so new ones can't take them
+        global_out = OutputCollection(GLOBAL_CLEAN, OUTPUT_MODE)
+        named = [src for src in already_copied if src in state["flat"]]
+        fresh = [src for src in already_copied if src not in state["flat"]]
+        flat = dict(zip(named, io_pool.map(
+            lambda src: global_out.add(src, name=state["flat"][src], keep_existing=True).name, named)))
+        flat.update(zip(fresh, tqdm(io_pool.map(lambda src: global_out.add(src, unique=True).name, fresh),
+                                    total=len(fresh), desc=f"Building final flat set ({OUTPUT_MODE})")))
+    # Picks that dropped out of the selection leave the output folders too
+    for collection in (reps_out, one_offs_out, global_out):
+        collection.prune()
+        collection.save()
+    if INCREMENTAL:
+        save_state(artists_state, flat)
+
+    mins = (time.time() - start) / 60
+    print("\n" + "="*80)
+    print("REPRESENTATIVE SAMPLING COMPLETE — ZERO DUPLICATES, ZERO CLUTTER")
+    print("="*80)
+    print(f"Artists processed          : {len(by_artist)}")
+    print(f"One-offs (≤5 images)       : {stats['one_offs']:,} images  → _ONE_OFFS_PRECIOUS_RARE_IMAGES")
+    print(f"Small artists (6–14)       : {stats['small']:,} images  → kept in full")
+    print(f"Sampled artists (≥15)     : {stats['sampled']:,} iconic images ({SAMPLER})")
+    print(f"Unchanged artists          : {stats['reused']:,} (kept last run's picks, nothing embedded)")
+    print(f"Final masterpiece set      : {len(already_copied):,} images")
+    print(f"Final set files            : {global_out.summary()}")
+    print(f"Embeddings                 : {cache.hits:,} from cache, {cache.misses:,} new")
+    print(f"Embedding speed            : {speed.summary('daemon' if daemon else DEVICE, TORCH_THREADS)}")
+    print(f"Runtime                    : {mins:.1f} minutes")
+    print(f"\nMain gallery               → {OUTPUT}")
+    print(f"Precious rare images       → {ONE_OFFS}")
+    print(f"Final flat collection      → {GLOBAL_CLEAN}")
+    print("\nYou now have three perfect folders:")
+    print("   • _ICONIC_REPRESENTATIVES_2025      ← browse & decide")
+    print("   • _ONE_OFFS_PRECIOUS_RARE_IMAGES    ← never lose these gems")
+    print("   • _FINAL_MASTERPIECE_COLLECTION     ← your eternal gallery")
+    print("\nYou have reached the end. There is nothing left to optimize.")
+    print("Go forth and enjoy your flawless collection.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+# dedupe_index.py
+# Threshold-based near-duplicate clustering for CLIP embeddings.
+#
+# Every pair with cosine similarity >= threshold is found (faiss range_search
+# when available, otherwise a blocked NumPy matrix product) and joined with a
+# vectorized union-find, so clusters of any size come out whole. Work is done
+# one query block at a time and rows are normalized per block, so the
+# embeddings can stay in a float16 np.memmap on disk and only a few blocks
+# are ever in RAM besides the faiss index.
+#
+# Past FLAT_MAX images the search switches to an approximate IVF-PQ index
+# sized from the collection; IVF-Flat and HNSW can be picked by hand. What
+# stays in RAM (768-d, besides the blocks):
+#   flat       4*dim bytes per image, ~300 MB at FLAT_MAX
+#   ivfpq      ~dim/4 + 8 bytes per image (PQ code + id), ~200 MB per 1M
+#              images, plus a training sample of at most TRAIN_MAX rows
+#              (~300 MB) while the index is built. Training is a one-off
+#              cost that doesn't grow past TRAIN_MAX (~90 s for 10k rows
+#              on one core); recall stays ~0.998 (see --benchmark)
+#   ivf, hnsw  the full float32 vectors (3+ KB per image, ~12 GB at 4M)
+# plus 16 bytes per image for union-find and labels. Only IVF-PQ keeps the
+# index far below the size of the collection.
+#
+#   python dedupe_index.py --selftest      # synthetic embeddings, known clusters
+#   python dedupe_index.py --benchmark     # ANN recall/speed vs exact search
+
+import sys
+import time
+import argparse
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+BLOCK = 4096          # query rows per search block
+
+# Approximate index settings (faiss only); see index_params()
+FLAT_MAX = 100_000        # exact search up to this many images
+IVF_NPROBE = 16           # lists probed per query (more = better recall, slower)
+TRAIN_PER_LIST = 64       # IVF training sample per list
+TRAIN_MAX = 100_000       # cap on the training sample (float32 in RAM while training)
+PQ_SLACK = 0.10           # extra similarity margin searched before exact re-check
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 128
+HNSW_K = 64               # neighbours per query (HNSW has no range search)
+BENCH_SAMPLE = 20_000     # vectors in the recall benchmark
+
+def normalize(embs):
+    """float32 copy with unit-length rows"""
+    x = np.array(embs, dtype=np.float32)
+    x /= np.maximum(np.linalg.norm(x, axis=1, keepdims=True), 1e-12)
+    return x
+
+# ---------------------------------------------------------------- union-find
+def _compress(parent):
+    """Point every element straight at its root (pointer jumping, in place)
+
+    Each pass halves the depth of every chain, so a chain of n costs log2(n)
+    passes instead of n hops per lookup.
+    """
+    while True:
+        grand = parent[parent]
+        if np.array_equal(grand, parent):
+            return
+        parent[:] = grand
+
+def _roots(parent, x):
+    """Follow parent pointers for every element of x until they reach a root"""
+    r = parent[x]
+    while True:
+        rr = parent[r]
+        if np.array_equal(rr, r):
+            return r
+        r = rr
+
+def union_edges(parent, a, b):
+    """Merge the sets containing a[k] and b[k] for every k (in place)"""
+    while len(a):
+        ra, rb = _roots(parent, a), _roots(parent, b)
+        todo = ra != rb
+        if not todo.any():
+            return
+        a, b, ra, rb = a[todo], b[todo], ra[todo], rb[todo]
+        # Always hang the larger root under the smaller one; repeat for
+        # edges whose root got linked elsewhere in the same round
+        np.minimum.at(parent, np.maximum(ra, rb), np.minimum(ra, rb))
+        _compress(parent)
+
+def labels_from_parent(parent):
+    """Root id for every element"""
+    _compress(parent)
+    return parent.copy()
+
+# ------------------------------------------------------------ pair searching
+def _pairs_numpy(x, thresh, block):
+    """Yield (i, j) arrays with j > i and x[i]·x[j] >= thresh, tile by tile"""
+    n = len(x)
+    for i0 in range(0, n, block):
+        xi = normalize(x[i0:i0 + block])
+        for j0 in range(i0, n, block):
+            sims = xi @ (xi if j0 == i0 else normalize(x[j0:j0 + block])).T
+            if j0 == i0:
+                sims[np.tril_indices(len(xi))] = -1  # Diagonal tile: keep j > i only
+            r, c = np.nonzero(sims >= thresh)
+            if len(r):
+                yield r + i0, c + j0
+
+def index_params(n, dim, kind="auto"):
+    """Index settings for a collection of n vectors
+
+    auto: exact flat index up to FLAT_MAX, IVF-PQ beyond that, so the index
+    holds ~dim/4 bytes per vector rather than the 4*dim of IVF-Flat/HNSW.
+    """
+    if kind == "auto":
+        kind = "flat" if n <= FLAT_MAX else "ivfpq"
+    params = {"kind": kind}
+    if kind in ("ivf", "ivfpq"):
+        # faiss wants ~39 training points per list
+        nlist = max(1, min(int(4 * np.sqrt(n)), n // 39, TRAIN_MAX // 39))
+        params.update(nlist=nlist, nprobe=min(nlist, max(IVF_NPROBE, nlist // 256)))
+        if kind == "ivfpq":
+            m = next(m for m in range(dim // 4, 0, -1) if dim % m == 0)  # 4 dims per byte
+            params.update(m=m, nbits=8)
+    elif kind == "hnsw":
+        params.update(M=HNSW_M, ef_construction=HNSW_EF_CONSTRUCTION,
+                      ef_search=HNSW_EF_SEARCH, k=HNSW_K)
+    elif kind != "flat":
+        raise ValueError(f"Unknown index kind: {kind}")
+    return params
+
+def build_index(x, params, block=BLOCK):
+    """faiss inner-product index over the rows of x, added block by block"""
+    d = x.shape[1]
+    kind = params["kind"]
+    if kind == "flat":
+        index = faiss.IndexFlatIP(d)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["M"], faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params["ef_construction"]
+        index.hnsw.efSearch = params["ef_search"]
+    else:
+        quantizer = faiss.IndexFlatIP(d)
+        if kind == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, d, params["nlist"], faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFPQ(quantizer, d, params["nlist"], params["m"], params["nbits"],
+                                     faiss.METRIC_INNER_PRODUCT)
+        train_n = min(len(x), TRAIN_MAX, max(params["nlist"] * TRAIN_PER_LIST, 10_000))  # PQ codebooks need ~10k
+        sample = np.random.default_rng(0).choice(len(x), train_n, replace=False)
+        index.train(normalize(x[np.sort(sample)]))
+        index.nprobe = params["nprobe"]
+    for i0 in range(0, len(x), block):
+        index.add(normalize(x[i0:i0 + block]))
+    return index
+
+def _pairs_faiss(x, thresh, block, params):
+    """Yield (i, j) arrays from a faiss index, one query block at a time
+
+    Flat/IVF indexes use range_search; HNSW has no range search, so it takes
+    the k nearest neighbours and keeps those above the threshold. Candidates
+    from approximate indexes are re-checked with exact dot products.
+    """
+    index = build_index(x, params, block)
+    kind = params["kind"]
+    exact = kind in ("flat", "ivf")
+    # PQ distances are approximate: search a little wider, then verify
+    radius = float(thresh) - (PQ_SLACK if kind == "ivfpq" else 1e-6)
+    for i0 in range(0, len(x), block):
+        q = normalize(x[i0:i0 + block])
+        if kind == "hnsw":
+            sims, ids = index.search(q, min(params["k"], len(x)))
+            rows = np.repeat(np.arange(i0, i0 + len(q)), ids.shape[1])
+            ids = ids.ravel()
+            keep = (ids > rows) & (sims.ravel() >= radius)
+        else:
+            lims, _, ids = index.range_search(q, radius)
+            rows = np.repeat(np.arange(i0, i0 + len(lims) - 1), np.diff(lims.astype(np.int64)))
+            keep = ids > rows
+        a, b = rows[keep], ids[keep].astype(np.int64)
+        if not exact and len(a):
+            ok = np.einsum("ij,ij->i", normalize(x[a]), normalize(x[b])) >= thresh
+            a, b = a[ok], b[ok]
+        if len(a):
+            yield a, b
+
+def find_pairs(x, thresh, block=BLOCK, backend="auto", index="auto"):
+    """Generator of (i, j) arrays for every pair with cosine similarity >= thresh
+
+    x can be any array-like of rows (e.g. a float16 np.memmap); it is read and
+    normalized one block at a time.
+
+    backend: "faiss", "numpy" (always exact) or "auto" (faiss when installed).
+    index: "auto", "flat", "ivf", "ivfpq" or "hnsw" (faiss only).
+    """
+    if backend == "auto":
+        backend = "faiss" if faiss is not None else "numpy"
+    if backend == "numpy":
+        return _pairs_numpy(x, thresh, block)
+    return _pairs_faiss(x, thresh, block, index_params(len(x), x.shape[1], index))
+
+def cluster_labels(embs, thresh, block=BLOCK, backend="auto", index="auto"):
+    """Connected components of the 'similarity >= thresh' graph
+
+    Returns an int64 array where items in the same cluster share a label
+    (the smallest index in that cluster).
+    """
+    parent = np.arange(len(embs), dtype=np.int64)
+    for a, b in find_pairs(embs, thresh, block, backend, index):
+        union_edges(parent, a, b)
+    return labels_from_parent(parent)
+
+def representatives(labels, max_per_group):
+    """Indices to keep: the first max_per_group members (by index) of each cluster"""
+    order = np.argsort(labels, kind="stable")
+    sorted_labels = labels[order]
+    starts = np.r_[0, np.flatnonzero(np.diff(sorted_labels)) + 1]
+    rank = np.arange(len(order)) - np.repeat(starts, np.diff(np.r_[starts, len(order)]))
+    return np.sort(order[rank < max_per_group])
+
+def cluster_sizes(labels):
+    _, counts = np.unique(labels, return_counts=True)
+    return counts
+
+# ------------------------------------------------------------------ selftest
+def _synthetic(sizes, dim=64, noise=0.02, seed=0):
+    """Embeddings with known clusters: tight noise around random centers"""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.normal(size=(len(sizes), dim)))
+    x = np.concatenate([c + noise * rng.normal(size=(s, dim)) for c, s in zip(centers, sizes)])
+    truth = np.repeat(np.arange(len(sizes)), sizes)
+    perm = rng.permutation(len(x))
+    return x[perm].astype(np.float16), truth[perm]
+
+def _same_partition(labels, truth):
+    """True if labels and truth group the items identically"""
+    pairs = set(zip(labels.tolist(), truth.tolist()))
+    return len(pairs) == len(set(labels.tolist())) == len(set(truth.tolist()))
+
+def selftest():
+    # Includes clusters far larger than the old k=50 neighbour cap
+    sizes = [1, 1, 2, 3, 7, 49, 50, 51, 200, 777] + [1] * 300
+    embs, truth = _synthetic(sizes)
+    backends = ["numpy"] + (["faiss"] if faiss is not None else [])
+    ok = True
+    for backend in backends:
+        for block in (BLOCK, 97):  # 97 forces many cross-block tiles
+            t = time.perf_counter()
+            labels = cluster_labels(embs, 0.95, block=block, backend=backend)
+            good = _same_partition(labels, truth)
+            ok &= good
+            print(f"{backend:6} block={block:<5} clusters={len(set(labels.tolist())):4} "
+                  f"largest={cluster_sizes(labels).max():4}  "
+                  f"{'PASS' if good else 'FAIL'}  ({time.perf_counter() - t:.2f}s)")
+
+    # Same search straight off a float16 memmap, as 2_DeDupe.py streams it
+    import os, tempfile
+    fd, mm_path = tempfile.mkstemp(suffix=".f16")
+    os.close(fd)
+    mm = np.memmap(mm_path, dtype=np.float16, mode="w+", shape=embs.shape)
+    mm[:] = embs
+    mm.flush()
+    for backend in backends:
+        good = _same_partition(cluster_labels(mm, 0.95, block=97, backend=backend), truth)
+        ok &= good
+        print(f"{backend:6} memmap input                      {'PASS' if good else 'FAIL'}")
+    del mm
+    os.remove(mm_path)
+
+    labels = cluster_labels(embs, 0.95, backend="numpy")
+    reps = representatives(labels, 4)
+    expected = sum(min(s, 4) for s in sizes)
+    good = len(reps) == expected
+    ok &= good
+    print(f"representatives (max 4/cluster): {len(reps)} of {expected} expected  {'PASS' if good else 'FAIL'}")
+
+    # A chain-shaped cluster used to cost O(n * depth) in root lookups
+    n = 200_000
+    t = time.perf_counter()
+    parent = np.arange(n)
+    union_edges(parent, np.arange(1, n), np.arange(n - 1))
+    good = not labels_from_parent(parent).any()
+    ok &= good
+    print(f"union-find chain of {n:,}: one cluster  {'PASS' if good else 'FAIL'}  "
+          f"({time.perf_counter() - t:.2f}s)")
+    return ok
+
+# ----------------------------------------------------------------- benchmark
+def _pair_keys(pairs, n):
+    keys = [a * n + b for a, b in pairs]
+    return np.unique(np.concatenate(keys)) if keys else np.empty(0, np.int64)
+
+def benchmark(embs=None, sample=BENCH_SAMPLE, thresh=0.965, kinds=("ivf", "ivfpq", "hnsw")):
+    """Pair recall and speed of each approximate index against exact search"""
+    if faiss is None:
+        print("faiss is not installed; only exact NumPy search is available")
+        return
+    if embs is None:
+        rng = np.random.default_rng(1)
+        sizes = np.minimum(rng.geometric(0.3, size=sample), 200)
+        sizes = sizes[np.cumsum(sizes) <= sample]
+        embs, _ = _synthetic(sizes.tolist(), dim=768, noise=0.005)
+    elif len(embs) > sample:
+        pick = np.random.default_rng(0).choice(len(embs), sample, replace=False)
+        embs = embs[np.sort(pick)]
+    x = normalize(embs)
+    n = len(x)
+    print(f"{n:,} vectors, dim {x.shape[1]}, threshold {thresh}")
+
+    t = time.perf_counter()
+    truth = _pair_keys(_pairs_faiss(x, thresh, BLOCK, {"kind": "flat"}), n)
+    exact_time = time.perf_counter() - t
+    print(f"{'exact':6} pairs={len(truth):9,}  recall=1.0000  {exact_time:7.2f}s")
+
+    for kind in kinds:
+        # Same settings index_params() would pick, as if this sample were
+        # the size that switches to this index kind
+        params = index_params(n, x.shape[1], kind)
+        t = time.perf_counter()
+        found = _pair_keys(_pairs_faiss(x, thresh, BLOCK, params), n)
+        secs = time.perf_counter() - t
+        recall = len(np.intersect1d(found, truth, assume_unique=True)) / max(len(truth), 1)
+        shown = {k: v for k, v in params.items() if k != "kind"}
+        print(f"{kind:6} pairs={len(found):9,}  recall={recall:.4f}  {secs:7.2f}s  "
+              f"({exact_time / max(secs, 1e-9):.1f}x)  {shown}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Near-duplicate clustering helpers")
+    parser.add_argument("--selftest", action="store_true", help="Run the synthetic-cluster check")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Recall/speed of approximate indexes vs exact search")
+    parser.add_argument("--embeddings", help="Benchmark on a saved .npy embedding matrix "
+                                             "instead of synthetic data")
+    parser.add_argument("--sample", type=int, default=BENCH_SAMPLE,
+                        help=f"Vectors to benchmark on (default: {BENCH_SAMPLE:,})")
+    parser.add_argument("--threshold", type=float, default=0.965)
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    if args.benchmark:
+        embs = np.load(args.embeddings, mmap_mode="r") if args.embeddings else None
+        benchmark(embs, args.sample, args.threshold)
+        sys.exit(0)
+    parser.print_help()
@@ -0,0 +1,233 @@
+# embed_cache.py
+# Persistent CLIP embedding cache shared by 2_DeDupe.py and 3_CreateRepSample.py.
+#
+# One folder per model:
+#   <cache>/<model>/meta.json        {"model": ..., "dim": 768, "dtype": "float16"}
+#   <cache>/<model>/embeddings.f16   rows of float16, appended, read via np.memmap
+#   <cache>/<model>/index.jsonl      [path, row, size, mtime_ns] per line, appended
+#
+# A path is a hit when its size and mtime match the index; anything new or
+# changed goes through the model ENCODE_CHUNK images at a time and is appended
+# as it comes out. Rows are written before their index lines, so a crash
+# leaves at worst unreferenced rows plus a partial row or index line (and
+# never loses finished chunks). On open, the matrix is cut back to whole rows
+# (so appended rows stay at the offsets the index gives them), unreadable
+# index lines are skipped, and a torn last line is cut back to the previous
+# newline before anything new is appended.
+#
+# One process at a time: opening a cache takes an OS lock on
+# <cache>/<model>/.lock (released when the process exits), so running
+# 2_DeDupe.py and 3_CreateRepSample.py together stops the second one with a
+# clear error instead of letting both append rows at the same offsets.
+#
+# embed(..., out_path=...) streams the result into a float16 np.memmap
+# instead of RAM, so a run over millions of images stays at a few chunks of
+# memory; dedupe_index reads it back block by block.
+
+import os
+import re
+import json
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+STAT_WORKERS = 16
+ENCODE_CHUNK = 16_384         # images per encode() call (bounds RAM per step)
+COMPACT_MIN_ROWS = 10_000     # don't bother compacting small caches
+COMPACT_STALE = 0.5           # rewrite once half the rows are superseded
+
+def _slug(model_id):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", model_id)
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+def _lock(path):
+    """Exclusive OS lock on path, held until the process exits; None if taken"""
+    f = open(path, "a+")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def _cut_torn_tail(path, chunk=1 << 16):
+    """Truncate path back to its last newline if a crash left a partial line"""
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk)
+            f.seek(start)
+            block = f.read(pos - start)
+            nl = block.rfind(b"\n")
+            if nl >= 0:
+                pos = start + nl + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+
+def _fingerprint(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+class EmbeddingCache:
+    """path → embedding rows for one model, persisted between runs"""
+
+    def __init__(self, cache_dir, model_id):
+        self.model_id = model_id
+        self.dir = Path(cache_dir) / _slug(model_id)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self._lock_file = _lock(self.dir / ".lock")
+        if self._lock_file is None:
+            raise RuntimeError(f"{self.dir} is in use by another run (2_DeDupe.py or "
+                               f"3_CreateRepSample.py); let it finish first")
+        self.meta_path = self.dir / "meta.json"
+        self.matrix_path = self.dir / "embeddings.f16"
+        self.index_path = self.dir / "index.jsonl"
+        self.dim = None
+        self.count = 0        # rows in the matrix file
+        self.rows = {}        # path -> (row, size, mtime_ns)
+        self._mm = None
+        self.hits = self.misses = 0   # totals across embed() calls
+        self._load()
+        if self.index_path.exists():
+            _cut_torn_tail(self.index_path)
+
+    def _load(self):
+        if not self.meta_path.exists():
+            return
+        meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        if meta.get("model") != self.model_id:
+            raise ValueError(f"{self.dir} holds embeddings for {meta.get('model')}, not {self.model_id}")
+        self.dim = meta["dim"]
+        if self.matrix_path.exists():
+            size = self.matrix_path.stat().st_size
+            self.count = size // (self.dim * 2)
+            if size > self.count * self.dim * 2:
+                # Partial row from a crash: the next append must start on a row boundary
+                with open(self.matrix_path, "r+b") as f:
+                    f.truncate(self.count * self.dim * 2)
+        if self.index_path.exists():
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        path, row, size, mtime_ns = json.loads(line)
+                    except ValueError:
+                        continue  # Torn line from a crash
+                    if row < self.count:
+                        self.rows[path] = (row, size, mtime_ns)
+
+    def _matrix(self):
+        if self._mm is None and self.count:
+            self._mm = np.memmap(self.matrix_path, dtype=np.float16, mode="r",
+                                 shape=(self.count, self.dim))
+        return self._mm
+
+    def lookup(self, paths, fingerprints):
+        """Cached row per path, or -1 when missing or changed on disk"""
+        rows = np.full(len(paths), -1, dtype=np.int64)
+        for i, (path, fp) in enumerate(zip(paths, fingerprints)):
+            hit = self.rows.get(path)
+            if hit and fp and (hit[1], hit[2]) == tuple(fp):
+                rows[i] = hit[0]
+        return rows
+
+    def append(self, paths, fingerprints, embs):
+        """Store new embeddings; paths without a fingerprint are skipped"""
+        keep = [i for i, fp in enumerate(fingerprints) if fp]
+        if not keep:
+            return
+        embs = np.ascontiguousarray(embs[keep], dtype=np.float16)
+        if self.dim is None:
+            self.dim = embs.shape[1]
+            self.meta_path.write_text(json.dumps(
+                {"model": self.model_id, "dim": self.dim, "dtype": "float16"}, indent=2
+            ), encoding="utf-8")
+
+        with open(self.matrix_path, "ab") as f:
+            f.write(embs.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            for k, i in enumerate(keep):
+                size, mtime_ns = fingerprints[i]
+                f.write(_dumps([paths[i], self.count + k, size, mtime_ns]) + "\n")
+                self.rows[paths[i]] = (self.count + k, size, mtime_ns)
+        self.count += len(keep)
+        self._mm = None  # Remap to include the new rows
+
+        if self.count >= COMPACT_MIN_ROWS and len(self.rows) < self.count * (1 - COMPACT_STALE):
+            self.compact()
+
+    def compact(self):
+        """Rewrite the matrix with only the rows still referenced"""
+        items = sorted(self.rows.items(), key=lambda kv: kv[1][0])
+        old = self._matrix()
+        tmp_matrix = self.matrix_path.with_suffix(".tmp")
+        tmp_index = self.index_path.with_suffix(".tmp")
+        with open(tmp_matrix, "wb") as fm, open(tmp_index, "w", encoding="utf-8") as fi:
+            for new_row, (path, (row, size, mtime_ns)) in enumerate(items):
+                fm.write(old[row].tobytes())
+                fi.write(_dumps([path, new_row, size, mtime_ns]) + "\n")
+        self._mm = old = None
+        os.replace(tmp_matrix, self.matrix_path)
+        os.replace(tmp_index, self.index_path)
+        self.rows = {path: (i, size, mtime_ns) for i, (path, (_, size, mtime_ns)) in enumerate(items)}
+        self.count = len(items)
+
+    def embed(self, paths, encode, out_path=None):
+        """float16 embeddings for paths, running encode() only on cache misses
+
+        encode(paths) must return (embs, ok) for exactly those paths, where ok
+        marks images that actually decoded; failures are returned but not cached.
+        With out_path the result is an np.memmap written there instead of an
+        in-memory array.
+        """
+        paths = [os.path.abspath(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS) as pool:
+            fingerprints = list(pool.map(_fingerprint, paths))
+        rows = self.lookup(paths, fingerprints)
+        miss = np.flatnonzero(rows < 0)
+        self.hits += len(paths) - len(miss)
+        self.misses += len(miss)
+
+        out = None
+        def allocate(dim):
+            if out_path is None:
+                return np.empty((len(paths), dim), dtype=np.float16)
+            return np.memmap(out_path, dtype=np.float16, mode="w+", shape=(len(paths), dim))
+
+        # Copy hits out first: append() may compact and renumber rows
+        if self.dim is not None and len(paths):
+            out = allocate(self.dim)
+            hits = np.flatnonzero(rows >= 0)
+            hits = hits[np.argsort(rows[hits])]  # Read the memmap in file order
+            for i0 in range(0, len(hits), ENCODE_CHUNK):
+                part = hits[i0:i0 + ENCODE_CHUNK]
+                out[part] = self._matrix()[rows[part]]
+
+        for i0 in range(0, len(miss), ENCODE_CHUNK):
+            part = miss[i0:i0 + ENCODE_CHUNK]
+            new, ok = encode([paths[i] for i in part])
+            if out is None:
+                out = allocate(new.shape[1])
+            out[part] = new
+            self.append([paths[i] for i in part],
+                        [fingerprints[i] if good else None for i, good in zip(part, ok)], new)
+        if out is None:
+            return np.zeros((0, 0), dtype=np.float16)
+        if out_path is not None:
+            out.flush()
+        return out
@@ -0,0 +1,216 @@
+# phash.py
+# Perceptual-hash prefilter: collapse re-encodes and resizes before CLIP.
+#
+# Each image gets a 64-bit pHash (DCT of a 32x32 grayscale) and a 64-bit dHash
+# (gradient of a 9x8 grayscale), computed in a process pool. Two images are
+# near-identical when both hashes are within MAX_DISTANCE bits.
+#
+# Candidate pairs come from multi-index bucketing: the pHash is split into 4
+# 16-bit chunks, and two hashes within d bits must agree on some chunk to
+# within d // 4 bits, so only items sharing (or nearly sharing) a chunk are
+# compared. Every flip pattern of up to d // 4 bits is probed: 17 keys per
+# chunk below d = 8, 137 at 8-11, 697 at 12-15 — larger distances get slow.
+# Hamming distances are NumPy popcounts over uint64 arrays and the groups are
+# joined with dedupe_index's union-find.
+#
+#   python phash.py /path/to/thumbnails    # report near-identical groups
+#   python phash.py --selftest             # synthetic re-encodes/resizes
+
+import os
+import sys
+import argparse
+from itertools import combinations
+import numpy as np
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+
+from dedupe_index import union_edges, labels_from_parent
+
+MAX_DISTANCE = 6      # bits; re-encodes/resizes land at 0-4, different images ~32
+HASH_WORKERS = os.cpu_count() or 4
+CHUNKS = 4            # 16-bit chunks for multi-index bucketing
+PAIR_BLOCK = 1 << 20  # candidate pairs checked per batch
+
+# DCT-II basis for 32 samples (orthonormal rows)
+_N = 32
+_DCT = np.sqrt(2 / _N) * np.cos(np.pi * (2 * np.arange(_N)[None, :] + 1) * np.arange(_N)[:, None] / (2 * _N))
+_DCT[0] /= np.sqrt(2)
+
+def _pack(bits):
+    """64 booleans → uint64 (first bit most significant)"""
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+def hash_image(path):
+    """(phash, dhash) as Python ints, or None if the image can't be read"""
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (64, 64))  # JPEG: decode at reduced scale
+            gray = img.convert("L")
+            small = np.asarray(gray.resize((_N, _N), Image.BILINEAR), dtype=np.float64)
+            grad = np.asarray(gray.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    except Exception:
+        return None
+    coeffs = (_DCT @ small @ _DCT.T)[:8, :8]
+    ph = coeffs > np.median(coeffs.ravel()[1:])  # DC term excluded from the median
+    dh = grad[:, 1:] > grad[:, :-1]
+    return _pack(ph), _pack(dh)
+
+def compute_hashes(paths, workers=HASH_WORKERS):
+    """Hash every path in a process pool → (phash uint64[], dhash uint64[], ok bool[])"""
+    paths = [str(p) for p in paths]
+    if workers > 1 and len(paths) > 64:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(hash_image, paths, chunksize=256))
+    else:
+        results = [hash_image(p) for p in paths]
+    ok = np.array([r is not None for r in results], dtype=bool)
+    ph = np.array([r[0] if r else 0 for r in results], dtype=np.uint64)
+    dh = np.array([r[1] if r else 0 for r in results], dtype=np.uint64)
+    return ph, dh, ok
+
+if hasattr(np, "bitwise_count"):
+    def popcount(x):
+        return np.bitwise_count(x)
+else:
+    _POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+    def popcount(x):
+        return _POP8[np.ascontiguousarray(x).view(np.uint8)].reshape(*x.shape, 8).sum(-1)
+
+def _ranges_to_pairs(queries, lo, hi, order):
+    """Expand query i against sorted positions lo[i]:hi[i] into (i, order[pos]) pairs"""
+    counts = hi - lo
+    q = np.repeat(queries, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return q, order[np.repeat(lo, counts) + offsets]
+
+def _candidate_pairs(hashes, max_distance):
+    """Yield (i, j) arrays (i < j) that share a chunk within max_distance // CHUNKS bits"""
+    n = len(hashes)
+    radius = max_distance // CHUNKS
+    bits = 64 // CHUNKS
+    mask = np.uint64((1 << bits) - 1)
+    for c in range(CHUNKS):
+        keys = ((hashes >> np.uint64(c * bits)) & mask).astype(np.int64)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        probes = [sum(1 << b for b in flipped)
+                  for r in range(radius + 1) for flipped in combinations(range(bits), r)]
+        for flip in probes:
+            for i0 in range(0, n, PAIR_BLOCK // 64):
+                queries = np.arange(i0, min(n, i0 + PAIR_BLOCK // 64))
+                target = keys[queries] ^ flip
+                lo = np.searchsorted(sorted_keys, target, "left")
+                hi = np.searchsorted(sorted_keys, target, "right")
+                a, b = _ranges_to_pairs(queries, lo, hi, order)
+                keep = a < b
+                if keep.any():
+                    yield a[keep], b[keep]
+
+def near_identical_labels(ph, dh, max_distance=MAX_DISTANCE, ok=None):
+    """Cluster label per item: items whose pHash and dHash are both within
+    max_distance bits share a label (the smallest index in the group)"""
+    n = len(ph)
+    parent = np.arange(n, dtype=np.int64)
+    idx = np.arange(n) if ok is None else np.flatnonzero(ok)
+
+    # Identical hash pairs collapse in O(n log n); only unique pairs are searched
+    pairs = (ph[idx].astype(np.uint64), dh[idx].astype(np.uint64))
+    uniq, first, inverse = np.unique(np.stack(pairs, axis=1), axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.ravel()
+    union_edges(parent, idx, idx[first[inverse]])
+
+    uph, udh = uniq[:, 0], uniq[:, 1]
+    for a, b in _candidate_pairs(uph, max_distance):
+        close = (popcount(uph[a] ^ uph[b]) <= max_distance) & (popcount(udh[a] ^ udh[b]) <= max_distance)
+        if close.any():
+            union_edges(parent, idx[first[a[close]]], idx[first[b[close]]])
+    return labels_from_parent(parent)
+
+def collapse(paths, max_distance=MAX_DISTANCE, workers=HASH_WORKERS):
+    """Keep one path per near-identical group (the first); unreadable files are kept
+
+    Returns (kept_paths, labels) with labels aligned to the input paths.
+    """
+    ph, dh, ok = compute_hashes(paths, workers)
+    labels = near_identical_labels(ph, dh, max_distance, ok)
+    keep = labels == np.arange(len(paths))
+    return [p for p, k in zip(paths, keep) if k], labels
+
+# ------------------------------------------------------------------ selftest
+def selftest():
+    import tempfile, time
+    rng = np.random.default_rng(0)
+    tmp = tempfile.mkdtemp(prefix="phash_")
+    paths, truth = [], []
+    for k in range(60):
+        # Smooth random image: upscaled low-res noise
+        base = Image.fromarray(rng.integers(0, 255, (12, 16, 3), dtype=np.uint8)).resize((640, 480), Image.BICUBIC)
+        variants = [base, base.resize((320, 240), Image.LANCZOS)]
+        if k % 3 == 0:
+            variants.append(base.resize((1280, 960), Image.BICUBIC))
+        for v, img in enumerate(variants):
+            path = os.path.join(tmp, f"img{k:03}_{v}.jpg")
+            img.save(path, "JPEG", quality=[92, 60, 75][v])
+            paths.append(path)
+            truth.append(k)
+    open(os.path.join(tmp, "broken.jpg"), "wb").write(b"not an image")
+    paths.append(os.path.join(tmp, "broken.jpg"))
+    truth.append(-1)
+
+    t = time.perf_counter()
+    kept, labels = collapse(paths, workers=4)
+    secs = time.perf_counter() - t
+    truth = np.array(truth)
+    same = set(zip(labels.tolist(), truth.tolist()))
+    good = len(same) == len(set(labels.tolist())) == len(set(truth.tolist()))
+    print(f"{len(paths)} images → {len(kept)} kept (expected {len(set(truth.tolist()))})  "
+          f"{'PASS' if good else 'FAIL'}  ({secs:.2f}s)")
+
+    # Bucketing must find exactly what brute force finds
+    h = rng.integers(0, 2**63, 3000, dtype=np.uint64)
+    h[1000:1500] = h[:500] ^ (np.uint64(1) << rng.integers(0, 64, 500).astype(np.uint64))
+    h[1500:2000] = h[500:1000] ^ np.uint64(0b10100000100001)  # 4-5 bit changes
+    d = np.zeros_like(h)
+    fast = near_identical_labels(h, d, MAX_DISTANCE)
+    dist = popcount(h[:, None] ^ h[None, :])
+    i, j = np.nonzero(np.triu(dist <= MAX_DISTANCE, 1))
+    parent = np.arange(len(h))
+    union_edges(parent, i, j)
+    brute_ok = np.array_equal(fast, labels_from_parent(parent))
+    print(f"bucketing vs brute force on {len(h)} hashes  {'PASS' if brute_ok else 'FAIL'}")
+
+    # At 8+ bits two flips can land in one chunk; every planted pair must be found
+    far_ok = True
+    for distance in (8, 12):
+        h = rng.integers(0, 2**63, 1000, dtype=np.uint64)
+        for k in range(500):
+            bits = rng.choice(64, distance, replace=False)
+            h[500 + k] = h[k] ^ np.uint64(sum(1 << int(b) for b in bits))
+        labels = near_identical_labels(h, np.zeros_like(h), distance)
+        found = int((labels[500:] == labels[:500]).sum())
+        far_ok &= found == 500
+        print(f"distance {distance:2}: {found} of 500 planted pairs found  {'PASS' if found == 500 else 'FAIL'}")
+    return good and brute_ok and far_ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Perceptual-hash near-duplicate groups")
+    parser.add_argument("folder", nargs="?", help="Folder to scan (recursively)")
+    parser.add_argument("--distance", type=int, default=MAX_DISTANCE,
+                        help=f"Max differing bits (default: {MAX_DISTANCE}; 8 and up probe many "
+                             f"more buckets and run slower)")
+    parser.add_argument("--workers", type=int, default=HASH_WORKERS)
+    parser.add_argument("--selftest", action="store_true", help="Run the synthetic check")
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    if not args.folder:
+        parser.print_help()
+        sys.exit(0)
+
+    exts = {'.jpg', '.jpeg', '.png', '.webp', '.bmp'}
+    paths = sorted(os.path.join(r, f) for r, _, fs in os.walk(args.folder)
+                   for f in fs if os.path.splitext(f)[1].lower() in exts)
+    kept, labels = collapse(paths, args.distance, args.workers)
+    print(f"{len(paths):,} images → {len(kept):,} after collapsing near-identical copies")
+    _, counts = np.unique(labels, return_counts=True)
+    print(f"{(counts > 1).sum():,} groups with copies, largest {counts.max() if len(counts) else 0}")
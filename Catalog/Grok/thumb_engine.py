@@ -0,0 +1,196 @@
+# thumb_engine.py
+# Torch-free thumbnail generation for 1_dataset_create.py.
+#
+# The DataLoader path decoded every original at full resolution and let
+# torchvision run Resize + CenterCrop (PIL's Lanczos underneath). This does
+# the same crop with PIL alone, in worker processes, and does less of it:
+#   • JPEG draft mode: libjpeg decodes straight at 1/2, 1/4 or 1/8 scale,
+#     never below REDUCE_GAP x the thumbnail size
+#   • Image.reduce: integer box downscale of the centre square to within
+#     REDUCE_GAP x the target, so the Lanczos pass only sees a few pixels
+#   • Lanczos to size x size, saved through a temp file + os.replace so an
+#     interrupted run never leaves a truncated thumbnail behind
+# Work goes to a ProcessPoolExecutor in small tasks with a bounded number in
+# flight, so memory stays flat on libraries of millions of files.
+#
+# stale_jobs() decides what needs doing before anything is decoded: one
+# scandir pass over each thumbnail tree and one over the sources, comparing
+# mtimes from the directory entries. Only missing or outdated thumbnails are
+# handed to the workers, so a rerun on an unchanged library is just the scan.
+#
+# One decode can feed several sizes (a pyramid): levels are (size, quality,
+# crop) and each goes to its own parallel tree. make_pyramid() drafts the
+# JPEG for the largest level, then makes the levels largest first, each
+# from the previous level of the same framing (or the reduced working image)
+# rather than from the full decode.
+
+import os
+import math
+from itertools import islice
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image
+
+REDUCE_GAP = 2.0     # draft/reduce stop at this multiple of the target size
+TASK_FILES = 32      # files per worker task
+IN_FLIGHT = 4        # tasks queued per worker
+
+def cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def thumb_path(src, source_root, thumb_root):
+    """Mirror of src under thumb_root, always .jpg"""
+    return (Path(thumb_root) / Path(src).relative_to(source_root)).with_suffix(".jpg")
+
+def _walk(root, skip=()):
+    """Yield (relative posix path, DirEntry) for every file under root
+
+    Folders directly under root named in skip are left out; deeper folders
+    of the same name are walked like any other.
+    """
+    skip = set(skip)
+    stack = [("", str(root))]
+    while stack:
+        prefix, folder = stack.pop()
+        try:
+            entries = os.scandir(folder)
+        except OSError:
+            continue
+        with entries:
+            for e in entries:
+                if e.is_dir(follow_symlinks=False):
+                    if prefix or e.name not in skip:
+                        stack.append((f"{prefix}{e.name}/", e.path))
+                elif e.is_file():
+                    yield prefix + e.name, e
+
+def stale_jobs(source_root, thumb_roots, exts, skip=("thumbnails",)):
+    """(src, [dest per tree]) for sources with a missing or outdated thumbnail
+
+    A thumbnail is current when it is newer than its source; a source is
+    redone (every tree) when any of its thumbnails is not. Returns (jobs,
+    number of source images). The top-level folders named in skip, the
+    trees themselves and existing pyramid trees (skip name + "_<size>", e.g.
+    from an earlier run with other sizes) are not walked on the source side.
+    """
+    thumb_roots = [Path(root) for root in thumb_roots]
+    have = [{rel: e.stat().st_mtime for rel, e in _walk(root)} for root in thumb_roots]
+    skip = set(skip) | {root.name for root in thumb_roots}
+    try:
+        with os.scandir(source_root) as entries:
+            skip.update(e.name for e in entries if e.is_dir(follow_symlinks=False)
+                        and any(e.name.startswith(f"{name}_") and e.name[len(name) + 1:].isdigit()
+                                for name in list(skip)))
+    except OSError:
+        pass
+    jobs, total = [], 0
+    for rel, e in _walk(source_root, skip):
+        stem, ext = os.path.splitext(rel)
+        if ext.lower() not in exts:
+            continue
+        total += 1
+        name = stem + ".jpg"
+        mtime = e.stat().st_mtime
+        if any(tree.get(name, 0) <= mtime for tree in have):
+            jobs.append((Path(e.path), [root / name for root in thumb_roots]))
+    return jobs, total
+
+def _fit(w, h, size):
+    """w x h with the long side brought down to size (never up)"""
+    scale = min(1.0, size / max(w, h))
+    return max(1, round(w * scale)), max(1, round(h * scale))
+
+def _reduction(w, h, levels):
+    """How far a w x h frame can shrink and still leave REDUCE_GAP x every level"""
+    return min((min(w, h) if crop else max(w, h)) / (size * REDUCE_GAP) for size, crop in levels)
+
+def make_pyramid(path, levels, fast=True):
+    """One decode → one RGB image per (size, crop) level, in the order given
+
+    crop levels are size x size centre crops, as Resize(size) +
+    CenterCrop(size); the others keep the whole frame with the long side at
+    most size. fast=False decodes at full resolution and resizes each level
+    in one Lanczos pass, like the DataLoader path (kept for --benchmark).
+    """
+    img = Image.open(path)
+    if fast:
+        scale = _reduction(*img.size, levels)
+        if scale > 1:   # JPEG only; no-op for other formats
+            img.draft("RGB", (math.ceil(img.width / scale), math.ceil(img.height / scale)))
+    img = img.convert("RGB")
+    # Whole-frame levels first, crops after; largest first within each
+    order = sorted(range(len(levels)), key=lambda i: (levels[i][1], -levels[i][0]))
+    out = [None] * len(levels)
+    for k, i in enumerate(order):
+        size, crop = levels[i]
+        w, h = img.size
+        if crop:
+            side = min(w, h)
+            left, top = (w - side) // 2, (h - side) // 2
+            box, target = (left, top, left + side, top + side), (size, size)
+        else:
+            box, target = (0, 0, w, h), _fit(w, h, size)
+        # The reduced image becomes the working image, so it must still
+        # cover every level after this one
+        factor = int(_reduction(box[2] - box[0], box[3] - box[1], [levels[j] for j in order[k:]])) if fast else 1
+        if factor > 1:
+            img, box = img.reduce(factor, box), None
+        out[i] = img.resize(target, Image.LANCZOS, box=box)
+        # Continue from this level when the next one has the same framing
+        # (a crop of a fit level would land off by a fraction of a pixel)
+        # and it is big enough for every smaller level
+        rest = [levels[j] for j in order[k + 1:]]
+        if fast and rest and rest[0][1] == crop and _reduction(*out[i].size, rest) >= 1:
+            img = out[i]
+    return out
+
+def make_thumbnail(path, size, fast=True):
+    """size x size RGB centre crop, as Resize(size) + CenterCrop(size)"""
+    return make_pyramid(path, [(size, True)], fast)[0]
+
+def save_jpeg(img, dest, quality):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_name(f".{dest.name}.tmp")
+    img.save(tmp, "JPEG", quality=quality, optimize=True, subsampling="4:2:0")
+    os.replace(tmp, dest)
+
+def _run_task(jobs, levels, fast):
+    """Worker: [(src, [dest per level])] → [(src, status, error)]"""
+    shapes = [(size, crop) for size, _, crop in levels]
+    out = []
+    for src, dests in jobs:
+        try:
+            for img, dest, (_, quality, _) in zip(make_pyramid(src, shapes, fast), dests, levels):
+                save_jpeg(img, Path(dest), quality)
+            out.append((src, "saved", None))
+        except Exception as e:
+            out.append((src, "failed", str(e)))
+    return out
+
+def generate(jobs, levels=((512, 85, True),), workers=None, fast=True):
+    """Write thumbnails for (src, [dest per level]) jobs; yields (src, status, error) as they finish
+
+    levels are (size, JPEG quality, crop). Every job is (re)written — pass
+    stale_jobs() to skip current ones.
+    status is "saved" or "failed". workers=1 runs in this process.
+    """
+    workers = workers or cores()
+    jobs = iter(jobs)
+    if workers == 1:
+        while task := list(islice(jobs, TASK_FILES)):
+            yield from _run_task(task, levels, fast)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        while True:
+            while len(pending) < workers * IN_FLIGHT and (task := list(islice(jobs, TASK_FILES))):
+                pending.add(pool.submit(_run_task, task, levels, fast))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                yield from f.result()
@@ -0,0 +1,75 @@
+# torch_runtime.py
+# Device selection and CPU tuning shared by the Grok scripts.
+#
+# On CUDA nothing changes (8 loader workers, pinned memory). On CPU the cores
+# are split between DataLoader decode workers and torch's intra-op threads so
+# the two don't oversubscribe each other, the model runs channels-last, and
+# batches stay in host memory (no pinning).
+
+import os
+import time
+import torch
+
+def available_cores():
+    """Cores this process may run on (respects taskset/cgroup affinity)"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def pick_device(requested="auto"):
+    """"auto" → cuda when available, else cpu; an unavailable cuda falls back to cpu"""
+    if requested == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    if requested.startswith("cuda") and not torch.cuda.is_available():
+        print("CUDA requested but not available → running on CPU")
+        return "cpu"
+    return requested
+
+def configure(device, loader_workers=None):
+    """Set torch threads for device; returns (loader_workers, pin_memory, torch_threads)"""
+    cores = available_cores()
+    if device == "cpu":
+        # Decoding a thumbnail is cheap next to a ViT-L forward pass, so most
+        # cores go to torch and a few to the loader
+        workers = loader_workers if loader_workers is not None else min(4, max(1, cores // 4))
+        threads = max(1, cores - workers)
+        torch.set_num_threads(threads)
+        return workers, False, threads
+    workers = loader_workers if loader_workers is not None else min(8, cores)
+    return workers, True, torch.get_num_threads()
+
+def prepare_model(model, device):
+    model.eval()
+    if device == "cpu":
+        model = model.to(memory_format=torch.channels_last)
+    return model
+
+def to_device(batch, device):
+    if device == "cpu":
+        return batch.contiguous(memory_format=torch.channels_last)
+    return batch.to(device, non_blocking=True)
+
+class Throughput:
+    """Images/sec over the time actually spent embedding"""
+
+    def __init__(self):
+        self.images = 0
+        self.seconds = 0.0
+        self._t = None
+
+    def start(self):
+        self._t = time.perf_counter()
+
+    def stop(self, images):
+        self.seconds += time.perf_counter() - self._t
+        self.images += images
+
+    def rate(self):
+        return self.images / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self, device, threads):
+        if not self.images:
+            return "nothing embedded (all cached)"
+        where = {"cpu": f"CPU, {threads} threads", "daemon": "the model daemon"}.get(device, device.upper())
+        return f"{self.rate():,.1f} images/sec on {where} ({self.images:,} images)"
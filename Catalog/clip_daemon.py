@@ -0,0 +1,327 @@
+"""
+clip_daemon.py — Resident CLIP model server shared by the Catalog tools
+
+Loading ViT-L takes longer than scoring a small incremental batch, so this
+keeps the models loaded between runs. 4_Score.py, 2_Sort.py and the Grok
+scripts call connect() first and only load a model in-process when no daemon
+answers.
+
+Endpoints (JSON over localhost HTTP):
+    GET  /health                                    → {"ok": true, "loaded": [...]}
+    POST /score {"paths": [...]}                    → {"scores": [{"real", "cgi", "neg"} | null, ...]}
+    POST /embed {"paths": [...], "model": "ViT-L-14", "pretrained": "laion2B-s32B-b82K"}
+                                                    → {"dim": 768, "ok": [...], "embeddings": <base64 float16>}
+
+Each model has one worker thread; paths from requests that arrive together
+are merged into shared batches (up to --batch-size, waiting at most
+--batch-wait ms for more to arrive). Models load on their first request.
+
+Usage:
+    python clip_daemon.py                       # serve on 127.0.0.1:8765
+    python clip_daemon.py --port 9000 --device cpu
+    OWNGALLERY_DAEMON=127.0.0.1:9000 python 4_Score.py /images/thumbnails
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import queue
+import argparse
+import threading
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+BATCH_SIZE = 64
+BATCH_WAIT_MS = 20
+DECODE_WORKERS = 8
+CLIENT_CHUNK = 256          # paths per HTTP request from the client
+
+SCORE_MODEL = "laion/CLIP-ViT-L-14-laion2B-s32B-b82K"
+SCORE_FALLBACK = "openai/clip-vit-large-patch14"
+PROMPTS_REAL = ["photograph", "photorealistic", "raw photo", "dslr", "4k", "8k",
+                "detailed skin texture", "masterpiece", "nude", "erotic photography",
+                "nsfw", "uncensored"]
+PROMPTS_CGI = ["3d render", "unreal engine 5", "octane render", "blender",
+               "digital art", "3d anime", "highly detailed cg", "3d hentai",
+               "nsfw anime", "explicit", "detailed anatomy"]
+PROMPTS_NEG = ["sketch", "pencil drawing", "doodle", "flat color", "cel shading",
+               "vector art", "monochrome", "low quality", "text", "watermark",
+               "censored", "mosaic", "blur", "bad anatomy"]
+
+# ================================================================== client
+def daemon_address():
+    return os.environ.get("OWNGALLERY_DAEMON", f"{DEFAULT_HOST}:{DEFAULT_PORT}")
+
+class DaemonClient:
+    """Talks to a running clip_daemon"""
+
+    def __init__(self, address):
+        self.address = address
+        self.url = f"http://{address}"
+
+    def _request(self, endpoint, payload=None, timeout=None):
+        data = None if payload is None else json.dumps(payload).encode("utf-8")
+        req = urllib.request.Request(self.url + endpoint, data=data,
+                                     headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+
+    def health(self, timeout=0.5):
+        return self._request("/health", timeout=timeout)
+
+    def score(self, paths):
+        """Score dict (or None for unreadable images) per path"""
+        scores = []
+        for i in range(0, len(paths), CLIENT_CHUNK):
+            chunk = [os.path.abspath(str(p)) for p in paths[i:i + CLIENT_CHUNK]]
+            scores.extend(self._request("/score", {"paths": chunk})["scores"])
+        return scores
+
+    def embed(self, paths, model, pretrained):
+        """(float16 embeddings, ok flags) for paths, like the scripts' encode()"""
+        import numpy as np
+        embs, oks = [], []
+        for i in range(0, len(paths), CLIENT_CHUNK):
+            chunk = [os.path.abspath(str(p)) for p in paths[i:i + CLIENT_CHUNK]]
+            resp = self._request("/embed", {"paths": chunk, "model": model, "pretrained": pretrained})
+            raw = np.frombuffer(base64.b64decode(resp["embeddings"]), dtype=np.float16)
+            embs.append(raw.reshape(len(chunk), resp["dim"]))
+            oks.append(np.array(resp["ok"], dtype=bool))
+        return np.concatenate(embs), np.concatenate(oks)
+
+def connect(address=None):
+    """DaemonClient if a daemon is answering at address, else None"""
+    client = DaemonClient(address or daemon_address())
+    try:
+        client.health()
+    except Exception:
+        return None
+    return client
+
+# ================================================================== server
+class _Batcher:
+    """One worker thread per model, merging queued items into batches"""
+
+    def __init__(self, name, load, run, batch_size, wait_s):
+        self.name = name
+        self._load = load
+        self._run = run
+        self.batch_size = batch_size
+        self.wait_s = wait_s
+        self.state = None
+        self.queue = queue.Queue()
+        threading.Thread(target=self._loop, name=name, daemon=True).start()
+
+    def submit(self, items):
+        futures = []
+        for item in items:
+            fut = Future()
+            self.queue.put((item, fut))
+            futures.append(fut)
+        return futures
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.wait_s
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                if self.state is None:
+                    print(f"🤖 Loading {self.name}...")
+                    self.state = self._load()
+                    print(f"✅ {self.name} ready")
+                results = self._run(self.state, [item for item, _ in batch])
+                for (_, fut), result in zip(batch, results):
+                    fut.set_result(result)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+
+def _open_rgb(path):
+    from PIL import Image
+    try:
+        with Image.open(path) as img:
+            return img.convert("RGB")
+    except Exception:
+        return None
+
+class _Models:
+    """Lazily created batchers for the scoring model and each embedding model"""
+
+    def __init__(self, device, batch_size, wait_s):
+        self.device = device
+        self.batch_size = batch_size
+        self.wait_s = wait_s
+        self.decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS)
+        self.batchers = {}
+        self.lock = threading.Lock()
+
+    def _get(self, key, load, run):
+        with self.lock:
+            if key not in self.batchers:
+                self.batchers[key] = _Batcher(key, load, run, self.batch_size, self.wait_s)
+            return self.batchers[key]
+
+    # ---- scoring (transformers CLIP, same model and prompts as 4_Score.py)
+    def _load_scorer(self):
+        import torch
+        from transformers import CLIPProcessor, CLIPModel
+        try:
+            model = CLIPModel.from_pretrained(SCORE_MODEL)
+            processor = CLIPProcessor.from_pretrained(SCORE_MODEL)
+        except Exception:
+            print("⚠️  LAION model failed, falling back to OpenAI...")
+            model = CLIPModel.from_pretrained(SCORE_FALLBACK)
+            processor = CLIPProcessor.from_pretrained(SCORE_FALLBACK)
+        model = model.to(self.device).eval()
+        prompts = PROMPTS_REAL + PROMPTS_CGI + PROMPTS_NEG
+        with torch.inference_mode():
+            text = processor(text=prompts, return_tensors="pt", padding=True, truncation=True)
+            text_embeds = model.get_text_features(**text.to(self.device))
+            text_embeds = text_embeds / text_embeds.norm(p=2, dim=-1, keepdim=True)
+        return model, processor, text_embeds  # Prompts are encoded once, not per image
+
+    def _run_scorer(self, state, paths):
+        import torch
+        model, processor, text_embeds = state
+        images = list(self.decode_pool.map(_open_rgb, paths))
+        valid = [i for i, img in enumerate(images) if img is not None]
+        results = [None] * len(paths)
+        if not valid:
+            return results
+        with torch.inference_mode():
+            inputs = processor(images=[images[i] for i in valid], return_tensors="pt")
+            image_embeds = model.get_image_features(**inputs.to(self.device))
+            image_embeds = image_embeds / image_embeds.norm(p=2, dim=-1, keepdim=True)
+            sims = (image_embeds @ text_embeds.T).float().cpu()
+        a, b = len(PROMPTS_REAL), len(PROMPTS_REAL) + len(PROMPTS_CGI)
+        for row, i in enumerate(valid):
+            results[i] = {"real": sims[row, :a].max().item(),
+                          "cgi": sims[row, a:b].max().item(),
+                          "neg": sims[row, b:].max().item()}
+        return results
+
+    def score(self, paths):
+        batcher = self._get("scorer", self._load_scorer, self._run_scorer)
+        return [f.result() for f in batcher.submit(paths)]
+
+    # ---- embeddings (open_clip, same as the Grok scripts)
+    def embed(self, paths, model_name, pretrained):
+        import numpy as np
+
+        def load():
+            import open_clip
+            model, _, preprocess = open_clip.create_model_and_transforms(
+                model_name, pretrained=pretrained, device=self.device
+            )
+            return model.eval(), preprocess
+
+        def run(state, batch_paths):
+            import torch
+            model, preprocess = state
+            images = list(self.decode_pool.map(_open_rgb, batch_paths))
+            tensors = [preprocess(img) if img is not None else torch.zeros(3, 224, 224) for img in images]
+            with torch.inference_mode():
+                emb = model.encode_image(torch.stack(tensors).to(self.device))
+                emb /= emb.norm(dim=-1, keepdim=True)
+            rows = emb.half().cpu().numpy()
+            return [(rows[i], img is not None) for i, img in enumerate(images)]
+
+        batcher = self._get(f"{model_name}/{pretrained}", load, run)
+        results = [f.result() for f in batcher.submit(paths)]
+        embs = np.stack([r[0] for r in results]) if results else np.zeros((0, 0), np.float16)
+        return embs, [bool(r[1]) for r in results]
+
+def _make_handler(models):
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._reply(200, {"ok": True, "loaded": sorted(models.batchers)})
+            else:
+                self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                req = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                paths = req["paths"]
+                if self.path == "/score":
+                    self._reply(200, {"scores": models.score(paths)})
+                elif self.path == "/embed":
+                    embs, ok = models.embed(paths, req["model"], req["pretrained"])
+                    self._reply(200, {"dim": int(embs.shape[1]) if len(paths) else 0, "ok": ok,
+                                      "embeddings": base64.b64encode(embs.tobytes()).decode("ascii")})
+                else:
+                    self._reply(404, {"error": "not found"})
+            except Exception as e:
+                self._reply(500, {"error": str(e)})
+
+        def log_message(self, fmt, *args):
+            pass  # Keep the console for model/batch messages
+
+    return Handler
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, device="auto",
+          batch_size=BATCH_SIZE, batch_wait_ms=BATCH_WAIT_MS):
+    import torch
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    models = _Models(device, batch_size, batch_wait_ms / 1000)
+    server = ThreadingHTTPServer((host, port), _make_handler(models))
+    print("=" * 60)
+    print("CLIP MODEL DAEMON")
+    print("=" * 60)
+    print(f"🔌 Listening on http://{host}:{port}  (device: {device})")
+    print(f"📦 Batch size {batch_size}, batch wait {batch_wait_ms} ms")
+    print("💡 Models load on first use; Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    finally:
+        server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep CLIP loaded for the Catalog tools")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Bind address (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port (default: {DEFAULT_PORT})")
+    parser.add_argument("--device", default="auto", help="auto | cuda | cpu (default: auto)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help=f"Max images per forward pass (default: {BATCH_SIZE})")
+    parser.add_argument("--batch-wait", type=int, default=BATCH_WAIT_MS,
+                        help=f"Ms to wait for more requests to fill a batch (default: {BATCH_WAIT_MS})")
+    parser.add_argument("--status", action="store_true", help="Check whether a daemon is running")
+    args = parser.parse_args()
+
+    if args.status:
+        client = connect(f"{args.host}:{args.port}")
+        if client:
+            loaded = client.health().get("loaded") or ["none yet"]
+            print(f"✅ Daemon running at {client.address} (loaded: {', '.join(loaded)})")
+        else:
+            print(f"❌ No daemon at {args.host}:{args.port}")
+            sys.exit(1)
+        return
+    serve(args.host, args.port, args.device, args.batch_size, args.batch_wait)
+
+if __name__ == "__main__":
+    main()
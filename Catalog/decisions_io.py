@@ -0,0 +1,200 @@
+"""
+decisions_io.py — Compact keep/discard decisions format shared by previewer and movers
+
+Format (gzip-compressed JSON lines, written and read as a stream):
+    {"format": "owngallery-decisions", "version": 2, "mode": "full", ...}   header
+    ["D", 0, "ArtistA/set1"]      directory table entry (root-relative, "/" separated)
+    ["K", 0, "image.jpg"]         keep    <dir id> <filename>
+    ["X", 0, "other.jpg"]         discard <dir id> <filename>
+    ["R", 0, "gone.jpg"]          removed since the snapshot (delta files only)
+    ["S", {"keep_count": 1, ...}] trailer with counts
+
+Directories are emitted the first time they are used, so neither side has to hold
+the whole table up front. Paths outside the root are stored with an absolute
+directory entry. A "delta" file has the same layout but only lists items whose
+decision changed since the snapshot named in its "base_id", plus "R" rows for
+items no longer in either list; apply_delta() turns the snapshot into the
+full state again.
+
+The legacy indented decisions.json ({"keep": [...], "discard": [...]}) is still
+read transparently.
+"""
+
+import os
+import gzip
+import json
+import time
+import uuid
+from pathlib import Path
+
+FORMAT_NAME = "owngallery-decisions"
+FORMAT_VERSION = 2
+DEFAULT_FILENAME = "decisions.jsonl.gz"
+
+KEEP = "K"
+DISCARD = "X"
+REMOVED = "R"
+
+def _split_relative(path, root_prefix):
+    """Return (dir, filename) with dir relative to root when possible"""
+    path = str(path)
+    if path.startswith(root_prefix):
+        rel = path[len(root_prefix):]
+    else:
+        rel = path  # Outside root: keep the absolute directory
+    head, _, name = rel.replace("\\", "/").rpartition("/")
+    return head, name
+
+def write_decisions(output_path, root, items, mode="full", base_id=None):
+    """Stream (decision, path) pairs to a compact decisions file, return header"""
+    root = str(Path(root).resolve())
+    root_prefix = root.rstrip("\\/") + os.sep
+    header = {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "mode": mode,
+        "id": uuid.uuid4().hex,
+        "base_id": base_id,
+        "root": root,
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    dir_ids = {}
+    counts = {KEEP: 0, DISCARD: 0, REMOVED: 0}
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+    tmp_path = Path(str(output_path) + ".tmp")
+    with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+        f.write(dumps(header) + "\n")
+        for decision, path in items:
+            head, name = _split_relative(path, root_prefix)
+            dir_id = dir_ids.get(head)
+            if dir_id is None:
+                dir_id = dir_ids[head] = len(dir_ids)
+                f.write(dumps(["D", dir_id, head]) + "\n")
+            f.write(dumps([decision, dir_id, name]) + "\n")
+            counts[decision] += 1
+        f.write(dumps(["S", {
+            "keep_count": counts[KEEP],
+            "discard_count": counts[DISCARD],
+            "removed_count": counts[REMOVED],
+            "total": counts[KEEP] + counts[DISCARD],
+            "directories": len(dir_ids),
+        }]) + "\n")
+    os.replace(tmp_path, output_path)
+
+    header["stats"] = {"keep_count": counts[KEEP], "discard_count": counts[DISCARD],
+                       "removed_count": counts[REMOVED]}
+    return header
+
+def is_compact(path):
+    """True if the file is gzip-compressed (compact format)"""
+    with open(path, "rb") as f:
+        return f.read(2) == b"\x1f\x8b"
+
+def read_header(path):
+    """Read only the header line of a compact decisions file"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"Not a decisions file: {path}")
+    return header
+
+def iter_decisions(path, root=None):
+    """Yield (decision, path) from a compact file, rebased onto root if given"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("format") != FORMAT_NAME:
+            raise ValueError(f"Not a decisions file: {path}")
+        if header.get("version", 0) > FORMAT_VERSION:
+            raise ValueError(f"Unsupported decisions version {header['version']}")
+
+        base = str(root if root is not None else header["root"])
+        dirs = []
+        for line in f:
+            row = json.loads(line)
+            tag = row[0]
+            if tag == "D":
+                # Absolute entries win over the base in os.path.join
+                head = row[2].replace("/", os.sep)
+                dirs.append(os.path.join(base, head) if head else base)
+            elif tag == KEEP or tag == DISCARD or tag == REMOVED:
+                yield tag, os.path.join(dirs[row[1]], row[2])
+
+def load_decisions(path, root=None):
+    """Load keep/discard lists from a compact or legacy decisions file
+
+    A delta's removed items are not decisions; they are listed in the
+    returned header under "removed".
+    """
+    if not is_compact(path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        return data.get("keep", []), data.get("discard", []), {"mode": "legacy"}
+
+    lists = {KEEP: [], DISCARD: [], REMOVED: []}
+    for decision, p in iter_decisions(path, root):
+        lists[decision].append(p)
+    header = read_header(path)
+    header["removed"] = lists[REMOVED]
+    return lists[KEEP], lists[DISCARD], header
+
+def decisions_root(path):
+    """Folder the paths in a decisions file are relative to
+
+    The root recorded at export for the compact format; the file's own
+    folder for legacy decisions.json.
+    """
+    if is_compact(path):
+        return Path(read_header(path)["root"])
+    return Path(path).resolve().parent
+
+def load_state(path):
+    """Map path -> decision for a full snapshot (used to compute deltas)"""
+    if not is_compact(path):
+        keep, discard, _ = load_decisions(path)
+        state = dict.fromkeys(discard, DISCARD)
+        state.update(dict.fromkeys(keep, KEEP))
+        return state, None
+    return {p: d for d, p in iter_decisions(path)}, read_header(path)["id"]
+
+def apply_delta(state, delta_path):
+    """Update a load_state() map with a delta file (in place) and return it"""
+    for decision, p in iter_decisions(delta_path):
+        if decision == REMOVED:
+            state.pop(p, None)
+        else:
+            state[p] = decision
+    return state
+
+def export_with_delta(keep_list, discard_list, snapshot_path, root):
+    """Write changed items to a timestamped delta file and refresh the snapshot
+
+    Items in the snapshot but in neither list any more are written as
+    removals. Returns (delta_path, changed_count). Without a previous
+    snapshot a full export is written instead and delta_path is None.
+    """
+    snapshot_path = Path(snapshot_path)
+    if not snapshot_path.exists():
+        write_decisions(snapshot_path, root, tag_items(keep_list, discard_list))
+        return None, len(keep_list) + len(discard_list)
+
+    previous, base_id = load_state(snapshot_path)
+    current = dict((p, d) for d, p in tag_items(keep_list, discard_list))
+    changed = [(d, p) for p, d in current.items() if previous.get(p) != d]
+    changed += [(REMOVED, p) for p in previous if p not in current]
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    name = snapshot_path.name
+    stem = name[:-len(".jsonl.gz")] if name.endswith(".jsonl.gz") else snapshot_path.stem
+    delta_path = snapshot_path.with_name(f"{stem}.delta-{stamp}.jsonl.gz")
+
+    write_decisions(delta_path, root, changed, mode="delta", base_id=base_id)
+    write_decisions(snapshot_path, root, tag_items(keep_list, discard_list))
+    return delta_path, len(changed)
+
+def tag_items(keep_list, discard_list):
+    """Yield (decision, path) pairs for keep and discard lists"""
+    for p in keep_list:
+        yield KEEP, p
+    for p in discard_list:
+        yield DISCARD, p
@@ -0,0 +1,101 @@
+"""
+dest_names.py — O(1) collision-free destination naming for bulk moves/copies
+
+The old `while dest_path.exists(): name_{counter}` loop costs k stat calls for
+the k-th file called image.jpg, so a folder of duplicates costs O(k²). Here
+each destination folder is listed once into an in-memory name set, and each
+(stem, suffix) keeps its own next-counter, so picking a name is a set lookup.
+
+claim() additionally creates the chosen name exclusively on disk, and moves on
+to the next counter if another process created that name in the meantime, so
+nothing is ever overwritten.
+
+DestinationNamer(scan=False) never looks at the disk: folders start empty and
+only names handed out count, for virtual folders that exist only as a
+manifest (see manifest.py).
+"""
+
+import os
+import shutil
+import threading
+from pathlib import Path
+
+class DestinationNamer:
+    """Hands out unused filenames per destination folder"""
+
+    def __init__(self, scan=True):
+        self._scan = scan
+        self._names = {}      # folder -> set of normcased names in use
+        self._counters = {}   # (folder, stem, suffix) -> next suffix counter
+        self._lock = threading.Lock()
+
+    def _snapshot(self, folder):
+        names = self._names.get(folder)
+        if names is None:
+            names = set()
+            if self._scan:
+                try:
+                    with os.scandir(folder) as entries:
+                        names.update(os.path.normcase(e.name) for e in entries)
+                except FileNotFoundError:
+                    pass  # Created later by the caller; starts empty
+            self._names[folder] = names
+        return names
+
+    def is_taken(self, folder, name):
+        """True if name exists in folder (per the snapshot) or was handed out"""
+        folder = str(folder)
+        with self._lock:
+            return os.path.normcase(name) in self._snapshot(folder)
+
+    def reserve(self, folder, name):
+        """Mark name as used in folder without checking it is free"""
+        folder = str(folder)
+        with self._lock:
+            self._snapshot(folder).add(os.path.normcase(name))
+
+    def propose(self, folder, name):
+        """Reserve and return a free path for `name` in folder (in memory only)"""
+        folder = str(folder)
+        with self._lock:
+            names = self._snapshot(folder)
+            key = os.path.normcase(name)
+            if key not in names:
+                names.add(key)
+                return Path(folder) / name
+
+            stem, suffix = os.path.splitext(name)
+            counter_key = (folder, os.path.normcase(stem), os.path.normcase(suffix))
+            counter = self._counters.get(counter_key, 1)
+            candidate = f"{stem}_{counter}{suffix}"
+            while os.path.normcase(candidate) in names:
+                counter += 1
+                candidate = f"{stem}_{counter}{suffix}"
+            self._counters[counter_key] = counter + 1
+            names.add(os.path.normcase(candidate))
+            return Path(folder) / candidate
+
+    def claim(self, folder, name):
+        """Like propose(), but also create the file exclusively as a placeholder"""
+        while True:
+            dest = self.propose(folder, name)
+            try:
+                fd = os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue  # Created since the snapshot; already in the set now
+            os.close(fd)
+            return dest
+
+def discard(dest):
+    """Remove a claimed placeholder (or partial copy) after a failed move/copy"""
+    try:
+        os.unlink(dest)
+    except OSError:
+        pass
+
+def move_into(src, dest):
+    """Move src onto a claimed placeholder dest (rename, or copy across devices)"""
+    try:
+        os.replace(src, dest)
+    except OSError:
+        shutil.move(str(src), str(dest))
@@ -0,0 +1,255 @@
+"""
+exact_dupes.py — Byte-exact duplicate finder
+
+Finds files with identical bytes in three narrowing passes, so almost nothing
+is read in full:
+  1. group by file size (one scandir pass, no reads)
+  2. same size → hash of the first 64 KB
+  3. same size and head → full hash (blake2b)
+Hashing runs on a thread pool (it's I/O bound).
+
+Writes <folder>/exact_duplicates.json:
+    {"format": "owngallery-exact-dupes", "version": 1, "root": ...,
+     "groups": [["Artist/a.jpg", "Other/a (1).jpg"], ...], ...}
+The first path of each group is the keeper (shortest path, then alphabetical);
+the rest are redundant copies. The other tools pick the file up automatically:
+  • scanner.py skips scoring redundant copies
+  • 2_DeDupe.py skips embedding them
+  • mover.py / 5_move.py move each copy along with its keeper
+
+Run it once, on the originals. scanner.py and 2_DeDupe.py work on the
+thumbnails tree (<originals>/thumbnails); when that tree has no file of its
+own, load_groups() reads the originals' file and maps every path to its
+mirrored .jpg thumbnail, so one scan serves both trees.
+
+Usage:
+    python exact_dupes.py /path/to/images
+    python exact_dupes.py /path/to/images --workers 16
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+DUPES_FILENAME = "exact_duplicates.json"
+DUPES_FORMAT = "owngallery-exact-dupes"
+HEAD_BYTES = 64 * 1024
+HASH_WORKERS = 16
+THUMBS_FOLDER = "thumbnails"
+SKIP_FOLDERS = {'Keep', 'Discard', 'webP-OG', THUMBS_FOLDER}
+IMAGE_EXTS = {'.jpg', '.jpeg', '.png', '.webp', '.bmp', '.gif'}
+
+def _hash_file(path, limit=None, chunk=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    remaining = limit
+    try:
+        with open(path, "rb") as f:
+            while remaining is None or remaining > 0:
+                block = f.read(chunk if remaining is None else min(chunk, remaining))
+                if not block:
+                    break
+                h.update(block)
+                if remaining is not None:
+                    remaining -= len(block)
+    except OSError:
+        return None
+    return h.digest()
+
+def scan_sizes(root, skip_folders=SKIP_FOLDERS, exts=IMAGE_EXTS):
+    """size -> [paths] for every matching file under root (one scandir pass)"""
+    by_size = {}
+    stack = [str(root)]
+    while stack:
+        folder = stack.pop()
+        try:
+            with os.scandir(folder) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        # _-prefixed folders are generated output (_PERFECT_..., _contact_sheets)
+                        if entry.name not in skip_folders and not entry.name.startswith("_"):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        if exts and os.path.splitext(entry.name)[1].lower() not in exts:
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size
+                        if size:
+                            by_size.setdefault(size, []).append(entry.path)
+        except OSError:
+            continue
+    return by_size
+
+def _refine(groups, key_fn, workers):
+    """Split each group by key_fn(path) (run on a thread pool); keep groups of 2+"""
+    paths = [p for g in groups for p in g]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        keys = dict(zip(paths, pool.map(key_fn, paths)))
+    refined = []
+    for g in groups:
+        split = {}
+        for p in g:
+            if keys[p] is not None:
+                split.setdefault(keys[p], []).append(p)
+        refined.extend(s for s in split.values() if len(s) > 1)
+    return refined
+
+def find_duplicates(root, workers=HASH_WORKERS, skip_folders=SKIP_FOLDERS, exts=IMAGE_EXTS):
+    """Groups of byte-identical files under root, keeper first
+
+    Returns (groups, stats) where stats counts the work done by each pass.
+    """
+    root = Path(root).resolve()
+    t0 = time.perf_counter()
+    by_size = scan_sizes(root, skip_folders, exts)
+    stats = {"files": sum(len(v) for v in by_size.values())}
+    groups = [g for g in by_size.values() if len(g) > 1]
+    stats["same_size"] = sum(len(g) for g in groups)
+
+    groups = _refine(groups, lambda p: _hash_file(p, HEAD_BYTES), workers)
+    stats["same_head"] = sum(len(g) for g in groups)
+
+    # Files no bigger than the head were already hashed in full
+    small = [g for g in groups if os.path.getsize(g[0]) <= HEAD_BYTES]
+    large = [g for g in groups if os.path.getsize(g[0]) > HEAD_BYTES]
+    stats["full_hashed"] = sum(len(g) for g in large)
+    groups = small + _refine(large, _hash_file, workers)
+
+    def rel_key(p):
+        rel = os.path.relpath(p, root)
+        return len(rel), rel
+    groups = sorted((sorted(g, key=rel_key) for g in groups), key=lambda g: rel_key(g[0]))
+    stats["groups"] = len(groups)
+    stats["copies"] = sum(len(g) - 1 for g in groups)
+    stats["wasted_bytes"] = sum(os.path.getsize(g[0]) * (len(g) - 1) for g in groups)
+    stats["seconds"] = time.perf_counter() - t0
+    return [[Path(p) for p in g] for g in groups], stats
+
+def write_groups(root, groups, stats=None):
+    """Save groups as exact_duplicates.json in root (paths stored relative)"""
+    root = Path(root).resolve()
+    doc = {
+        "format": DUPES_FORMAT,
+        "version": 1,
+        "root": str(root),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "groups": [[Path(p).relative_to(root).as_posix() for p in g] for g in groups],
+    }
+    if stats:
+        doc["stats"] = {k: v for k, v in stats.items() if k != "seconds"}
+    out_path = root / DUPES_FILENAME
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(doc, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def _read_groups(path):
+    """Relative groups from one exact_duplicates.json (None if absent/unreadable)"""
+    if not path.exists():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️  Could not read {path}, ignoring it")
+        return None
+    return doc["groups"] if doc.get("format") == DUPES_FORMAT else None
+
+def load_groups(root):
+    """Groups from root/exact_duplicates.json as absolute Paths ([] if there is none)
+
+    A thumbnails tree without its own file gets the originals' groups (from
+    its parent folder) translated to thumbnail paths.
+    """
+    root = Path(root).resolve()
+    groups = _read_groups(root / DUPES_FILENAME)
+    if groups is not None:
+        return [[root / rel for rel in g] for g in groups]
+    if root.name != THUMBS_FOLDER:
+        return []
+    translated = []
+    for g in _read_groups(root.parent / DUPES_FILENAME) or ():
+        # a.png and a.jpg share one thumbnail; never list the keeper's as a copy
+        keeper = (root / g[0]).with_suffix(".jpg")
+        thumbs = ((root / rel).with_suffix(".jpg") for rel in g[1:])
+        copies = list(dict.fromkeys(t for t in thumbs if t != keeper))
+        if copies:
+            translated.append([keeper] + copies)
+    return translated
+
+def redundant_paths(root):
+    """Set of str paths that are copies of a keeper (safe to skip)"""
+    return {str(p) for g in load_groups(root) for p in g[1:]}
+
+def load_copies(root):
+    """keeper str path -> [copy Paths]"""
+    return {str(g[0]): g[1:] for g in load_groups(root)}
+
+def add_copies(file_lists, copies_of):
+    """Append each keeper's copies to the same list as the keeper (in place)
+
+    Copies already present in any list keep their own assignment.
+    Returns the number of files added.
+    """
+    seen = {str(f) for files in file_lists for f in files}
+    added = 0
+    for files in file_lists:
+        extra = []
+        for f in files:
+            for copy in copies_of.get(str(f), ()):
+                if str(copy) not in seen:
+                    seen.add(str(copy))
+                    extra.append(copy)
+        files.extend(extra)
+        added += len(extra)
+    return added
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Find byte-identical files and save them as exact_duplicates.json"
+    )
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default=os.getcwd(),
+        help="Folder to scan (default: current directory)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=HASH_WORKERS,
+        help=f"Hashing threads (default: {HASH_WORKERS})"
+    )
+    parser.add_argument(
+        "--all-files",
+        action="store_true",
+        help="Check every file, not just images"
+    )
+
+    args = parser.parse_args()
+    root = Path(args.folder).resolve()
+    print(f"📂 Scanning: {root}")
+    groups, stats = find_duplicates(root, args.workers, exts=None if args.all_files else IMAGE_EXTS)
+
+    print(f"📸 {stats['files']:,} files · {stats['same_size']:,} share a size · "
+          f"{stats['same_head']:,} share the first {HEAD_BYTES // 1024} KB · "
+          f"{stats['full_hashed']:,} hashed in full")
+    print(f"⏱️  {stats['seconds']:.1f}s")
+    out_path = write_groups(root, groups, stats)  # Also clears a stale file
+    if not groups:
+        print("✅ No exact duplicates")
+        return
+
+    print(f"🔁 {stats['groups']:,} duplicate groups, {stats['copies']:,} redundant copies "
+          f"({stats['wasted_bytes'] / 1024 ** 2:,.1f} MB)")
+    for g in groups[:5]:
+        print(f"   • {g[0].relative_to(root)}  ×{len(g)}")
+    if len(groups) > 5:
+        print(f"   ... and {len(groups) - 5:,} more")
+    print(f"💾 Saved: {out_path}")
+
+if __name__ == "__main__":
+    main()
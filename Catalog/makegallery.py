@@ -2,13 +2,48 @@ import http.server
 import socketserver
 import os
 import json
+import argparse
 import urllib.parse
 
+from manifest import load_manifest
+
 # CONFIGURATION
 PORT = 8000
 DIRECTORY = os.getcwd()
+VIRTUAL = None      # gallery path -> source file, when serving a manifest-only collection
+STATIC_DIR = os.path.dirname(os.path.abspath(__file__))   # index.html and scripts
+
+def load_virtual(source):
+    """Gallery path -> source file for a manifest-only collection, else None"""
+    doc = load_manifest(source)
+    if not doc or doc.get('mode') != 'manifest':
+        return None
+    return {rel: src for rel, src in doc['items']}
 
 class MediaGalleryHandler(http.server.SimpleHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=DIRECTORY, **kwargs)
+
+    def translate_path(self, path):
+        # Virtual collection: the gallery path maps straight to the original
+        if VIRTUAL is not None:
+            rel = urllib.parse.unquote(path.split('?', 1)[0].split('#', 1)[0]).lstrip('/')
+            if rel in VIRTUAL:
+                return VIRTUAL[rel]
+        full = super().translate_path(path)
+        # No index.html/scripts in the served folder → use the ones next to this file
+        rel = os.path.relpath(full, DIRECTORY)
+        fallback = os.path.join(STATIC_DIR, rel)
+        if rel.startswith('..'):
+            return full
+        if os.path.isdir(full):
+            if not os.path.exists(os.path.join(full, 'index.html')) and \
+                    os.path.isfile(os.path.join(fallback, 'index.html')):
+                return fallback
+        elif not os.path.exists(full) and os.path.isfile(fallback):
+            return fallback
+        return full
+
     def do_POST(self):
         path = urllib.parse.unquote(self.path)
         
@@ -83,6 +118,19 @@ class MediaGalleryHandler(http.server.SimpleHTTPRequestHandler):
             video_exts = {'.mp4', '.webm', '.mov', '.mkv'}
             all_exts = valid_exts.union(video_exts)
             
+            # Manifest-only collection: list its entries, nothing to walk
+            if VIRTUAL is not None:
+                for rel_path in VIRTUAL:
+                    ext = os.path.splitext(rel_path)[1].lower()
+                    if ext in all_exts:
+                        file_list.append({
+                            'path': rel_path,
+                            'name': rel_path.rsplit('/', 1)[-1],
+                            'isVideo': ext in video_exts
+                        })
+                self.wfile.write(json.dumps(file_list).encode())
+                return
+            
             # Walk through all folders
             for root, dirs, files in os.walk(DIRECTORY):
                 for f in files:
@@ -115,7 +163,18 @@ class MediaGalleryHandler(http.server.SimpleHTTPRequestHandler):
         
       
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a folder (or a manifest collection) as a gallery")
+    parser.add_argument("source", nargs="?", default=DIRECTORY,
+                        help="Folder, or manifest.json of a virtual collection (default: current directory)")
+    args = parser.parse_args()
+    DIRECTORY = os.path.abspath(args.source)
+    VIRTUAL = load_virtual(DIRECTORY)
+    if os.path.isfile(DIRECTORY):
+        DIRECTORY = os.path.dirname(DIRECTORY)
+
     print(f"Starting Gallery Server...")
+    if VIRTUAL is not None:
+        print(f"Serving manifest collection: {len(VIRTUAL):,} files (no copies on disk)")
     print(f"Scanning Root: {DIRECTORY}")
     print(f"Open your browser to: http://localhost:{PORT}")
     
@@ -0,0 +1,249 @@
+"""
+manifest.py — Output collections that don't have to duplicate the originals
+
+The Grok scripts used to copy every selected full-res original into each of
+their output folders, so one image could end up stored three or four times.
+An OutputCollection places files according to a mode:
+  • copy      shutil.copy2, as before
+  • hardlink  os.link (same volume, no extra space); copies when linking fails
+  • symlink   os.symlink; copies when not permitted (Windows without rights)
+  • manifest  nothing is written but the manifest — a virtual folder
+
+Every mode writes <folder>/manifest.json listing what the run selected:
+    {"format": "owngallery-manifest", "version": 1, "mode": "manifest",
+     "root": ..., "items": [["Artist/a.jpg", "D:/Anime/Artist/a.jpg"], ...]}
+Each item is [path inside the collection, source file]. makegallery.py serves
+a manifest folder as if the files were there, and iter_files() lets the next
+script read a collection the same way in any mode.
+
+Usage:
+    python manifest.py /path/to/collection --materialize hardlink
+"""
+
+import os
+import json
+import time
+import shutil
+import argparse
+import threading
+from pathlib import Path
+
+from dest_names import DestinationNamer, discard
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_FORMAT = "owngallery-manifest"
+OUTPUT_MODES = ("copy", "hardlink", "symlink", "manifest")
+
+def _place(src, dest, mode):
+    """Put src at dest per mode (dest may be a placeholder); returns the mode used"""
+    if mode in ("hardlink", "symlink"):
+        tmp = dest.with_name(f".{dest.name}.link")
+        try:
+            if mode == "hardlink":
+                os.link(src, tmp)
+            else:
+                os.symlink(os.path.abspath(src), tmp)
+            os.replace(tmp, dest)
+            return mode
+        except OSError:
+            # Other volume / no symlink privilege / FS without links
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+    shutil.copy2(src, dest)
+    return "copy"
+
+def _same_source(src, dest):
+    """True if dest is src placed by _place(): a link to it, or a copy2 of it"""
+    try:
+        if os.path.samefile(src, dest):
+            return True
+        a, b = os.stat(src), os.stat(dest)
+    except OSError:
+        return False
+    return a.st_size == b.st_size and abs(a.st_mtime - b.st_mtime) < 1
+
+class OutputCollection:
+    """One output folder, filled per mode and listed in its manifest.json
+
+    add() may be called from several threads; files are placed in parallel.
+    """
+
+    def __init__(self, root, mode="copy"):
+        if mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {mode} (expected one of {', '.join(OUTPUT_MODES)})")
+        self.root = Path(root)
+        self.mode = mode
+        self.items = []       # [collection-relative posix path, source path]
+        self.counts = {m: 0 for m in OUTPUT_MODES + ("kept", "removed")}
+        self._namer = DestinationNamer(scan=mode != "manifest")
+        self._index = {}      # relative path -> position in items
+        self._lock = threading.Lock()
+        previous = load_manifest(self.root)
+        # Files the last run placed on disk; prune() removes those not placed again
+        self._previous = [rel for rel, _ in previous["items"]] \
+            if previous and previous.get("mode") != "manifest" else []
+
+    def add(self, src, subfolder="", unique=False, name=None, keep_existing=False):
+        """Place src in the collection (under subfolder) and return its path there
+
+        unique=True picks a free name (image_1.jpg ...) instead of replacing a
+        file with the same name, like DestinationNamer.claim(). name defaults
+        to the source file name. keep_existing=True keeps a file already at
+        the destination when it is src placed by an earlier run (a link to it
+        or a copy with the same size and mtime) and only lists it.
+        Raises OSError if the file can't be placed; a name claimed for it
+        is released on disk.
+        """
+        folder = self.root / subfolder if subfolder else self.root
+        name = name or Path(src).name
+        if not unique:
+            self._namer.reserve(folder, name)
+        if self.mode == "manifest":
+            dest = self._namer.propose(folder, name) if unique else folder / name
+            placed = "manifest"
+        else:
+            folder.mkdir(parents=True, exist_ok=True)
+            dest = self._namer.claim(folder, name) if unique else folder / name
+            if keep_existing and not unique and _same_source(src, dest):
+                placed = "kept"   # Summary: "N kept" = already there from an earlier run
+            else:
+                try:
+                    placed = _place(src, dest, self.mode)
+                except OSError:
+                    if unique:
+                        discard(dest)  # Empty placeholder from claim()
+                    raise
+
+        rel = dest.relative_to(self.root).as_posix()
+        entry = [rel, os.path.abspath(src)]
+        with self._lock:
+            self.counts[placed] += 1
+            if rel in self._index:
+                self.items[self._index[rel]] = entry  # Replaced, same as overwriting the file
+            else:
+                self._index[rel] = len(self.items)
+                self.items.append(entry)
+        return dest
+
+    def prune(self):
+        """Delete files the last run placed that this run did not; returns how many
+
+        Only call once every add() is done. Emptied subfolders are removed too.
+        """
+        current = set(self._index)
+        removed = 0
+        for rel in self._previous:
+            if rel in current:
+                continue
+            path = self.root / rel
+            try:
+                os.unlink(path)
+            except OSError:
+                continue  # Already gone
+            removed += 1
+            try:
+                os.rmdir(path.parent)
+            except OSError:
+                pass      # Still holds files (or is the root)
+        self._previous = []
+        self.counts["removed"] += removed
+        return removed
+
+    def save(self):
+        """Write manifest.json into the collection folder"""
+        self.root.mkdir(parents=True, exist_ok=True)
+        doc = {
+            "format": MANIFEST_FORMAT,
+            "version": 1,
+            "mode": self.mode,
+            "root": str(self.root.resolve()),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "items": self.items,
+        }
+        out_path = self.root / MANIFEST_FILENAME
+        tmp_path = out_path.with_name(out_path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(doc, f, ensure_ascii=False, indent=0)
+        os.replace(tmp_path, out_path)
+        return out_path
+
+    def summary(self):
+        if self.mode == "manifest":
+            return f"{self.counts['manifest']:,} listed in {MANIFEST_FILENAME} (nothing copied)"
+        done = ", ".join(f"{n:,} {m}" for m, n in self.counts.items() if n)
+        return done or "nothing placed"
+
+def load_manifest(path):
+    """Manifest document from a manifest file or a folder holding one (None if absent)"""
+    path = Path(path)
+    if path.is_dir():
+        path = path / MANIFEST_FILENAME
+    if not path.is_file():
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            doc = json.load(f)
+    except (OSError, ValueError):
+        print(f"⚠️  Could not read {path}, ignoring it")
+        return None
+    return doc if doc.get("format") == MANIFEST_FORMAT else None
+
+def is_virtual(folder):
+    """True if folder is a manifest-only collection"""
+    doc = load_manifest(folder)
+    return bool(doc) and doc.get("mode") == "manifest"
+
+def iter_files(folder):
+    """Yield (relative Path, file Path) for every file of a collection
+
+    A manifest-only folder yields its manifest items (relative path inside the
+    collection, source file); any other folder is walked on disk.
+    """
+    folder = Path(folder)
+    doc = load_manifest(folder)
+    if doc and doc.get("mode") == "manifest":
+        for rel, src in doc["items"]:
+            yield Path(rel), Path(src)
+        return
+    for p in folder.rglob("*"):
+        if p.is_file() and p.name != MANIFEST_FILENAME:
+            yield p.relative_to(folder), p
+
+def materialize(folder, mode="hardlink"):
+    """Turn a manifest-only collection into real files (copies or links)"""
+    folder = Path(folder)
+    doc = load_manifest(folder)
+    if not doc or doc.get("mode") != "manifest":
+        raise ValueError(f"{folder} is not a manifest-only collection")
+    collection = OutputCollection(folder, mode)
+    missing = 0
+    for rel, src in doc["items"]:
+        rel = Path(rel)
+        if not os.path.exists(src):
+            missing += 1
+            continue
+        collection.add(src, rel.parent.as_posix(), name=rel.name)
+    collection.save()
+    return collection, missing
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Materialize a manifest-only output collection as real files"
+    )
+    parser.add_argument("folder", help="Collection folder (holds manifest.json)")
+    parser.add_argument(
+        "--materialize",
+        choices=["copy", "hardlink", "symlink"],
+        default="hardlink",
+        help="How to create the files (default: hardlink, copies across volumes)"
+    )
+    args = parser.parse_args()
+    collection, missing = materialize(args.folder, args.materialize)
+    print(f"✅ {collection.summary()}")
+    if missing:
+        print(f"⚠️  {missing:,} source files no longer exist")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+"""
+move_engine.py — Parallel bulk move engine shared by the movers
+
+Operations are grouped by (source device, destination device):
+  • same filesystem  → atomic renames on a thread pool (metadata only)
+  • cross-device     → bounded pipeline of copy → verify → unlink on a
+                       smaller thread pool, so at most a few files are in
+                       flight and a failed copy never loses the source
+
+Every destination is claimed with an exclusive create before anything is
+written, so a name that appears mid-run is never overwritten.
+"""
+
+import os
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+RENAME_WORKERS = 16
+COPY_WORKERS = 4
+PROGRESS_EVERY = 5000
+
+def _claim(dest):
+    """Exclusively create dest as a placeholder; False if the name is taken"""
+    try:
+        fd = os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+def _release(dest):
+    try:
+        os.unlink(dest)
+    except OSError:
+        pass
+
+def _file_digest(path, chunk=1 << 20):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(chunk)
+            if not block:
+                break
+            h.update(block)
+    return h.digest()
+
+def _rename(op):
+    src, dest, size = op
+    if not _claim(dest):
+        return src, dest, False, "Destination already exists", 0
+    try:
+        os.replace(src, dest)  # Replaces only our own placeholder
+        return src, dest, True, "Moved", size
+    except Exception as e:
+        _release(dest)
+        return src, dest, False, f"Error: {e}", 0
+
+def _copy_verify_unlink(op, verify_hash=False):
+    src, dest, size = op
+    if not _claim(dest):
+        return src, dest, False, "Destination already exists", 0
+    try:
+        shutil.copy2(src, dest)
+        if os.path.getsize(dest) != size:
+            raise OSError("size mismatch after copy")
+        if verify_hash and _file_digest(src) != _file_digest(dest):
+            raise OSError("checksum mismatch after copy")
+    except Exception as e:
+        _release(dest)
+        return src, dest, False, f"Copy failed: {e}", 0
+    try:
+        os.unlink(src)
+    except OSError as e:
+        return src, dest, False, f"Copied but source not removed: {e}", size
+    return src, dest, True, "Moved (copied across devices)", size
+
+def _run_bounded(executor, fn, items, limit):
+    """Submit items with at most `limit` in flight, yielding results as they finish"""
+    pending = set()
+    for item in items:
+        if len(pending) >= limit:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield fut.result()
+        pending.add(executor.submit(fn, item))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            yield fut.result()
+
+class MoveStats:
+    """Counters for a bulk move run"""
+
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.renamed = 0
+        self.copied = 0
+        self.failed = 0
+        self.seconds = 0.0
+
+    def files_per_sec(self):
+        return self.files / self.seconds if self.seconds > 0 else 0.0
+
+    def mb_per_sec(self):
+        return self.bytes / 1024 ** 2 / self.seconds if self.seconds > 0 else 0.0
+
+    def summary(self):
+        return (f"{self.files:,} files, {self.bytes / 1024 ** 2:,.1f} MB in {self.seconds:.1f}s → "
+                f"{self.files_per_sec():,.0f} files/sec, {self.mb_per_sec():,.1f} MB/sec "
+                f"({self.renamed:,} renamed, {self.copied:,} copied across devices)")
+
+def group_by_device(moves):
+    """Split (src, dest) pairs into same-device and cross-device (src, dest, size) ops
+
+    Returns (same_device, cross_device, errors) where errors are result tuples
+    for sources that could not be stat'ed.
+    """
+    dest_dev = {}
+    same, cross, errors = [], [], []
+    for src, dest in moves:
+        try:
+            st = os.stat(src)
+        except OSError as e:
+            errors.append((str(src), str(dest), False, f"Source doesn't exist: {e.strerror}", 0))
+            continue
+        folder = os.path.dirname(dest)
+        dev = dest_dev.get(folder)
+        if dev is None:
+            dev = dest_dev[folder] = os.stat(folder).st_dev
+        (same if st.st_dev == dev else cross).append((str(src), str(dest), st.st_size))
+    return same, cross, errors
+
+def execute_moves(moves, rename_workers=RENAME_WORKERS, copy_workers=COPY_WORKERS,
+                  verify_hash=False, on_result=None):
+    """Move (src, dest) pairs to their final destinations in parallel
+
+    Destination folders must already exist. Returns (results, stats) where each
+    result is (src, dest, ok, message, bytes). on_result, if given, is called
+    with each result as it completes (from the calling thread).
+    """
+    stats = MoveStats()
+    start = time.perf_counter()
+    same, cross, results = group_by_device(moves)
+    stats.failed += len(results)
+    total = len(same) + len(cross)
+
+    def record(result, kind):
+        results.append(result)
+        if result[2]:
+            stats.files += 1
+            stats.bytes += result[4]
+            setattr(stats, kind, getattr(stats, kind) + 1)
+        else:
+            stats.failed += 1
+        if on_result:
+            on_result(result)
+        done = stats.files + stats.failed
+        if done % PROGRESS_EVERY == 0:
+            stats.seconds = time.perf_counter() - start
+            print(f"   📦 {done:,}/{total:,} · {stats.files_per_sec():,.0f} files/sec · "
+                  f"{stats.mb_per_sec():,.1f} MB/sec")
+
+    if same:
+        with ThreadPoolExecutor(max_workers=rename_workers) as pool:
+            for result in _run_bounded(pool, _rename, same, rename_workers * 4):
+                record(result, "renamed")
+
+    if cross:
+        copy = lambda op: _copy_verify_unlink(op, verify_hash)
+        with ThreadPoolExecutor(max_workers=copy_workers) as pool:
+            for result in _run_bounded(pool, copy, cross, copy_workers * 2):
+                record(result, "copied")
+
+    stats.seconds = time.perf_counter() - start
+    return results, stats
+
+def plan_destination(src, dest_folder, namer):
+    """Pick a free destination name for src in dest_folder (duplicate handling)
+
+    `namer` is a dest_names.DestinationNamer shared by the whole run, so names
+    already handed out count as taken and each lookup is O(1).
+    Returns (dest_path, None) or (None, reason).
+    """
+    src = Path(src)
+    dest_folder = Path(dest_folder)
+
+    if src.parent == dest_folder:
+        return None, "Already in target folder"
+
+    # One stat, and only when the plain name collides
+    if namer.is_taken(dest_folder, src.name):
+        try:
+            if src.samefile(dest_folder / src.name):
+                return None, "Same file already exists"
+        except OSError:
+            pass
+
+    return namer.propose(dest_folder, src.name), None
@@ -0,0 +1,335 @@
+"""
+move_journal.py — Append-only journal for resumable (and undoable) bulk moves
+
+The full plan is written before the first file moves:
+    {"journal": "owngallery-moves", "version": 1, "root": ..., "count": N}
+    ["P", 0, "/src/a.jpg", "/root/Keep/a.jpg"]      planned move <id> <src> <dest>
+    ...
+A dry run writes the same file as a reusable plan ("plan": true in the header)
+with each source's fingerprint appended to its P line: <size> <mtime_ns>.
+Status lines are appended in batches while the engine runs:
+    ["D", [0, 1, 2, ...]]                            done
+    ["F", [[3, "Destination already exists"], ...]]  failed
+    ["U", [0, 1, ...]]                               undone (moved back)
+    ["UF", [[4, "Destination already exists"], ...]] undo failed (entry stays done)
+
+A rerun continues from the plan without re-resolving any paths, and --undo
+replays the done entries in reverse through the same parallel engine.
+
+A crash can leave a torn last line. Unreadable lines are skipped on load, and
+a torn tail is cut back to the last newline before anything is appended, so
+new status lines never run into it.
+
+    python move_journal.py --selftest   # tear a line, resume, reload, undo
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import move_engine
+
+JOURNAL_NAME = ".move_journal.jsonl"
+PLAN_NAME = "move_plan.jsonl"
+JOURNAL_FORMAT = "owngallery-moves"
+MARK_BATCH = 1000          # results per appended status line
+MARK_INTERVAL = 2.0        # ...or seconds, whichever comes first
+
+def _dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+class MoveJournal:
+    """A move plan plus the status of each entry"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.header = {}
+        self.entries = []   # id -> (src, dest)
+        self.fingerprints = []  # id -> (size, mtime_ns), plans only
+        self.status = {}    # id -> "D" | "F" | "U"
+
+    @classmethod
+    def create(cls, path, moves, root, extra=None, fingerprints=None, keep_previous=True):
+        """Write the full plan for (src, dest) pairs before anything moves"""
+        journal = cls(path)
+        journal.header = {
+            "journal": JOURNAL_FORMAT,
+            "version": 1,
+            "root": str(root),
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "count": len(moves),
+        }
+        journal.header.update(extra or {})
+        journal.entries = [(str(src), str(dest)) for src, dest in moves]
+        journal.fingerprints = list(fingerprints or [])
+
+        if keep_previous and journal.path.exists():
+            journal.archive()  # Keep the previous run's journal for reference
+        tmp_path = journal.path.with_name(journal.path.name + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(_dumps(journal.header) + "\n")
+            for i, (src, dest) in enumerate(journal.entries):
+                fp = list(journal.fingerprints[i]) if journal.fingerprints else []
+                f.write(_dumps(["P", i, src, dest] + fp) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, journal.path)
+        return journal
+
+    @classmethod
+    def load(cls, path):
+        """Read a journal; unreadable lines (a crash mid-write) are skipped"""
+        journal = cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            journal.header = json.loads(f.readline())
+            if journal.header.get("journal") != JOURNAL_FORMAT:
+                raise ValueError(f"Not a move journal: {path}")
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue
+                tag = row[0]
+                if tag == "P":
+                    journal.entries.append((row[2], row[3]))
+                    if len(row) > 4:
+                        journal.fingerprints.append((row[4], row[5]))
+                elif tag == "F":
+                    for i, _ in row[1]:
+                        journal.status[i] = "F"
+                elif tag == "UF":
+                    continue  # Still done; can be undone again later
+                else:
+                    for i in row[1]:
+                        journal.status[i] = tag
+        return journal
+
+    def pending(self):
+        """Entries with no recorded outcome yet"""
+        return [i for i in range(len(self.entries)) if i not in self.status]
+
+    def undoable(self):
+        """Done entries, most recent plan order last"""
+        return [i for i in range(len(self.entries)) if self.status.get(i) == "D"]
+
+    def is_complete(self):
+        return not self.pending()
+
+    def archive(self):
+        """Rename the journal out of the way, keeping it for reference"""
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.path.stat().st_mtime))
+        target = self.path.with_name(f"{self.path.stem}-{stamp}.jsonl")
+        os.replace(self.path, target)
+        return target
+
+def _cut_torn_tail(path, chunk=1 << 16):
+    """Truncate path back to its last newline if a crash left a partial line"""
+    with open(path, "r+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk)
+            f.seek(start)
+            block = f.read(pos - start)
+            nl = block.rfind(b"\n")
+            if nl >= 0:
+                pos = start + nl + 1
+                break
+            pos = start
+        if pos < end:
+            f.truncate(pos)
+
+class _BatchMarker:
+    """on_result callback that appends status lines in batches"""
+
+    def __init__(self, journal, id_by_dest, ok_tag, fail_tag="F"):
+        self.journal = journal
+        self.id_by_dest = id_by_dest
+        self.ok_tag = ok_tag
+        self.fail_tag = fail_tag
+        self.ok = []
+        self.failed = []
+        self.last_flush = time.monotonic()
+        _cut_torn_tail(journal.path)
+        self.f = open(journal.path, "a", encoding="utf-8")
+
+    def __call__(self, result):
+        src, dest, ok, msg, _ = result
+        i = self.id_by_dest[dest]
+        if ok:
+            self.ok.append(i)
+        else:
+            self.failed.append([i, msg])
+        if len(self.ok) + len(self.failed) >= MARK_BATCH or \
+                time.monotonic() - self.last_flush >= MARK_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self.ok:
+            self.f.write(_dumps([self.ok_tag, self.ok]) + "\n")
+            self.journal.status.update(dict.fromkeys(self.ok, self.ok_tag))
+        if self.failed:
+            self.f.write(_dumps([self.fail_tag, self.failed]) + "\n")
+            if self.fail_tag == "F":
+                self.journal.status.update((i, "F") for i, _ in self.failed)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.ok, self.failed = [], []
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+def _settle_interrupted(journal, ids):
+    """Sort out entries a crash left half-done; return ids that still need moving"""
+    todo, already = [], []
+    for i in ids:
+        src, dest = journal.entries[i]
+        src_exists = os.path.exists(src)
+        if not src_exists and os.path.exists(dest):
+            already.append(i)  # Moved, but the batch mark never hit the disk
+            continue
+        if src_exists and os.path.exists(dest) and os.path.getsize(dest) != os.path.getsize(src):
+            os.unlink(dest)    # Placeholder or partial copy from an interrupted move
+        todo.append(i)
+    if already:
+        marker = _BatchMarker(journal, {}, "D")
+        marker.ok = already
+        marker.close()
+    return todo, len(already)
+
+def run(journal, workers=move_engine.RENAME_WORKERS, copy_workers=move_engine.COPY_WORKERS,
+        verify_hash=False, resumed=False):
+    """Execute every pending entry, marking outcomes in batches"""
+    ids = journal.pending()
+    if resumed:
+        ids, recovered = _settle_interrupted(journal, ids)
+        if recovered:
+            print(f"♻️  {recovered:,} moves had completed before the interruption")
+
+    for folder in {os.path.dirname(journal.entries[i][1]) for i in ids}:
+        os.makedirs(folder, exist_ok=True)
+
+    marker = _BatchMarker(journal, {journal.entries[i][1]: i for i in ids}, "D")
+    try:
+        return move_engine.execute_moves(
+            [journal.entries[i] for i in ids], workers, copy_workers, verify_hash, on_result=marker
+        )
+    finally:
+        marker.close()
+
+def undo(journal, workers=move_engine.RENAME_WORKERS, copy_workers=move_engine.COPY_WORKERS,
+         verify_hash=False):
+    """Move every done entry back to its source, in reverse plan order"""
+    ids = journal.undoable()[::-1]
+    for folder in {os.path.dirname(journal.entries[i][0]) for i in ids}:
+        os.makedirs(folder, exist_ok=True)
+
+    # Undo moves dest → src, so results are keyed by the original source
+    marker = _BatchMarker(journal, {journal.entries[i][0]: i for i in ids}, "U", "UF")
+    try:
+        return move_engine.execute_moves(
+            [journal.entries[i][::-1] for i in ids], workers, copy_workers, verify_hash,
+            on_result=marker
+        )
+    finally:
+        marker.close()
+
+def _fingerprint(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+def write_plan(plan_path, moves, root, workers=move_engine.RENAME_WORKERS):
+    """Fingerprint sources and save (src, dest) pairs as a reusable plan
+
+    Returns (plan, missing) where missing lists sources that could not be stat'ed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        fps = list(pool.map(_fingerprint, [src for src, _ in moves]))
+    kept = [(m, fp) for m, fp in zip(moves, fps) if fp]
+    missing = [str(src) for (src, _), fp in zip(moves, fps) if not fp]
+    plan = MoveJournal.create(
+        plan_path, [m for m, _ in kept], root, extra={"plan": True},
+        fingerprints=[fp for _, fp in kept], keep_previous=False
+    )
+    return plan, missing
+
+def verify_plan(plan, workers=move_engine.RENAME_WORKERS):
+    """Re-check each planned source; return (unchanged moves, [(src, reason)])"""
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        current = list(pool.map(_fingerprint, [src for src, _ in plan.entries]))
+    moves, changed = [], []
+    for (src, dest), planned, now in zip(plan.entries, plan.fingerprints, current):
+        if now is None:
+            changed.append((src, "Source no longer exists"))
+        elif tuple(now) != tuple(planned):
+            changed.append((src, "Source changed since the plan was made"))
+        else:
+            moves.append((src, dest))
+    return moves, changed
+
+def print_summary(title, results, stats):
+    """Summary block for a resumed or undone run"""
+    failures = [r for r in results if not r[2]]
+    print("\n" + "=" * 60)
+    print(title)
+    print("=" * 60)
+    print(f"✅ {stats.files:,} files moved")
+    print(f"⚡ {stats.summary()}")
+    if failures:
+        print(f"\n⚠️  Errors/Skipped: {len(failures)}")
+        for src, _, _, msg, _ in failures[:10]:
+            print(f"   • {Path(src).name}: {msg}")
+        if len(failures) > 10:
+            print(f"   ... and {len(failures) - 10} more")
+    print("=" * 60)
+
+def selftest():
+    """Crash after five moves with a torn line and a partial copy; resume, reload, undo"""
+    import tempfile
+    tmp = Path(tempfile.mkdtemp(prefix="journal_"))
+    (tmp / "src").mkdir()
+    moves = []
+    for i in range(10):
+        src = tmp / "src" / f"{i}.jpg"
+        src.write_bytes(b"x" * (i + 1))
+        moves.append((src, tmp / "Keep" / f"{i}.jpg"))
+    journal = MoveJournal.create(tmp / JOURNAL_NAME, moves, tmp)
+    (tmp / "Keep").mkdir()
+    for src, dest in moves[:5]:
+        os.rename(src, dest)
+    with open(journal.path, "a", encoding="utf-8") as f:
+        f.write(_dumps(["D", [0, 1, 2, 3, 4]]) + "\n")
+        f.write('["D",[5,')  # Crash mid-write
+    moves[5][1].write_bytes(b"x" * 2)  # Interrupted cross-device copy of a 6-byte file
+
+    resumed = MoveJournal.load(journal.path)
+    pending_ok = resumed.pending() == list(range(5, 10))
+    run(resumed, resumed=True)
+    reloaded = MoveJournal.load(journal.path)
+    done_ok = reloaded.undoable() == list(range(10))
+    undo(reloaded)
+    back_ok = all(os.path.exists(src) and not os.path.exists(dest) for src, dest in moves) \
+        and moves[5][0].stat().st_size == 6 \
+        and not MoveJournal.load(journal.path).undoable()
+    for name, ok in (("torn line: resume sees 5-9 pending", pending_ok),
+                     ("partial copy redone; resume survives reload", done_ok),
+                     ("undo moves all 10 back", back_ok)):
+        print(f"{name:<44} {'PASS' if ok else 'FAIL'}")
+    return pending_ok and done_ok and back_ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move journal helpers")
+    parser.add_argument("--selftest", action="store_true", help="Tear a line and a copy, resume, reload and undo")
+    args = parser.parse_args()
+    if args.selftest:
+        sys.exit(0 if selftest() else 1)
+    parser.print_help()
@@ -0,0 +1,299 @@
+"""
+score_stats.py — Score distribution statistics for image_scores.json
+
+Two modes:
+  exact   Vectorized NumPy over the loaded scores (percentiles, histograms,
+          per-folder means, real/cgi/neg correlation).
+  stream  Parses image_scores.json incrementally in chunks and folds each chunk
+          into a fixed-bin histogram sketch plus running co-moments, so memory
+          stays bounded no matter how big the score store is. Percentiles are
+          accurate to one sketch bin (0.001).
+
+Results are cached next to the database and reused while the snapshot
+(size + mtime) is unchanged.
+
+Usage:
+    python score_stats.py /path/to/thumbnails
+    python score_stats.py /path/to/thumbnails --stream
+"""
+
+import os
+import re
+import sys
+import json
+import itertools
+from pathlib import Path
+import argparse
+
+SCORE_KEYS = ("real", "cgi", "neg")
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+DISPLAY_BINS = 20
+SKETCH_BINS = 2000
+SKETCH_RANGE = (-1.0, 1.0)            # CLIP cosine similarities
+STREAM_CHUNK = 100_000                # entries folded per NumPy batch
+STREAM_AUTO_BYTES = 512 * 1024 ** 2   # auto-switch to stream mode above this size
+CACHE_SUFFIX = ".stats.json"
+
+_SKIP = re.compile(r"[\s,:]*")
+
+def iter_score_file(db_path, chunk_size=1 << 20):
+    """Yield (path, scores) from image_scores.json without loading it whole"""
+    decoder = json.JSONDecoder()
+    with open(db_path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size)
+        pos = buf.index("{") + 1
+        eof = False
+        while True:
+            pos = _SKIP.match(buf, pos).end()
+            if pos >= len(buf) - 1 and not eof:
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            if pos >= len(buf) or buf[pos] == "}":
+                return
+            try:
+                # Every value is an object, so a chunk boundary always raises here
+                key, end = decoder.raw_decode(buf, pos)
+                end = _SKIP.match(buf, end).end()
+                value, end = decoder.raw_decode(buf, end)
+            except ValueError:
+                if eof:
+                    raise
+                more = f.read(chunk_size)
+                eof = not more
+                buf, pos = buf[pos:] + more, 0
+                continue
+            yield key, value
+            pos = end
+
+def _folder_of(path, root_prefix):
+    """Folder key: parent directory relative to the score root"""
+    parent = os.path.dirname(path)
+    if parent.startswith(root_prefix):
+        parent = parent[len(root_prefix):]
+    return parent.replace("\\", "/") or "."
+
+class ScoreSketch:
+    """Mergeable fixed-bin histogram and co-moment sketch of (real, cgi, neg)"""
+
+    def __init__(self):
+        import numpy as np
+        self.np = np
+        self.n = 0
+        self.hist = np.zeros((3, SKETCH_BINS), dtype=np.int64)
+        self.sums = np.zeros(3)
+        self.cross = np.zeros((3, 3))
+        self.mins = np.full(3, np.inf)
+        self.maxs = np.full(3, -np.inf)
+        self.folders = {}  # folder -> [count, real_sum, cgi_sum, neg_sum]
+
+    def update(self, values, folders):
+        """Fold an (m, 3) array of scores and their m folder keys into the sketch"""
+        np = self.np
+        if not len(values):
+            return
+        self.n += len(values)
+        self.sums += values.sum(axis=0)
+        self.cross += values.T @ values
+        self.mins = np.minimum(self.mins, values.min(axis=0))
+        self.maxs = np.maximum(self.maxs, values.max(axis=0))
+
+        lo, hi = SKETCH_RANGE
+        bins = ((values - lo) / (hi - lo) * SKETCH_BINS).astype(np.int64)
+        np.clip(bins, 0, SKETCH_BINS - 1, out=bins)
+        for k in range(3):
+            self.hist[k] += np.bincount(bins[:, k], minlength=SKETCH_BINS)
+
+        keys, inverse = np.unique(np.asarray(folders), return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        sums = np.stack([np.bincount(inverse, weights=values[:, k], minlength=len(keys))
+                         for k in range(3)], axis=1)
+        for key, c, s in zip(keys.tolist(), counts.tolist(), sums.tolist()):
+            acc = self.folders.setdefault(key, [0, 0.0, 0.0, 0.0])
+            acc[0] += c
+            acc[1] += s[0]
+            acc[2] += s[1]
+            acc[3] += s[2]
+
+    def summary(self):
+        """Return the same dict shape as exact_stats()"""
+        np = self.np
+        lo, hi = SKETCH_RANGE
+        width = (hi - lo) / SKETCH_BINS
+        centers = lo + (np.arange(SKETCH_BINS) + 0.5) * width
+
+        mean = self.sums / self.n
+        cov = (self.cross - self.n * np.outer(mean, mean)) / max(self.n - 1, 1)
+        std = np.sqrt(np.maximum(np.diag(cov), 0))
+        corr = cov / np.outer(std, std)
+
+        stats = _empty_stats(self.n, "stream")
+        for k, key in enumerate(SCORE_KEYS):
+            cdf = np.cumsum(self.hist[k])
+            ranks = np.array(PERCENTILES) / 100 * (self.n - 1)
+            idx = np.searchsorted(cdf, ranks, side="right")
+            counts, edges = np.histogram(centers, bins=DISPLAY_BINS,
+                                         range=(self.mins[k], self.maxs[k]), weights=self.hist[k])
+            stats["scores"][key] = _score_entry(
+                self.mins[k], self.maxs[k], mean[k], std[k], centers[idx], counts, edges
+            )
+        stats["correlation"] = corr.round(4).tolist()
+        stats["folders"] = {
+            f: {"count": c, "real": r / c, "cgi": g / c, "neg": q / c}
+            for f, (c, r, g, q) in self.folders.items()
+        }
+        return stats
+
+def _empty_stats(n, mode):
+    return {"mode": mode, "count": int(n), "percentiles": list(PERCENTILES),
+            "keys": list(SCORE_KEYS), "scores": {}, "correlation": None, "folders": {}}
+
+def _score_entry(lo, hi, mean, std, pcts, counts, edges):
+    return {
+        "min": float(lo), "max": float(hi), "mean": float(mean), "std": float(std),
+        "percentiles": [round(float(p), 4) for p in pcts],
+        "histogram": {"counts": [int(c) for c in counts], "edges": [round(float(e), 4) for e in edges]},
+    }
+
+def exact_stats(score_data, root):
+    """Vectorized statistics over an in-memory score dict"""
+    import numpy as np
+    n = len(score_data)
+    values = np.fromiter(
+        itertools.chain.from_iterable((s["real"], s["cgi"], s["neg"]) for s in score_data.values()),
+        dtype=np.float64, count=3 * n,
+    ).reshape(n, 3)
+
+    stats = _empty_stats(n, "exact")
+    if n == 0:
+        return stats
+    pcts = np.percentile(values, PERCENTILES, axis=0)
+    mean = values.mean(axis=0)
+    std = values.std(axis=0, ddof=1) if n > 1 else np.zeros(3)
+    for k, key in enumerate(SCORE_KEYS):
+        counts, edges = np.histogram(values[:, k], bins=DISPLAY_BINS)
+        stats["scores"][key] = _score_entry(
+            values[:, k].min(), values[:, k].max(), mean[k], std[k], pcts[:, k], counts, edges
+        )
+    stats["correlation"] = np.corrcoef(values, rowvar=False).round(4).tolist() if n > 1 else None
+
+    root_prefix = str(root).rstrip("\\/") + os.sep
+    folders = np.asarray([_folder_of(p, root_prefix) for p in score_data])
+    keys, inverse = np.unique(folders, return_inverse=True)
+    counts = np.bincount(inverse)
+    means = np.stack([np.bincount(inverse, weights=values[:, k]) for k in range(3)], axis=1) / counts[:, None]
+    stats["folders"] = {
+        f: {"count": int(c), "real": float(m[0]), "cgi": float(m[1]), "neg": float(m[2])}
+        for f, c, m in zip(keys.tolist(), counts, means)
+    }
+    return stats
+
+def stream_stats(db_path, root):
+    """Bounded-memory statistics straight from the score file"""
+    import numpy as np
+    sketch = ScoreSketch()
+    root_prefix = str(root).rstrip("\\/") + os.sep
+    items = iter_score_file(db_path)
+    while True:
+        chunk = list(itertools.islice(items, STREAM_CHUNK))
+        if not chunk:
+            break
+        values = np.array([(s["real"], s["cgi"], s["neg"]) for _, s in chunk], dtype=np.float64)
+        sketch.update(values, [_folder_of(p, root_prefix) for p, _ in chunk])
+    if sketch.n == 0:
+        return _empty_stats(0, "stream")
+    return sketch.summary()
+
+def compute_stats(target_dir, score_data=None, stream=None):
+    """Return statistics for target_dir/image_scores.json, cached per snapshot"""
+    target_dir = Path(target_dir).resolve()
+    db_path = target_dir / "image_scores.json"
+    st = db_path.stat()
+    if stream is None:
+        stream = score_data is None and st.st_size > STREAM_AUTO_BYTES
+    mode = "stream" if stream else "exact"
+    snapshot = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "mode": mode}
+
+    cache_path = db_path.with_name(db_path.name + CACHE_SUFFIX)
+    if cache_path.exists():
+        try:
+            with open(cache_path, "r") as f:
+                cached = json.load(f)
+            if cached.get("snapshot") == snapshot:
+                return cached["stats"]
+        except Exception:
+            pass  # Stale or corrupted cache → recompute
+
+    if stream:
+        stats = stream_stats(db_path, target_dir)
+    else:
+        if score_data is None:
+            with open(db_path, "r") as f:
+                score_data = json.load(f)
+        stats = exact_stats(score_data, target_dir)
+
+    try:
+        with open(cache_path, "w") as f:
+            json.dump({"snapshot": snapshot, "stats": stats}, f)
+    except OSError:
+        pass  # Read-only score folder: just don't cache
+    return stats
+
+def print_stats(stats, top_folders=10, bar_width=40):
+    """Pretty-print a statistics dict"""
+    print(f"Images: {stats['count']:,}   (mode: {stats['mode']})")
+    if not stats["count"]:
+        return
+    header = "  ".join(f"p{p:<4}" for p in stats["percentiles"])
+    print(f"\n{'':8} {'min':>6} {'mean':>6} {'std':>6} {'max':>6}   {header}")
+    for key in stats["keys"]:
+        s = stats["scores"][key]
+        pcts = "  ".join(f"{p:.3f}" for p in s["percentiles"])
+        print(f"{key:8} {s['min']:6.3f} {s['mean']:6.3f} {s['std']:6.3f} {s['max']:6.3f}   {pcts}")
+
+    for key in stats["keys"]:
+        hist = stats["scores"][key]["histogram"]
+        peak = max(hist["counts"]) or 1
+        print(f"\n{key} histogram:")
+        for c, lo in zip(hist["counts"], hist["edges"]):
+            print(f"  {lo:7.3f} | {'█' * round(c / peak * bar_width):<{bar_width}} {c:,}")
+
+    if stats["correlation"]:
+        print("\nCorrelation:")
+        print("        " + "".join(f"{k:>8}" for k in stats["keys"]))
+        for key, row in zip(stats["keys"], stats["correlation"]):
+            print(f"{key:8}" + "".join(f"{v:8.3f}" for v in row))
+
+    folders = sorted(stats["folders"].items(), key=lambda kv: -kv[1]["count"])
+    if folders:
+        print(f"\nPer-folder means (top {min(top_folders, len(folders))} of {len(folders):,} by size):")
+        print(f"  {'count':>8} {'real':>6} {'cgi':>6} {'neg':>6}  folder")
+        for name, f in folders[:top_folders]:
+            print(f"  {f['count']:8,} {f['real']:6.3f} {f['cgi']:6.3f} {f['neg']:6.3f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Score distribution statistics for image_scores.json"
+    )
+    parser.add_argument(
+        "folder",
+        nargs="?",
+        default=os.getcwd(),
+        help="Folder containing image_scores.json (default: current directory)"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Bounded-memory sketch mode (automatic above 512 MB)"
+    )
+    args = parser.parse_args()
+
+    db_path = Path(args.folder) / "image_scores.json"
+    if not db_path.exists():
+        print(f"❌ No score database found: {db_path}")
+        sys.exit(1)
+    print_stats(compute_stats(args.folder, stream=True if args.stream else None))
+
+if __name__ == "__main__":
+    main()